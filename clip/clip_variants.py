@@ -8,39 +8,29 @@
 # pip install git+https://github.com/huggingface/transformers
 
 # Model size: 898 MB
+# Models are loaded once per process through registry.py (backends are imported lazily);
+# set CLIP_PRELOAD="hf-hub:Marqo/marqo-fashionSigLIP" to load + warm up before the first image.
 
 import torch
 from PIL import Image
 
+from registry import get_model, preload_from_env, print_stats
+
 
 IMG_FILE = "./sample/test1.jpg"
 TXT_LIST = ["green", "blue", "gray", "red", "pink", "yellow", "black", "multicolor", "white"]
 
-MODEL = 'hf-hub:Marqo/marqo-fashionSigLIP' # 'jinaai/jina-clip-v2'
-
-device = "cuda" if torch.cuda.is_available() else "cpu"
-
-if MODEL == 'hf-hub:Marqo/marqo-fashionSigLIP':
-    import open_clip
-    model, preprocess_train, preprocess_val = open_clip.create_model_and_transforms(MODEL)
-    tokenizer = open_clip.get_tokenizer(MODEL)
-
-    # Process image and text
-    image = preprocess_val(Image.open(IMG_FILE)).unsqueeze(0)
-    text = tokenizer(TXT_LIST)
-    with torch.inference_mode(), torch.autocast(device, dtype=torch.bfloat16):
-        image_features = model.encode_image(image)
-        text_features = model.encode_text(text)
+MODEL = 'hf-hub:Marqo/marqo-fashionSigLIP' # 'jinaai/jina-clip-v2', 'onnx:onnx/siglip#int8'
 
-elif MODEL == 'jinaai/jina-clip-v2':
-    from transformers import AutoModel
-    model = AutoModel.from_pretrained(MODEL, trust_remote_code=True).to(device)
+preload_from_env()
+encoder = get_model(MODEL)
 
-    image = Image.open(IMG_FILE)
-    text = TXT_LIST
-    with torch.inference_mode(), torch.autocast(device, dtype=torch.bfloat16):
-        image_features = torch.tensor(model.encode_image(image))
-        text_features = torch.tensor(model.encode_text(text))
+# Process image and text
+image = Image.open(IMG_FILE)
+image = torch.stack([encoder.preprocess(image)]) if encoder.preprocess else [image]
+with torch.inference_mode(), torch.autocast(encoder.device, dtype=torch.bfloat16, enabled=encoder.device == "cuda"):
+    image_features = encoder.encode_image(image).float()
+    text_features = encoder.encode_text(TXT_LIST).float()
 
 print(f"{MODEL}")
 print(f"Image features: {image_features.shape}, Text features:, {text_features.shape}")
@@ -51,3 +41,4 @@ text_probs = (100.0 * image_features @ text_features.T).softmax(dim=-1)
 
 print("Label probs:", text_probs)
 # [0.9860219105287394, 0.00777916527489097, 0.006198924196369721]
+print_stats()
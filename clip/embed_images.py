@@ -0,0 +1,236 @@
+"""
+embed_images.py – batched image-embedding engine for the clip_variants.py models
+
+Embeds every image under a directory instead of one hard-coded file:
+
+* decode + preprocess run in a multi-worker `DataLoader` (one torch thread per worker),
+  while the main process runs the model under `torch.inference_mode`;
+* embeddings are L2-normalised, stored as float16 in `<out>/embeddings.npy` (N × D) with the
+  matching image paths, one per line, in `<out>/paths.txt` and a small `<out>/meta.json`;
+* label/text embeddings are computed once per (model, prompt list) and cached under
+  `LABEL_CACHE`, so re-runs and other scripts never re-encode the vocabulary;
+* `--threads` caps intra-op threads for CPU-only machines; throughput is reported in images/sec.
+
+Images that fail to decode are skipped (and listed in `<out>/failed.txt`).
+
+Usage:
+    python embed_images.py ./sample --out sample_emb/
+    python embed_images.py /data/catalogue --out emb/ --batch-size 128 --workers 8 --threads 16
+    python embed_images.py /data/catalogue --out emb/ --labels green blue gray red pink   # + zero-shot top label
+    python embed_images.py /data/catalogue --out emb/ --onnx onnx/siglip --precision int8  # see onnx_backend.py
+"""
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import time
+from contextlib import ExitStack
+from pathlib import Path
+from typing import Callable, Iterator
+
+import numpy as np
+import torch
+from PIL import Image
+from torch.utils.data import DataLoader, Dataset
+
+from registry import MODEL, Encoder, get_model, print_stats
+BATCH_SIZE = int(os.getenv("CLIP_BATCH_SIZE", 64))
+WORKERS = int(os.getenv("CLIP_WORKERS", min(8, os.cpu_count() or 1)))
+LABEL_CACHE = Path(os.getenv("CLIP_LABEL_CACHE", "~/.cache/clip_embed/labels")).expanduser()
+IMAGE_SUFFIXES = {".jpg", ".jpeg", ".png", ".webp", ".bmp"}
+COPY_CHUNK = 64 * 2**20
+
+
+# ───────────────────────────────────────────── model ──
+def load_model(name: str = MODEL, device: str | None = None) -> Encoder:
+    """The process-wide encoder for `name` (see registry.py for model IDs)."""
+    return get_model(name, device)
+
+
+def set_threads(threads: int | None) -> None:
+    """Cap torch's intra-op pool (and keep inter-op small) so CPU runs don't oversubscribe."""
+    if threads:
+        torch.set_num_threads(threads)
+        try:
+            torch.set_num_interop_threads(max(1, min(4, threads // 4)))
+        except RuntimeError:                       # already set once parallel work has started
+            pass
+
+
+def _normalise(x: torch.Tensor) -> torch.Tensor:
+    x = x.float()
+    return x / x.norm(dim=-1, keepdim=True)
+
+
+# ───────────────────────────────────────── label cache ──
+def label_embeddings(encoder: Encoder, texts: list[str], cache_dir: Path = LABEL_CACHE) -> np.ndarray:
+    """Normalised float32 text embeddings for `texts`, cached on disk per (model, texts)."""
+    key = hashlib.sha256(json.dumps([encoder.name, texts]).encode()).hexdigest()[:24]
+    path = cache_dir / f"{key}.npy"
+    if path.exists():
+        return np.load(path)
+    with torch.inference_mode():
+        emb = _normalise(encoder.encode_text(texts)).cpu().numpy()
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".tmp.npy")
+    np.save(tmp, emb)
+    os.replace(tmp, path)
+    return emb
+
+
+# ────────────────────────────────────────────── data ──
+def iter_image_files(root: Path) -> Iterator[Path]:
+    """Image files under `root`, recursively, in sorted order (stable row numbers across runs)."""
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for name in sorted(filenames):
+            if os.path.splitext(name)[1].lower() in IMAGE_SUFFIXES:
+                yield Path(dirpath) / name
+
+
+class ImageFiles(Dataset):
+    """Decode + preprocess one image per item (in DataLoader workers); failures yield None."""
+
+    def __init__(self, paths: list[Path], preprocess: Callable | None):
+        self.paths = paths
+        self.preprocess = preprocess
+
+    def __len__(self) -> int:
+        return len(self.paths)
+
+    def __getitem__(self, i: int):
+        try:
+            with Image.open(self.paths[i]) as img:
+                img = img.convert("RGB")
+            return i, (self.preprocess(img) if self.preprocess else img)
+        except Exception:
+            return i, None
+
+
+def _collate(items: list) -> tuple[list[int], object, list[int]]:
+    ok = [(i, x) for i, x in items if x is not None]
+    failed = [i for i, x in items if x is None]
+    if not ok:
+        return [], None, failed
+    idx, xs = zip(*ok)
+    batch = torch.stack(xs) if isinstance(xs[0], torch.Tensor) else list(xs)
+    return list(idx), batch, failed
+
+
+def _worker_init(_: int) -> None:
+    torch.set_num_threads(1)                       # workers only decode/resize; leave the cores to the model
+
+
+# ──────────────────────────────────────────── engine ──
+def embed_directory(
+    root: Path,
+    out_dir: Path,
+    encoder: Encoder | None = None,
+    batch_size: int = BATCH_SIZE,
+    workers: int = WORKERS,
+    labels: list[str] | None = None,
+    log_every: int = 20,
+) -> dict:
+    """Embed every image under `root` into `out_dir`; returns the run's metadata (also meta.json)."""
+    encoder = encoder or load_model()
+    paths = list(iter_image_files(root))
+    out_dir.mkdir(parents=True, exist_ok=True)
+    label_emb = torch.from_numpy(label_embeddings(encoder, labels)) if labels else None
+
+    loader = DataLoader(
+        ImageFiles(paths, encoder.preprocess),
+        batch_size=batch_size,
+        num_workers=workers,
+        collate_fn=_collate,
+        pin_memory=encoder.device == "cuda",
+        worker_init_fn=_worker_init if workers else None,
+        prefetch_factor=4 if workers else None,
+        persistent_workers=False,
+    )
+    raw_path = out_dir / "embeddings.f16.tmp"
+    count, dim, failed, started = 0, None, [], time.perf_counter()
+    autocast = torch.autocast("cuda", dtype=torch.float16) if encoder.device == "cuda" else torch.autocast("cpu", enabled=False)
+    with ExitStack() as files:
+        raw = files.enter_context(raw_path.open("wb"))
+        index = files.enter_context((out_dir / "paths.txt").open("w", encoding="utf-8"))
+        if labels:
+            preds = files.enter_context((out_dir / "predictions.tsv").open("w", encoding="utf-8"))
+        for step, (idx, batch, bad) in enumerate(loader, start=1):
+            failed += [paths[i] for i in bad]
+            if not idx:
+                continue
+            with torch.inference_mode(), autocast:
+                emb = _normalise(encoder.encode_image(batch)).cpu()
+            dim = emb.shape[1]
+            raw.write(emb.to(torch.float16).numpy().tobytes())
+            index.writelines(f"{paths[i]}\n" for i in idx)
+            if label_emb is not None:
+                probs = (100.0 * emb @ label_emb.T).softmax(dim=-1)
+                best, arg = probs.max(dim=-1)
+                preds.writelines(f"{paths[i]}\t{labels[a]}\t{p:.4f}\n" for i, a, p in zip(idx, arg.tolist(), best.tolist()))
+            count += len(idx)
+            if log_every and step % log_every == 0:
+                print(f"   {count}/{len(paths)} images, {count / (time.perf_counter() - started):.1f} images/sec")
+    elapsed = time.perf_counter() - started
+
+    _finalise_npy(raw_path, out_dir / "embeddings.npy", count, dim or 0)
+    (out_dir / "failed.txt").write_text("".join(f"{p}\n" for p in failed), encoding="utf-8")
+    meta = {
+        "model": encoder.name, "device": encoder.device, "count": count, "dim": dim, "dtype": "float16",
+        "normalized": True, "failed": len(failed), "root": str(root), "labels": labels,
+        "seconds": round(elapsed, 3), "images_per_sec": round(count / elapsed, 2) if elapsed else None,
+        "batch_size": batch_size, "workers": workers, "threads": torch.get_num_threads(),
+    }
+    (out_dir / "meta.json").write_text(json.dumps(meta, indent=2), encoding="utf-8")
+    return meta
+
+
+def _finalise_npy(raw_path: Path, npy_path: Path, count: int, dim: int) -> None:
+    """Prefix the streamed float16 rows with an .npy header (count is only known at the end)."""
+    with npy_path.open("wb") as dst, raw_path.open("rb") as src:
+        np.lib.format.write_array_header_1_0(
+            dst, {"descr": np.lib.format.dtype_to_descr(np.dtype(np.float16)), "fortran_order": False, "shape": (count, dim)}
+        )
+        shutil.copyfileobj(src, dst, COPY_CHUNK)
+    raw_path.unlink()
+
+
+def load_embeddings(out_dir: Path, mmap: bool = True) -> tuple[np.ndarray, list[str]]:
+    """(N × D float16 embeddings, N paths) as written by `embed_directory`."""
+    emb = np.load(out_dir / "embeddings.npy", mmap_mode="r" if mmap else None)
+    paths = (out_dir / "paths.txt").read_text(encoding="utf-8").splitlines()
+    return emb, paths
+
+
+# ─────────────────────────────────────── CLI entry‑point ──
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Embed every image in a directory with a CLIP/SigLIP model.")
+    parser.add_argument("root", type=Path, help="Directory of images (searched recursively)")
+    parser.add_argument("--out", type=Path, required=True, help="Output directory")
+    parser.add_argument("--model", default=MODEL, help="Model ID: hf-hub:…, jinaai/jina-clip-v2 or onnx:<dir>[#fp32]")
+    parser.add_argument("--device", default=None, help="cuda / cpu (default: cuda if available)")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="Images per forward pass")
+    parser.add_argument("--workers", type=int, default=WORKERS, help="DataLoader decode/preprocess processes")
+    parser.add_argument("--threads", type=int, default=None, help="torch intra-op threads (CPU)")
+    parser.add_argument("--labels", nargs="*", default=None, help="Also write the zero-shot top label per image")
+    parser.add_argument("--onnx", type=Path, default=None, help="Use ONNX encoders exported by onnx_backend.py")
+    parser.add_argument("--precision", default="int8", choices=("fp32", "int8"), help="ONNX weights to use")
+    args = parser.parse_args()
+
+    set_threads(args.threads)
+    model = f"onnx:{args.onnx}#{args.precision}" if args.onnx else args.model
+    encoder = load_model(model, args.device)
+    print(f"🧮  {encoder.name} on {encoder.device} ({torch.get_num_threads()} threads, {args.workers} workers)")
+    meta = embed_directory(args.root, args.out, encoder, args.batch_size, args.workers, args.labels)
+    print(
+        f"✅  {meta['count']} images → {args.out}/embeddings.npy ({meta['dim']}-d float16) "
+        f"in {meta['seconds']:.1f}s – {meta['images_per_sec']} images/sec; {meta['failed']} failed"
+    )
+    print_stats()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,411 @@
+"""
+embedding_index.py – memory-mapped embedding store + IVF-PQ approximate nearest-neighbour search
+
+`clip_variants.py` compares one image against a few labels in RAM.  For "find similar garment" or
+duplicate lookup over millions of catalogue images this module keeps the vectors on disk and
+searches a compressed index instead:
+
+* `EmbeddingStore` – normalised float16 vectors in an append-only `vectors.f16` file, read through
+  `np.memmap`, with one image path per row in `paths.txt`.  `import` appends an
+  `embed_images.py` output directory; nothing is ever loaded whole.
+* `IVFPQIndex` – an inverted file (k-means coarse quantiser, `nlist` lists) whose members are
+  stored as product-quantised residuals (`m` sub-spaces × 256 centroids → `m` bytes per vector).
+  A query probes the `nprobe` closest lists, scores their members with per-query lookup tables
+  (asymmetric distance), and re-ranks the best `k × rerank` candidates exactly against the
+  memory-mapped float16 vectors.  New rows are encoded with the trained quantisers on `add`.
+* `exact_search` – chunked brute force over the memmap, the ground truth for `bench`, which
+  reports recall@k and latency for several `nprobe` values.
+
+Everything is NumPy; inner product on normalised vectors (= cosine similarity).
+
+Usage:
+    python embedding_index.py import store/ emb/                    # append embed_images.py output
+    python embedding_index.py build store/ --nlist 1024 --m 48      # train + encode everything
+    python embedding_index.py add store/                            # encode rows appended since build
+    python embedding_index.py query store/ --row 123 -k 10
+    python embedding_index.py bench store/ --queries 500 --nprobe 1 4 16 64
+    python embedding_index.py synthetic store/ --n 1000000 --dim 768   # clustered test vectors
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import statistics
+import time
+from pathlib import Path
+
+import numpy as np
+
+CHUNK_ROWS = 65_536                  # rows per matmul/encode chunk (bounded memory)
+TRAIN_SAMPLE = 100_000               # max vectors used to train the quantisers
+TRAIN_PER_CENTROID = 40              # …and at most this many per coarse centroid
+PQ_TRAIN_SAMPLE = 32_768             # residuals used to train each sub-quantiser
+KMEANS_ITERS = 10
+RERANK = 16                          # candidates re-scored exactly, as a multiple of k
+PQ_CENTROIDS = 256                   # one uint8 code per sub-space
+
+
+# ───────────────────────────────────────────── store ──
+class EmbeddingStore:
+    """Append-only on-disk float16 matrix + row → path index."""
+
+    def __init__(self, root: Path):
+        self.root = root
+        meta = json.loads((root / "meta.json").read_text(encoding="utf-8"))
+        self.dim = meta["dim"]
+        self._vectors_path = root / "vectors.f16"
+        self._paths_path = root / "paths.txt"
+        self._paths: list[str] | None = None
+
+    @classmethod
+    def create(cls, root: Path, dim: int) -> EmbeddingStore:
+        root.mkdir(parents=True, exist_ok=True)
+        if not (root / "meta.json").exists():
+            (root / "meta.json").write_text(json.dumps({"dim": dim, "dtype": "float16"}), encoding="utf-8")
+            (root / "vectors.f16").touch()
+            (root / "paths.txt").touch()
+        store = cls(root)
+        if store.dim != dim:
+            raise ValueError(f"{root} holds {store.dim}-d vectors, not {dim}-d")
+        return store
+
+    def __len__(self) -> int:
+        return self._vectors_path.stat().st_size // (2 * self.dim)
+
+    @property
+    def vectors(self) -> np.ndarray:
+        """(N × dim) read-only float16 memmap (re-opened so it always covers appended rows)."""
+        n = len(self)
+        if n == 0:
+            return np.empty((0, self.dim), np.float16)
+        return np.memmap(self._vectors_path, dtype=np.float16, mode="r", shape=(n, self.dim))
+
+    @property
+    def paths(self) -> list[str]:
+        if self._paths is None or len(self._paths) != len(self):
+            self._paths = self._paths_path.read_text(encoding="utf-8").splitlines()
+        return self._paths
+
+    def append(self, vectors: np.ndarray, paths: list[str]) -> range:
+        """Normalise and append rows; returns their row numbers."""
+        if len(vectors) != len(paths):
+            raise ValueError(f"{len(vectors)} vectors but {len(paths)} paths")
+        start = len(self)
+        with self._vectors_path.open("ab") as vf, self._paths_path.open("a", encoding="utf-8") as pf:
+            for lo in range(0, len(vectors), CHUNK_ROWS):
+                chunk = np.asarray(vectors[lo:lo + CHUNK_ROWS], dtype=np.float32)
+                chunk /= np.linalg.norm(chunk, axis=1, keepdims=True) + 1e-12
+                vf.write(chunk.astype(np.float16).tobytes())
+            pf.writelines(f"{p}\n" for p in paths)
+        return range(start, start + len(vectors))
+
+    def import_embeddings(self, out_dir: Path) -> range:
+        """Append an `embed_images.py` output directory (embeddings.npy + paths.txt)."""
+        emb = np.load(out_dir / "embeddings.npy", mmap_mode="r")
+        paths = (out_dir / "paths.txt").read_text(encoding="utf-8").splitlines()
+        return self.append(emb, paths)
+
+
+# ─────────────────────────────────────── exact search ──
+def _top_k(scores: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+    """Row-wise top-k (descending) of a (Q × N) score matrix → (scores, column indices)."""
+    k = min(k, scores.shape[1])
+    idx = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    part = np.take_along_axis(scores, idx, axis=1)
+    order = np.argsort(-part, axis=1)
+    return np.take_along_axis(part, order, axis=1), np.take_along_axis(idx, order, axis=1)
+
+
+def exact_search(vectors: np.ndarray, queries: np.ndarray, k: int = 10, chunk_rows: int = CHUNK_ROWS):
+    """Brute-force inner-product top-k over a (memory-mapped) matrix, one chunk at a time."""
+    queries = np.atleast_2d(np.asarray(queries, np.float32))
+    best_s = np.full((len(queries), 0), -np.inf, np.float32)
+    best_i = np.empty((len(queries), 0), np.int64)
+    for lo in range(0, len(vectors), chunk_rows):
+        scores = queries @ np.asarray(vectors[lo:lo + chunk_rows], np.float32).T
+        s, i = _top_k(scores, k)
+        best_s, pos = _top_k(np.concatenate([best_s, s], axis=1), k)
+        best_i = np.take_along_axis(np.concatenate([best_i, i + lo], axis=1), pos, axis=1)
+    return best_s, best_i
+
+
+# ───────────────────────────────────────────── k-means ──
+def kmeans(x: np.ndarray, k: int, iters: int = KMEANS_ITERS, seed: int = 0) -> np.ndarray:
+    """Lloyd's k-means (squared L2) on float32 `x`; empty clusters are re-seeded from random points."""
+    rng = np.random.default_rng(seed)
+    x = np.asarray(x, np.float32)
+    centroids = x[rng.choice(len(x), k, replace=len(x) < k)].copy()
+    for _ in range(iters):
+        assign = _nearest(x, centroids)
+        order = np.argsort(assign, kind="stable")
+        counts = np.bincount(assign, minlength=k)
+        filled = np.flatnonzero(counts)
+        starts = np.concatenate([[0], np.cumsum(counts[filled])[:-1]])
+        centroids[filled] = np.add.reduceat(x[order], starts, axis=0) / counts[filled, None]
+        empty = counts == 0
+        centroids[empty] = x[rng.choice(len(x), int(empty.sum()))]
+    return centroids
+
+
+def _nearest(x: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """Index of the closest centroid (squared L2) for every row, chunked."""
+    c_sq = (centroids ** 2).sum(1)
+    out = np.empty(len(x), np.int32)
+    for lo in range(0, len(x), CHUNK_ROWS):
+        chunk = x[lo:lo + CHUNK_ROWS]
+        out[lo:lo + CHUNK_ROWS] = (c_sq - 2 * chunk @ centroids.T).argmin(1)
+    return out
+
+
+# ──────────────────────────────────────────── IVF-PQ ──
+class IVFPQIndex:
+    """Coarse k-means lists + product-quantised residuals, persisted next to the store.
+
+    Files under `<store>/ivfpq/`: `quantisers.npz` (centroids, codebooks), and row-ordered,
+    append-only `assign.i32` (list per row) and `codes.u8` (m bytes per row).  The list-sorted
+    view used for search is rebuilt in memory on load and after `add`.
+    """
+
+    def __init__(self, store: EmbeddingStore):
+        self.store = store
+        self.dir = store.root / "ivfpq"
+        q = np.load(self.dir / "quantisers.npz")
+        self.centroids = q["centroids"]                    # (nlist × dim) float32
+        self.codebooks = q["codebooks"]                    # (m × 256 × dsub) float32
+        self.trained_rows = int(q["trained_rows"])         # store size when the quantisers were trained
+        self.nlist, self.m = len(self.centroids), len(self.codebooks)
+        self.dsub = self.codebooks.shape[2]
+        self._sorted: tuple[np.ndarray, np.ndarray, np.ndarray] | None = None
+
+    # ── building ──
+    @classmethod
+    def build(
+        cls, store: EmbeddingStore, nlist: int | None = None, m: int | None = None,
+        train_sample: int = TRAIN_SAMPLE, seed: int = 0,
+    ) -> IVFPQIndex:
+        """Train the quantisers on a sample of the store and encode every row."""
+        n, dim = len(store), store.dim
+        nlist = nlist or max(1, min(65_536, int(4 * np.sqrt(n))))
+        m = m or _default_m(dim)
+        if dim % m:
+            raise ValueError(f"dim {dim} is not divisible by m={m}")
+        rng = np.random.default_rng(seed)
+        sample_rows = np.sort(rng.choice(n, min(n, train_sample, TRAIN_PER_CENTROID * nlist), replace=False))
+        sample = np.asarray(store.vectors[sample_rows], np.float32)
+
+        centroids = kmeans(sample, nlist, seed=seed)
+        residuals = (sample - centroids[_nearest(sample, centroids)])[:PQ_TRAIN_SAMPLE]
+        dsub = dim // m
+        codebooks = np.stack([
+            kmeans(residuals[:, j * dsub:(j + 1) * dsub], PQ_CENTROIDS, seed=seed + j) for j in range(m)
+        ])
+
+        out = store.root / "ivfpq"
+        out.mkdir(exist_ok=True)
+        np.savez(out / "quantisers.npz", centroids=centroids, codebooks=codebooks, trained_rows=n)
+        for name in ("assign.i32", "codes.u8"):
+            (out / name).write_bytes(b"")
+        index = cls(store)
+        index.add()
+        return index
+
+    def encode(self, x: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """(list id per row, m-byte PQ code per row) for float32 rows."""
+        assign = _nearest(x, self.centroids)
+        residuals = x - self.centroids[assign]
+        codes = np.empty((len(x), self.m), np.uint8)
+        for j in range(self.m):
+            codes[:, j] = _nearest(residuals[:, j * self.dsub:(j + 1) * self.dsub], self.codebooks[j])
+        return assign, codes
+
+    @property
+    def count(self) -> int:
+        return (self.dir / "assign.i32").stat().st_size // 4
+
+    def add(self) -> int:
+        """Encode every store row appended since the last build/add; returns how many were added."""
+        start, end = self.count, len(self.store)
+        vectors = self.store.vectors
+        with (self.dir / "assign.i32").open("ab") as af, (self.dir / "codes.u8").open("ab") as cf:
+            for lo in range(start, end, CHUNK_ROWS):
+                assign, codes = self.encode(np.asarray(vectors[lo:min(lo + CHUNK_ROWS, end)], np.float32))
+                af.write(assign.astype(np.int32).tobytes())
+                cf.write(codes.tobytes())
+        self._sorted = None
+        return end - start
+
+    # ── searching ──
+    def _lists(self) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """(row ids sorted by list, their codes in the same order, list offsets)."""
+        if self._sorted is None:
+            n = self.count
+            assign = np.fromfile(self.dir / "assign.i32", np.int32, n)
+            codes = np.fromfile(self.dir / "codes.u8", np.uint8, n * self.m).reshape(n, self.m)
+            order = np.argsort(assign, kind="stable")
+            offsets = np.zeros(self.nlist + 1, np.int64)
+            np.cumsum(np.bincount(assign, minlength=self.nlist), out=offsets[1:])
+            self._sorted = (order, codes[order], offsets)
+        return self._sorted
+
+    def search(self, query: np.ndarray, k: int = 10, nprobe: int = 8, rerank: int = RERANK) -> tuple[np.ndarray, np.ndarray]:
+        """Top-k (scores, row ids) for one query; `rerank` × k candidates are re-scored exactly."""
+        order, codes, offsets = self._lists()
+        q = np.asarray(query, np.float32).ravel()
+        q = q / (np.linalg.norm(q) + 1e-12)
+        coarse = self.centroids @ q
+        probe = np.argpartition(-coarse, min(nprobe, self.nlist) - 1)[:nprobe]
+
+        spans = [(offsets[l], offsets[l + 1]) for l in probe if offsets[l + 1] > offsets[l]]
+        if not spans:
+            return np.empty(0, np.float32), np.empty(0, np.int64)
+        pos = np.concatenate([np.arange(a, b) for a, b in spans])
+        base = np.repeat(coarse[probe], np.diff(offsets)[probe])      # q·centroid for every candidate
+        lut = np.einsum("jcd,jd->jc", self.codebooks, q.reshape(self.m, self.dsub))
+        approx = base + lut[np.arange(self.m), codes[pos]].sum(1)
+
+        n_cand = min(len(pos), max(k, k * rerank))
+        cand = np.argpartition(-approx, n_cand - 1)[:n_cand]
+        rows = np.sort(order[pos[cand]])                              # sorted → sequential memmap reads
+        if rerank:
+            scores = np.asarray(self.store.vectors[rows], np.float32) @ q
+        else:
+            scores = approx[cand][np.argsort(order[pos[cand]])]
+        best = np.argsort(-scores)[:k]
+        return scores[best], rows[best]
+
+    def nbytes(self) -> int:
+        order, codes, offsets = self._lists()
+        return order.nbytes + codes.nbytes + offsets.nbytes + self.centroids.nbytes + self.codebooks.nbytes
+
+
+def _default_m(dim: int) -> int:
+    """~16 dims per sub-quantiser, rounded to a divisor of `dim`."""
+    m = max(1, dim // 16)
+    while dim % m:
+        m -= 1
+    return m
+
+
+# ────────────────────────────────────────── benchmark ──
+def benchmark(
+    index: IVFPQIndex, n_queries: int = 200, k: int = 10, nprobes: tuple[int, ...] = (1, 4, 16, 64),
+    rerank: int = RERANK, noise: float = 0.05, seed: int = 0,
+) -> list[dict]:
+    """Recall@k and per-query latency vs. exact search, for perturbed copies of random stored rows."""
+    store = index.store
+    rng = np.random.default_rng(seed)
+    rows = np.sort(rng.choice(len(store), min(n_queries, len(store)), replace=False))
+    queries = np.asarray(store.vectors[rows], np.float32)
+    queries += noise * rng.standard_normal(queries.shape).astype(np.float32) / np.sqrt(store.dim)
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+
+    started = time.perf_counter()
+    _, truth = exact_search(store.vectors, queries, k)
+    exact_ms = (time.perf_counter() - started) * 1e3 / len(queries)
+
+    report = [{"method": "exact", "nprobe": None, "recall": 1.0, "p50_ms": exact_ms, "p95_ms": exact_ms}]
+    index.search(queries[0], k, nprobes[0], rerank)                   # build the sorted lists outside the timing
+    for nprobe in nprobes:
+        recalls, latencies = [], []
+        for q, true_rows in zip(queries, truth):
+            t0 = time.perf_counter()
+            _, found = index.search(q, k, nprobe, rerank)
+            latencies.append((time.perf_counter() - t0) * 1e3)
+            recalls.append(len(set(found.tolist()) & set(true_rows.tolist())) / k)
+        cuts = statistics.quantiles(latencies, n=20) if len(latencies) > 1 else latencies * 19
+        report.append({
+            "method": "ivfpq", "nprobe": nprobe, "recall": float(np.mean(recalls)),
+            "p50_ms": statistics.median(latencies), "p95_ms": cuts[18],
+        })
+    return report
+
+
+def synthetic(
+    store: EmbeddingStore, n: int, clusters: int = 500, latent: int = 32, spread: float = 0.5, seed: int = 0
+) -> None:
+    """Append `n` test vectors: a mixture of Gaussians in a `latent`-d space, linearly embedded in
+    `store.dim` dims – like real image embeddings, clustered and of low intrinsic dimension."""
+    rng = np.random.default_rng(seed)
+    first = len(store)
+    centres = rng.standard_normal((clusters, latent)).astype(np.float32)
+    basis = rng.standard_normal((latent, store.dim)).astype(np.float32) / np.sqrt(latent)
+    for lo in range(0, n, CHUNK_ROWS):
+        size = min(CHUNK_ROWS, n - lo)
+        z = centres[rng.integers(0, clusters, size)] + spread * rng.standard_normal((size, latent)).astype(np.float32)
+        x = z @ basis + 0.01 * rng.standard_normal((size, store.dim)).astype(np.float32)
+        store.append(x, [f"synthetic/{first + lo + i:08d}" for i in range(size)])
+
+
+# ─────────────────────────────────────── CLI entry‑point ──
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Memory-mapped embedding store with IVF-PQ nearest-neighbour search.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("import", help="Append an embed_images.py output directory")
+    p.add_argument("store", type=Path)
+    p.add_argument("emb", type=Path)
+    p = sub.add_parser("build", help="Train quantisers and encode every row")
+    p.add_argument("store", type=Path)
+    p.add_argument("--nlist", type=int, default=None, help="Inverted lists (default ≈ 4·√N)")
+    p.add_argument("--m", type=int, default=None, help="PQ sub-spaces = bytes per vector (default dim/16)")
+    p.add_argument("--train-sample", type=int, default=TRAIN_SAMPLE)
+    p = sub.add_parser("add", help="Encode rows appended since the last build")
+    p.add_argument("store", type=Path)
+    p = sub.add_parser("query", help="Nearest neighbours of a stored row")
+    p.add_argument("store", type=Path)
+    p.add_argument("--row", type=int, required=True)
+    p.add_argument("-k", type=int, default=10)
+    p.add_argument("--nprobe", type=int, default=8)
+    p.add_argument("--exact", action="store_true", help="Brute force instead of the index")
+    p = sub.add_parser("bench", help="Recall@k / latency of the index vs. exact search")
+    p.add_argument("store", type=Path)
+    p.add_argument("--queries", type=int, default=200)
+    p.add_argument("-k", type=int, default=10)
+    p.add_argument("--nprobe", type=int, nargs="+", default=[1, 4, 16, 64])
+    p.add_argument("--rerank", type=int, default=RERANK, help="Candidates re-scored exactly, as a multiple of k (0 = off)")
+    p = sub.add_parser("synthetic", help="Append clustered random vectors for testing")
+    p.add_argument("store", type=Path)
+    p.add_argument("--n", type=int, default=100_000)
+    p.add_argument("--dim", type=int, default=768)
+    args = parser.parse_args()
+
+    if args.command == "import":
+        dim = np.load(args.emb / "embeddings.npy", mmap_mode="r").shape[1]
+        rows = EmbeddingStore.create(args.store, dim).import_embeddings(args.emb)
+        print(f"📥  appended {len(rows)} rows → {args.store} (rows {rows.start}–{rows.stop - 1})")
+    elif args.command == "synthetic":
+        store = EmbeddingStore.create(args.store, args.dim)
+        synthetic(store, args.n)
+        print(f"🧪  {len(store)} rows in {args.store}")
+    elif args.command == "build":
+        store = EmbeddingStore(args.store)
+        started = time.perf_counter()
+        index = IVFPQIndex.build(store, args.nlist, args.m, args.train_sample)
+        print(
+            f"🏗️  IVF{index.nlist},PQ{index.m} over {index.count} rows in {time.perf_counter() - started:.1f}s – "
+            f"index {index.nbytes() / 2**20:.1f} MiB vs vectors {len(store) * store.dim * 2 / 2**20:.1f} MiB"
+        )
+    elif args.command == "add":
+        index = IVFPQIndex(EmbeddingStore(args.store))
+        added = index.add()
+        print(f"➕  encoded {added} new rows ({index.count} indexed)")
+        if index.count > 2 * index.trained_rows:
+            print(f"⚠️  the store has grown {index.count / index.trained_rows:.1f}× since training – consider `build` again")
+    elif args.command == "query":
+        store = EmbeddingStore(args.store)
+        q = np.asarray(store.vectors[args.row], np.float32)
+        if args.exact:
+            scores, rows = (a[0] for a in exact_search(store.vectors, q, args.k))
+        else:
+            scores, rows = IVFPQIndex(store).search(q, args.k, args.nprobe)
+        for score, row in zip(scores, rows):
+            print(f"{score:.4f}  {row:>9}  {store.paths[row]}")
+    elif args.command == "bench":
+        index = IVFPQIndex(EmbeddingStore(args.store))
+        print(f"📏  {len(index.store)} rows, IVF{index.nlist},PQ{index.m}, k={args.k}, rerank={args.rerank}")
+        for r in benchmark(index, args.queries, args.k, tuple(args.nprobe), args.rerank):
+            label = "exact" if r["nprobe"] is None else f"nprobe={r['nprobe']}"
+            print(f"   {label:<12} recall@{args.k} {r['recall']:.3f}   p50 {r['p50_ms']:7.2f} ms   p95 {r['p95_ms']:7.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,298 @@
+"""
+onnx_backend.py – ONNX (fp32 / int8) CPU inference path for the clip_variants.py models
+
+`torch.autocast(..., bfloat16)` buys little on CPU-only nodes.  This module
+
+* exports the image and text towers of `marqo-fashionSigLIP` (open_clip) or `jina-clip-v2`
+  (transformers) to `<out>/image.onnx` and `<out>/text.onnx` with a dynamic batch axis, both
+  returning L2-normalised embeddings;
+* optionally writes int8 dynamically-quantised copies (`image.int8.onnx`, `text.int8.onnx`) –
+  MatMul/Gemm weights in int8, activations quantised on the fly, so no calibration set is needed;
+* serves them through onnxruntime behind the same `Encoder` interface as `embed_images.py`
+  (`python embed_images.py … --onnx <out> --precision int8`);
+* benchmarks torch fp32 vs. ONNX fp32 vs. ONNX int8 on a folder of images – each backend in its
+  own process, so load time, peak RSS, images/sec and batch latency are measured in isolation –
+  and reports zero-shot top-1 agreement and embedding cosine against torch fp32.
+
+Requires `onnx` and `onnxruntime` in addition to the torch stack.
+
+Usage:
+    python onnx_backend.py export --out onnx/siglip --int8
+    python onnx_backend.py export --model jinaai/jina-clip-v2 --out onnx/jina --int8
+    python onnx_backend.py bench onnx/siglip ./sample --labels green blue gray red pink --threads 8
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import torch
+
+from embed_images import iter_image_files, load_model, set_threads
+from registry import MODEL, Encoder
+
+OPSET = 17
+PRECISIONS = ("fp32", "int8")
+BENCH_LABELS = ["green", "blue", "gray", "red", "pink", "yellow", "black", "multicolor", "white"]
+
+
+# ───────────────────────────────────────────── export ──
+class _Normalised(torch.nn.Module):
+    """Call `model.<method>` and L2-normalise its output (exported with it).
+
+    The model is held as a submodule, so tracing sees its weights as registered parameters.
+    `arg_names` passes the inputs as keyword arguments (e.g. to `get_text_features`).
+    """
+
+    def __init__(self, model: torch.nn.Module, method: str, arg_names: tuple[str, ...] = ()):
+        super().__init__()
+        self.model = model
+        self.method = method
+        self.arg_names = arg_names
+
+    def forward(self, *inputs):
+        encode = getattr(self.model, self.method)
+        x = encode(**dict(zip(self.arg_names, inputs))) if self.arg_names else encode(*inputs)
+        return x / x.norm(dim=-1, keepdim=True)
+
+
+def _towers(name: str):
+    """(image module, text module, dummy pixels, dummy text inputs by name, extra meta) for a supported model."""
+    if name.startswith("hf-hub:"):
+        import open_clip
+        model, _, _ = open_clip.create_model_and_transforms(name, device="cpu")
+        model.eval().requires_grad_(False)
+        size = model.visual.image_size
+        size = size if isinstance(size, (tuple, list)) else (size, size)
+        tokens = open_clip.get_tokenizer(name)(["a photo of a garment"])
+        return (
+            _Normalised(model, "encode_image"), _Normalised(model, "encode_text"),
+            torch.randn(1, 3, *size), {"input_ids": tokens},
+            {"image_size": list(size), "context_length": tokens.shape[1], "preprocess_cfg": model.visual.preprocess_cfg},
+        )
+    if name == "jinaai/jina-clip-v2":
+        from transformers import AutoImageProcessor, AutoModel, AutoTokenizer
+        model = AutoModel.from_pretrained(name, trust_remote_code=True).float()
+        model.eval().requires_grad_(False)
+        size = AutoImageProcessor.from_pretrained(name, trust_remote_code=True).crop_size
+        size = (size["height"], size["width"]) if isinstance(size, dict) else (size, size)
+        # two labels of different lengths, so the dummy batch is padded and the mask is traced as used
+        tokens = AutoTokenizer.from_pretrained(name, trust_remote_code=True)(
+            ["a photo of a garment", "a photo of a long-sleeved garment"], padding=True, return_tensors="pt"
+        )
+        return (
+            _Normalised(model, "get_image_features", ("pixel_values",)),
+            _Normalised(model, "get_text_features", ("input_ids", "attention_mask")),
+            torch.randn(1, 3, *size),
+            {"input_ids": tokens["input_ids"], "attention_mask": tokens["attention_mask"]},
+            {"image_size": list(size), "context_length": None},
+        )
+    raise ValueError(f"Unknown model {name!r}")
+
+
+def export(name: str, out_dir: Path, int8: bool = False, opset: int = OPSET) -> dict:
+    """Export both towers (and int8 copies) to `out_dir`; returns the written meta.json."""
+    out_dir.mkdir(parents=True, exist_ok=True)
+    image, text, pixels, text_inputs, extra = _towers(name)
+    seq_axis = {} if extra["context_length"] else {1: "sequence"}
+    with torch.no_grad():                        # not inference_mode: the tracer needs ordinary tensors
+        torch.onnx.export(
+            image, (pixels,), out_dir / "image.onnx", input_names=["pixel_values"], output_names=["embedding"],
+            dynamic_axes={"pixel_values": {0: "batch"}, "embedding": {0: "batch"}}, opset_version=opset,
+        )
+        torch.onnx.export(
+            text, tuple(text_inputs.values()), out_dir / "text.onnx", input_names=list(text_inputs),
+            output_names=["embedding"], opset_version=opset,
+            dynamic_axes={**{n: {0: "batch", **seq_axis} for n in text_inputs}, "embedding": {0: "batch"}},
+        )
+    files = {"fp32": {"image": "image.onnx", "text": "text.onnx"}}
+    if int8:
+        files["int8"] = {tower: quantize(out_dir / f"{tower}.onnx").name for tower in ("image", "text")}
+    meta = {"model": name, "opset": opset, "files": files, "text_inputs": list(text_inputs), **extra}
+    (out_dir / "meta.json").write_text(json.dumps(meta, indent=2), encoding="utf-8")
+    return meta
+
+
+def quantize(fp32_path: Path) -> Path:
+    """Dynamic int8 quantisation of MatMul/Gemm weights (patch-embedding convs stay fp32)."""
+    import onnx
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    out = fp32_path.with_suffix(".int8.onnx")
+    graph = onnx.load(fp32_path, load_external_data=False).graph
+    large = any(t.data_location == onnx.TensorProto.EXTERNAL for t in graph.initializer)
+    quantize_dynamic(
+        fp32_path, out, weight_type=QuantType.QInt8, op_types_to_quantize=["MatMul", "Gemm"],
+        use_external_data_format=large,                       # jina-clip-v2 fp32 is > 2 GB
+    )
+    return out
+
+
+# ──────────────────────────────────────────── backend ──
+def _session(path: Path, threads: int | None):
+    import onnxruntime as ort
+
+    options = ort.SessionOptions()
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+    if threads:
+        options.intra_op_num_threads = threads
+        options.inter_op_num_threads = 1
+    return ort.InferenceSession(str(path), options, providers=["CPUExecutionProvider"])
+
+
+def load_onnx_encoder(onnx_dir: Path, precision: str = "int8", threads: int | None = None) -> Encoder:
+    """An `embed_images.Encoder` backed by onnxruntime sessions from `export`."""
+    meta = json.loads((onnx_dir / "meta.json").read_text(encoding="utf-8"))
+    if precision not in meta["files"]:
+        raise ValueError(f"{onnx_dir} has no {precision} export (have {list(meta['files'])})")
+    image = _session(onnx_dir / meta["files"][precision]["image"], threads)
+    text = _session(onnx_dir / meta["files"][precision]["text"], threads)
+    name = meta["model"]
+
+    if name.startswith("hf-hub:"):
+        import open_clip
+        preprocess = open_clip.image_transform_v2(open_clip.PreprocessCfg(**meta["preprocess_cfg"]), is_train=False)
+        tokenizer = open_clip.get_tokenizer(name)
+        tokenize = lambda texts: {"input_ids": tokenizer(texts).numpy()}
+    else:
+        from transformers import AutoImageProcessor, AutoTokenizer
+        processor = AutoImageProcessor.from_pretrained(name, trust_remote_code=True)
+        tokenizer = AutoTokenizer.from_pretrained(name, trust_remote_code=True)
+        preprocess = lambda img: torch.from_numpy(processor(images=img, return_tensors="np")["pixel_values"][0])
+        tokenize = lambda texts: dict(tokenizer(texts, padding=True, return_tensors="np"))
+
+    def encode_image(batch) -> torch.Tensor:
+        pixels = batch.numpy() if isinstance(batch, torch.Tensor) else np.asarray(batch)
+        return torch.from_numpy(image.run(None, {"pixel_values": pixels.astype(np.float32)})[0])
+
+    text_inputs = {i.name for i in text.get_inputs()}        # exports before attention_mask only take input_ids
+
+    def encode_text(texts: list[str]) -> torch.Tensor:
+        feeds = {k: v.astype(np.int64) for k, v in tokenize(texts).items() if k in text_inputs}
+        return torch.from_numpy(text.run(None, feeds)[0])
+
+    return Encoder(f"{name} [onnx {precision}]", "cpu", preprocess, encode_image, encode_text)
+
+
+# ────────────────────────────────────────── benchmark ──
+def _peak_rss_mb() -> float:
+    with open("/proc/self/status") as f:                   # VmHWM resets on exec, unlike ru_maxrss
+        return next(int(line.split()[1]) for line in f if line.startswith("VmHWM:")) / 1024
+
+
+def bench_one(backend: str, onnx_dir: Path, image_dir: Path, labels: list[str], batch_size: int,
+              threads: int | None, out: Path) -> dict:
+    """Embed `image_dir` with one backend ("torch" or an ONNX precision) in this process."""
+    from torch.utils.data import DataLoader
+
+    from embed_images import ImageFiles, _collate
+
+    set_threads(threads)
+    started = time.perf_counter()
+    if backend == "torch":
+        model = json.loads((onnx_dir / "meta.json").read_text(encoding="utf-8"))["model"]
+        encoder = load_model(model, "cpu")
+    else:
+        encoder = load_onnx_encoder(onnx_dir, backend, threads)
+    load_s = time.perf_counter() - started
+
+    paths = list(iter_image_files(image_dir))
+    loader = DataLoader(ImageFiles(paths, encoder.preprocess), batch_size=batch_size, collate_fn=_collate)
+    batches = [batch for idx, batch, _ in loader if idx]          # decode up front: time the model only
+    with torch.inference_mode():
+        text = encoder.encode_text(labels).float()
+        encoder.encode_image(batches[0][:1])                      # warm-up
+        latencies, chunks = [], []
+        started = time.perf_counter()
+        for batch in batches:
+            t0 = time.perf_counter()
+            chunks.append(encoder.encode_image(batch).float())
+            latencies.append((time.perf_counter() - t0) * 1e3)
+        elapsed = time.perf_counter() - started
+    emb = torch.cat(chunks)
+    emb = emb / emb.norm(dim=-1, keepdim=True)
+    text = text / text.norm(dim=-1, keepdim=True)
+    np.save(out / f"{backend}.image.npy", emb.numpy())
+    np.save(out / f"{backend}.text.npy", text.numpy())
+    return {
+        "backend": backend, "images": len(emb), "load_s": round(load_s, 2),
+        "images_per_sec": round(len(emb) / elapsed, 2),
+        "batch_p50_ms": round(statistics.median(latencies), 1), "batch_max_ms": round(max(latencies), 1),
+        "peak_rss_mb": round(_peak_rss_mb(), 1), "threads": torch.get_num_threads(),
+    }
+
+
+def bench(onnx_dir: Path, image_dir: Path, labels: list[str], batch_size: int = 16,
+          threads: int | None = None, backends: tuple[str, ...] = ("torch", *PRECISIONS)) -> list[dict]:
+    """Run every backend in a fresh process, then compare each against torch fp32."""
+    available = json.loads((onnx_dir / "meta.json").read_text(encoding="utf-8"))["files"]
+    backends = tuple(b for b in backends if b == "torch" or b in available)
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for backend in backends:
+            cmd = [sys.executable, __file__, "bench-one", backend, str(onnx_dir), str(image_dir), tmp,
+                   "--batch-size", str(batch_size), "--labels", *labels]
+            if threads:
+                cmd += ["--threads", str(threads)]
+            result = subprocess.run(cmd, capture_output=True, text=True, check=True)
+            rows.append(json.loads(result.stdout.strip().splitlines()[-1]))
+
+        ref_img, ref_txt = (np.load(Path(tmp) / f"{backends[0]}.{kind}.npy") for kind in ("image", "text"))
+        ref_top = (ref_img @ ref_txt.T).argmax(1)
+        for row in rows:
+            img, txt = (np.load(Path(tmp) / f"{row['backend']}.{kind}.npy") for kind in ("image", "text"))
+            row["top1_agreement"] = round(float(((img @ txt.T).argmax(1) == ref_top).mean()), 4)
+            row["mean_cosine"] = round(float((img * ref_img).sum(1).mean()), 4)
+    return rows
+
+
+# ─────────────────────────────────────── CLI entry‑point ──
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Export, quantise and benchmark ONNX CLIP/SigLIP encoders.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("export", help="Export image/text towers to ONNX")
+    p.add_argument("--model", default=MODEL)
+    p.add_argument("--out", type=Path, required=True)
+    p.add_argument("--int8", action="store_true", help="Also write int8 dynamically-quantised copies")
+    p.add_argument("--opset", type=int, default=OPSET)
+    for cmd in ("bench", "bench-one"):
+        p = sub.add_parser(cmd, help="Compare torch fp32 / ONNX fp32 / ONNX int8" if cmd == "bench" else argparse.SUPPRESS)
+        if cmd == "bench-one":
+            p.add_argument("backend", choices=("torch", *PRECISIONS))
+        p.add_argument("onnx_dir", type=Path)
+        p.add_argument("images", type=Path, help="Directory of images")
+        if cmd == "bench-one":
+            p.add_argument("out", type=Path)
+        p.add_argument("--labels", nargs="+", default=BENCH_LABELS)
+        p.add_argument("--batch-size", type=int, default=16)
+        p.add_argument("--threads", type=int, default=None)
+    args = parser.parse_args()
+
+    if args.command == "export":
+        meta = export(args.model, args.out, args.int8, args.opset)
+        sizes = {
+            precision: sum((args.out / f).stat().st_size for f in files.values()) / 2**20
+            for precision, files in meta["files"].items()
+        }
+        print(f"📦  {args.model} → {args.out}: " + ", ".join(f"{p} {mb:.0f} MiB" for p, mb in sizes.items()))
+    elif args.command == "bench-one":
+        print(json.dumps(bench_one(args.backend, args.onnx_dir, args.images, args.labels,
+                                   args.batch_size, args.threads, args.out)))
+    else:
+        rows = bench(args.onnx_dir, args.images, args.labels, args.batch_size, args.threads)
+        print(f"{'backend':<8} {'img/s':>8} {'p50 ms':>8} {'max ms':>8} {'load s':>7} {'RSS MB':>8} {'top1 agr':>9} {'cosine':>7}")
+        for r in rows:
+            print(f"{r['backend']:<8} {r['images_per_sec']:>8} {r['batch_p50_ms']:>8} {r['batch_max_ms']:>8} "
+                  f"{r['load_s']:>7} {r['peak_rss_mb']:>8} {r['top1_agreement']:>9} {r['mean_cosine']:>7}")
+
+
+if __name__ == "__main__":
+    main()
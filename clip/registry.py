@@ -0,0 +1,224 @@
+"""
+registry.py – lazy, process-wide model registry for the CLIP/SigLIP encoders
+
+`clip_variants.py` used to pick a model with an if/else on a module constant, import both
+`open_clip` and `transformers` up front, and pay the full ~900 MB load in every script.  Here a
+model ID maps to a loader (registered by prefix); the backend library is imported inside the
+loader, and each (model, device) is loaded at most once per process behind a per-model lock, so
+concurrent callers wait for the first load instead of starting their own.
+
+    encoder = get_model("hf-hub:Marqo/marqo-fashionSigLIP")     # Encoder(preprocess, encode_image, encode_text)
+    preload(["hf-hub:Marqo/marqo-fashionSigLIP"])               # load + warm up at startup
+    print_stats()                                                # cold start + per-call latency
+
+Model IDs:
+    hf-hub:<repo>          open_clip (e.g. hf-hub:Marqo/marqo-fashionSigLIP)
+    jinaai/<repo>          transformers with trust_remote_code (e.g. jinaai/jina-clip-v2)
+    onnx:<dir>[#int8]      onnxruntime export from onnx_backend.py (default precision int8)
+
+Weights are fully materialised in memory by every backend.  For transformers models,
+`low_cpu_mem_usage=True` only skips the throwaway random initialisation, so peak RAM during the
+load is about one copy of the weights instead of two; `.to(device)` then copies them to the GPU.
+
+Set CLIP_PRELOAD="id1,id2" to have `preload_from_env()` load those models on startup.
+"""
+from __future__ import annotations
+
+import os
+import statistics
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Callable
+
+if TYPE_CHECKING:
+    import torch
+    from PIL import Image
+
+MODEL = os.getenv("CLIP_MODEL", "hf-hub:Marqo/marqo-fashionSigLIP")   # or 'jinaai/jina-clip-v2'
+STATS_WINDOW = int(os.getenv("CLIP_STATS_WINDOW", 10_000))           # latencies kept per kind for p50/p95
+
+
+@dataclass
+class Encoder:
+    """What callers need from a model: a per-image transform and two batch encoders."""
+    name: str
+    device: str
+    preprocess: Callable[[Image.Image], object] | None       # None: the encoder takes PIL images
+    encode_image: Callable[[object], torch.Tensor]
+    encode_text: Callable[[list[str]], torch.Tensor]
+    logit_scale: float | None = None                           # learned temperature, where the model has one
+
+
+@dataclass
+class ModelStats:
+    load_s: float = 0.0                                        # import + weights → ready
+    warmup_s: float | None = None                              # first image + text forward pass
+    # the most recent STATS_WINDOW latencies per kind, so a long-running service stays bounded
+    calls: dict[str, deque[float]] = field(
+        default_factory=lambda: {kind: deque(maxlen=STATS_WINDOW) for kind in ("image", "text")})
+    counts: dict[str, int] = field(default_factory=lambda: {"image": 0, "text": 0})
+
+    def summary(self) -> str:
+        parts = [f"cold start {self.load_s:.2f}s"]
+        if self.warmup_s is not None:
+            parts.append(f"warm-up {self.warmup_s * 1e3:.0f} ms")
+        for kind, latencies in self.calls.items():
+            if latencies:
+                ms = sorted(x * 1e3 for x in latencies)
+                p95 = ms[min(len(ms) - 1, int(0.95 * len(ms)))]
+                window = "" if len(ms) == self.counts[kind] else f" (last {len(ms)})"
+                parts.append(f"{kind} ×{self.counts[kind]} p50 {statistics.median(ms):.1f} ms p95 {p95:.1f} ms{window}")
+        return ", ".join(parts)
+
+
+@dataclass
+class _Entry:
+    lock: threading.Lock = field(default_factory=threading.Lock)
+    encoder: Encoder | None = None
+    stats: ModelStats = field(default_factory=ModelStats)
+
+
+_LOADERS: dict[str, Callable[[str, str], Encoder]] = {}
+_ENTRIES: dict[tuple[str, str], _Entry] = {}
+_LOCK = threading.Lock()                                       # guards _ENTRIES only, never held while loading
+
+
+def register(prefix: str):
+    """Decorator: `loader(model_id, device) -> Encoder` handles IDs starting with `prefix`."""
+    def wrap(loader: Callable[[str, str], Encoder]):
+        _LOADERS[prefix] = loader
+        return loader
+    return wrap
+
+
+def _default_device(model_id: str) -> str:
+    if model_id.startswith("onnx:"):
+        return "cpu"
+    import torch
+    return "cuda" if torch.cuda.is_available() else "cpu"
+
+
+def _timed(fn: Callable, stats: ModelStats, kind: str) -> Callable:
+    latencies = stats.calls[kind]
+
+    def call(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            latencies.append(time.perf_counter() - started)
+            stats.counts[kind] += 1
+    return call
+
+
+def get_model(model_id: str = MODEL, device: str | None = None) -> Encoder:
+    """The process-wide `Encoder` for `model_id`, loading it on first use (thread-safe)."""
+    device = device or _default_device(model_id)
+    with _LOCK:
+        entry = _ENTRIES.setdefault((model_id, device), _Entry())
+    if entry.encoder is not None:
+        return entry.encoder
+    with entry.lock:                                           # one loader per model; others wait here
+        if entry.encoder is None:
+            loader = next((fn for prefix, fn in _LOADERS.items() if model_id.startswith(prefix)), None)
+            if loader is None:
+                raise ValueError(f"No loader registered for {model_id!r} (known prefixes: {list(_LOADERS)})")
+            started = time.perf_counter()
+            encoder = loader(model_id, device)
+            entry.stats.load_s = time.perf_counter() - started
+            encoder.encode_image = _timed(encoder.encode_image, entry.stats, "image")
+            encoder.encode_text = _timed(encoder.encode_text, entry.stats, "text")
+            entry.encoder = encoder
+    return entry.encoder
+
+
+def warm_up(model_id: str = MODEL, device: str | None = None) -> float:
+    """Run one image and one text through the model (allocators, kernels, lazy init); returns seconds."""
+    import torch
+    from PIL import Image
+
+    encoder = get_model(model_id, device)
+    image = Image.new("RGB", (256, 256), (128, 128, 128))
+    batch = torch.stack([encoder.preprocess(image)]) if encoder.preprocess else [image]
+    started = time.perf_counter()
+    with torch.inference_mode():
+        encoder.encode_image(batch)
+        encoder.encode_text(["a photo of a garment"])
+    elapsed = time.perf_counter() - started
+    entry = _ENTRIES[(model_id, device or _default_device(model_id))]
+    entry.stats.warmup_s = elapsed
+    for latencies in entry.stats.calls.values():               # keep warm-up out of the per-call numbers
+        latencies.clear()
+    return elapsed
+
+
+def preload(model_ids: list[str], device: str | None = None, warmup: bool = True) -> None:
+    """Load (and optionally warm up) several models, e.g. at service startup."""
+    for model_id in model_ids:
+        get_model(model_id, device)
+        if warmup:
+            warm_up(model_id, device)
+
+
+def preload_from_env(device: str | None = None) -> None:
+    """Preload the comma-separated model IDs in $CLIP_PRELOAD, if any."""
+    ids = [m.strip() for m in os.getenv("CLIP_PRELOAD", "").split(",") if m.strip()]
+    if ids:
+        preload(ids, device)
+
+
+def loaded() -> list[tuple[str, str]]:
+    return [key for key, entry in _ENTRIES.items() if entry.encoder is not None]
+
+
+def stats() -> dict[tuple[str, str], ModelStats]:
+    return {key: entry.stats for key, entry in _ENTRIES.items() if entry.encoder is not None}
+
+
+def print_stats() -> None:
+    for (model_id, device), s in stats().items():
+        print(f"⏱️  {model_id} [{device}]: {s.summary()}")
+
+
+# ──────────────────────────────────────────── loaders ──
+@register("hf-hub:")
+def _load_open_clip(model_id: str, device: str) -> Encoder:
+    import open_clip
+
+    model, _, preprocess = open_clip.create_model_and_transforms(model_id, device=device)
+    model.eval()
+    tokenizer = open_clip.get_tokenizer(model_id)
+    return Encoder(
+        model_id, device, preprocess,
+        encode_image=lambda batch: model.encode_image(batch.to(device, non_blocking=True)),
+        encode_text=lambda texts: model.encode_text(tokenizer(texts).to(device)),
+        logit_scale=float(model.logit_scale.exp()),
+    )
+
+
+@register("jinaai/")
+def _load_jina(model_id: str, device: str) -> Encoder:
+    import torch
+    from transformers import AutoModel
+
+    # low_cpu_mem_usage: no random init before the checkpoint is loaded (the weights still end up in RAM)
+    model = AutoModel.from_pretrained(model_id, trust_remote_code=True, low_cpu_mem_usage=True).to(device)
+    model.eval()
+    return Encoder(
+        model_id, device, None,
+        encode_image=lambda images: torch.as_tensor(model.encode_image(images)),
+        encode_text=lambda texts: torch.as_tensor(model.encode_text(texts)),
+    )
+
+
+@register("onnx:")
+def _load_onnx(model_id: str, device: str) -> Encoder:
+    from pathlib import Path
+
+    import torch
+    from onnx_backend import load_onnx_encoder
+
+    path, _, precision = model_id[len("onnx:"):].partition("#")
+    return load_onnx_encoder(Path(path), precision or "int8", threads=torch.get_num_threads())
@@ -7,22 +7,35 @@
 #
 # MIRROR_DIRECTORY is the directory where all the cloned repositories are stored.
 # DATASET_ID is the name of the dataset that will be created on the Hub.
+# SERIALIZE_IN_CHUNKS streams rows into Feather (or Parquet) shards of at most that many rows
+# and SHARD_MAX_BYTES bytes each, so memory stays flat however large the mirror is.
 
 
+import glob
 import os
+import shutil
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
 from nbformat import reads, NO_CONVERT
 from tqdm import tqdm
 from datasets import Dataset
-from typing import Dict
+from typing import Dict, Iterator, List, Tuple
 from huggingface_hub import HfApi, create_repo
 import tempfile
-import subprocess
 
 MIRROR_DIRECTORY = "lucidrains"
 DATASET_ID = "lucidrains-12-codegen"
 SERIALIZE_IN_CHUNKS = False # 10000
 FEATHER_FORMAT = "ftr"
+PARQUET_FORMAT = "parquet"
+SHARD_FORMAT = FEATHER_FORMAT  # or PARQUET_FORMAT
+SHARD_MAX_BYTES = 512 * 2**20  # uncompressed Arrow bytes per shard
+BATCH_ROWS = 1000  # rows per Arrow record batch
+BATCH_MAX_BYTES = 64 * 2**20  # ... or fewer, if the files are large
+
+COLUMNS = ["repo_id", "file_path", "content"]
+SCHEMA = pa.schema([(name, pa.string()) for name in COLUMNS])
 
 # Block the following formats.
 IMAGE = ["png", "jpg", "jpeg", "gif"]
@@ -68,8 +81,8 @@ def upload_to_hub(file_format: str, repo_id: str):
 
     with tempfile.TemporaryDirectory() as tmpdirname:
         os.makedirs(tmpdirname, exist_ok=True)
-        command = f"mv *.{file_format} {tmpdirname}"
-        _ = subprocess.run(command.split())
+        for path in glob.glob(f"*.{file_format}"):
+            shutil.move(path, tmpdirname)
         api.upload_folder(repo_id=repo_id, folder_path=tmpdirname, repo_type="dataset")
 
 
@@ -113,11 +126,84 @@ def process_file(directory_name: str, file_path: str) -> Dict[str, str]:
     }
 
 
-def read_repository_files(directory) -> pd.DataFrame:
-    """Reads the files from the locally cloned repositories."""
+class ShardWriter:
+    """Appends rows to Arrow record batches and streams them into size-bounded shards.
+
+    Shards are named `{prefix}_{n:05d}.{file_format}` (Feather or Parquet) and closed after
+    `max_rows` rows or `max_bytes` bytes, so at most one record batch is held in memory.
+    """
+
+    def __init__(
+        self,
+        prefix: str,
+        file_format: str = SHARD_FORMAT,
+        max_rows: int = None,
+        max_bytes: int = SHARD_MAX_BYTES,
+    ):
+        self.prefix = prefix
+        self.file_format = file_format
+        self.max_rows = max_rows
+        self.max_bytes = max_bytes
+        self.paths: List[str] = []
+        self.rows = 0
+        self._columns = {name: [] for name in COLUMNS}
+        self._buffered_bytes = 0
+        self._writer = None
+        self._shard_rows = 0
+        self._shard_bytes = 0
+
+    def write(self, row: Dict[str, str]):
+        for name in COLUMNS:
+            self._columns[name].append(row[name])
+        self._buffered_bytes += len(row["content"])
+        buffered = len(self._columns["content"])
+        shard_room = self.max_rows - self._shard_rows if self.max_rows else BATCH_ROWS
+        if buffered >= min(BATCH_ROWS, shard_room) or self._buffered_bytes >= BATCH_MAX_BYTES:
+            self._flush_batch()
+
+    def _flush_batch(self):
+        if not self._columns["content"]:
+            return
+        batch = pa.RecordBatch.from_pydict(self._columns, schema=SCHEMA)
+        self._columns = {name: [] for name in COLUMNS}
+        self._buffered_bytes = 0
+        if self._writer is None:
+            path = f"{self.prefix}_{len(self.paths):05d}.{self.file_format}"
+            print(f"Serializing rows to {path}...")
+            if self.file_format == PARQUET_FORMAT:
+                self._writer = pq.ParquetWriter(path, SCHEMA)
+            else:  # Feather v2 is the Arrow IPC file format
+                self._writer = pa.ipc.new_file(path, SCHEMA, options=pa.ipc.IpcWriteOptions(compression="lz4"))
+            self.paths.append(path)
+        self._writer.write_batch(batch)
+        self.rows += batch.num_rows
+        self._shard_rows += batch.num_rows
+        self._shard_bytes += batch.nbytes
+        if (self.max_rows and self._shard_rows >= self.max_rows) or self._shard_bytes >= self.max_bytes:
+            self._close_shard()
+
+    def _close_shard(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        self._shard_rows = self._shard_bytes = 0
+
+    def close(self) -> List[str]:
+        """Flushes the last batch and closes the current shard; returns all shard paths."""
+        self._flush_batch()
+        self._close_shard()
+        return self.paths
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def list_repository_files(directory) -> List[Tuple[str, str]]:
+    """(repository directory, file path) for every file worth reading in the mirror."""
     file_paths = []
-    df = pd.DataFrame(columns=["repo_id", "file_path", "content"])
-    chunk_flag = 0
 
     # Recursively find all files within the directory
     for root, _, files in os.walk(directory):
@@ -127,39 +213,51 @@ def read_repository_files(directory) -> pd.DataFrame:
                 k not in file_path for k in [".git", "__pycache__", "xcodeproj"]
             ):
                 file_paths.append((os.path.dirname(root), file_path))
+    return file_paths
+
 
-    # Process files sequentially.
+def iter_repository_rows(directory) -> Iterator[Dict[str, str]]:
+    """Yields one row per non-empty file, reading the files sequentially."""
+    file_paths = list_repository_files(directory)
     print(f"Total file paths: {len(file_paths)}.")
     print("Reading file contents...")
 
-    for i, (directory_name, file_path) in enumerate(tqdm(file_paths)):
+    for directory_name, file_path in tqdm(file_paths):
         file_content = process_file(directory_name, file_path)
-
         if file_content["content"] != "":
-            temp_df = pd.DataFrame.from_dict([file_content])
-            df = pd.concat([df, temp_df])
+            yield file_content
 
-            if (
-                SERIALIZE_IN_CHUNKS
-                and len(df) != 0
-                and (len(df) % SERIALIZE_IN_CHUNKS == 0)
-            ):
-                df_path = f"df_chunk_{chunk_flag}_{len(df)}.{FEATHER_FORMAT}"
-                print(f"Serializing dataframe to {df_path}...")
-                df.reset_index().to_feather(df_path)
-                del df
-                df = pd.DataFrame(columns=["repo_id", "file_path", "content"])
-                chunk_flag += 1
 
-    return df
+def write_repository_shards(directory, prefix: str = "df_chunk", max_rows: int = None) -> List[str]:
+    """Streams the mirror's files into Feather/Parquet shards; returns the shard paths."""
+    with ShardWriter(prefix, SHARD_FORMAT, max_rows=max_rows) as writer:
+        for row in iter_repository_rows(directory):
+            writer.write(row)
+    print(f"{writer.rows} rows in {len(writer.paths)} shards.")
+    return writer.paths
+
+
+def read_repository_files(directory) -> pd.DataFrame:
+    """Reads the files from the locally cloned repositories."""
+    batches, columns = [], {name: [] for name in COLUMNS}
+    for row in iter_repository_rows(directory):
+        for name in COLUMNS:
+            columns[name].append(row[name])
+        if len(columns["content"]) >= BATCH_ROWS:
+            batches.append(pa.RecordBatch.from_pydict(columns, schema=SCHEMA))
+            columns = {name: [] for name in COLUMNS}
+    batches.append(pa.RecordBatch.from_pydict(columns, schema=SCHEMA))
+    return pa.Table.from_batches(batches, schema=SCHEMA).to_pandas()
 
 
 if __name__ == "__main__":
-    df = read_repository_files(MIRROR_DIRECTORY)
-    print(f"DataFrame created with shape: {df.shape}")
-    print(df.head())
-    upload_to_hub(file_format=FEATHER_FORMAT, repo_id=DATASET_ID)
-    print(f"{FEATHER_FORMAT} files uploaded to the Hub.")
-    if not SERIALIZE_IN_CHUNKS:
+    if SERIALIZE_IN_CHUNKS:
+        write_repository_shards(MIRROR_DIRECTORY, max_rows=SERIALIZE_IN_CHUNKS)
+        upload_to_hub(file_format=SHARD_FORMAT, repo_id=DATASET_ID)
+        print(f"{SHARD_FORMAT} files uploaded to the Hub.")
+    else:
+        df = read_repository_files(MIRROR_DIRECTORY)
+        print(f"DataFrame created with shape: {df.shape}")
+        print(df.head())
         dataset = Dataset.from_pandas(df)
         dataset.push_to_hub(DATASET_ID, private=True)
@@ -1,9 +1,68 @@
+"""
+Concatenate the LangChain docs tree into a single llms-full.txt.
+
+Files are converted across a process pool (notebook conversion dominates the runtime), but
+written in exactly the `get_files_in_order` order: a bounded window of conversions runs ahead
+of the writer, and each result is written as soon as every file before it is done, so memory
+stays flat however large the tree is.
+
+Rebuilds are incremental: a manifest in the cache directory records each source file's
+(mtime, size, content hash), and the converted markdown of every file is kept there as a
+fragment named by that hash. A run only stats the tree, re-hashes files whose stat changed,
+reconverts the ones whose content really changed (or are new), drops removed ones, and
+reassembles the output from the fragments; when nothing changed and the output is intact it
+is not rewritten at all. Editing this script, upgrading nbconvert or changing the notebook
+options invalidates the cache.
+
+Notebooks are converted natively by default: the .ipynb JSON is parsed once and markdown cells,
+fenced code cells and their text outputs (truncated to --max-output-lines) are written
+directly, without importing nbconvert at all. `--nbconvert` switches back to nbconvert's
+MarkdownExporter for exact nbconvert output.
+
+With --shard-tokens N the same text is written as shards of at most N tokens (counted with
+tiktoken, LLMSTXT_ENCODING) plus an index.json mapping every markdown heading to its
+shard, byte offset, length and token count, so a consumer can seek straight to one section
+instead of loading the whole file. Whole files are kept in one shard when they fit; larger
+ones are split at headings (and, if a single section is still too big, between lines). The
+shards concatenated are byte-identical to llms-full.txt.
+
+Usage:
+    python generate_llmstxt.py                                    # default docs root, all cores
+    python generate_llmstxt.py --docs-root ~/repos/langchain/docs/docs --workers 8
+    python generate_llmstxt.py --rebuild                          # ignore the cache, reconvert everything
+    python generate_llmstxt.py --no-cache                         # full build, cache untouched
+    python generate_llmstxt.py --nbconvert                        # convert notebooks with nbconvert
+    python generate_llmstxt.py --shard-tokens 100000              # llms-shards/llms-full.NNNNN.txt + index.json
+    python generate_llmstxt.py --lookup "Streaming" --output llms-shards   # print the matching sections
+    python generate_llmstxt.py --bench-notebooks                  # native vs nbconvert: startup + per file
+    python generate_llmstxt.py --bench 1 2 4 8                    # wall-clock speedup per worker count
+"""
+import argparse
+import hashlib
 import os
 import re
 import json
+import subprocess
+import sys
+import tempfile
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
 from pathlib import Path
-from nbconvert import MarkdownExporter
-import nbformat
+
+DOCS_ROOT = Path(os.getenv('LLMSTXT_DOCS_ROOT', '/home/nauman/repos/langchain/docs/docs'))
+WORKERS = os.cpu_count() or 1
+WINDOW_PER_WORKER = 4   # conversions allowed to run ahead of the writer, per worker
+CACHE_ROOT = Path(os.getenv('LLMSTXT_CACHE', '~/.cache/llmstxt')).expanduser()
+NOTEBOOK_CONVERTER = os.getenv('LLMSTXT_NOTEBOOKS', 'native')              # or 'nbconvert'
+MAX_OUTPUT_LINES = int(os.getenv('LLMSTXT_MAX_OUTPUT_LINES', 40))        # per cell output; 0 drops outputs, -1 keeps all
+ANSI_ESCAPE = re.compile(r'\x1b\[[0-9;]*[A-Za-z]')
+SHARD_TOKENS = int(os.getenv('LLMSTXT_SHARD_TOKENS', 0)) or None      # None: single llms-full.txt
+ENCODING = os.getenv('LLMSTXT_ENCODING', 'o200k_base')                  # tiktoken encoding for shard budgets
+HEADING = re.compile(r'^(#{1,6})[ \t]+(.+?)[ \t#]*$')
+FENCE = re.compile(r'^ {0,3}(```|~~~)')
+RAW_MIMETYPES = {'', 'text/markdown', 'text/html'}                       # raw cells nbconvert's markdown exporter keeps
 
 # Directories to ignore
 IGNORE_DIRS = {
@@ -27,21 +86,86 @@ DIRECTORY_ORDER = [
     'troubleshooting'  # Troubleshooting at the end
 ]
 
+def configure(notebook_converter=None, max_output_lines=None):
+    """Set the notebook options; also run in every pool worker so they match the parent."""
+    global NOTEBOOK_CONVERTER, MAX_OUTPUT_LINES
+    if notebook_converter is not None:
+        NOTEBOOK_CONVERTER = notebook_converter
+    if max_output_lines is not None:
+        MAX_OUTPUT_LINES = max_output_lines
+
+@lru_cache(maxsize=None)
+def _markdown_exporter():
+    """One MarkdownExporter per process (building it loads the Jinja templates)."""
+    from nbconvert import MarkdownExporter
+    return MarkdownExporter()
+
+def _nbconvert_markdown(notebook_path):
+    import nbformat
+
+    nb = nbformat.read(notebook_path, as_version=4)
+    markdown, _ = _markdown_exporter().from_notebook_node(nb)
+    return markdown
+
+def _joined(source):
+    # nbformat stores multiline strings either as one string or as a list of lines
+    return ''.join(source) if isinstance(source, list) else source or ''
+
+def _output_text(output):
+    kind = output.get('output_type')
+    if kind == 'stream':
+        return ANSI_ESCAPE.sub('', _joined(output.get('text')))
+    if kind in ('execute_result', 'display_data'):
+        data = output.get('data', {})
+        if 'text/markdown' in data:
+            return _joined(data['text/markdown'])
+        return _joined(data.get('text/plain'))      # images and HTML-only outputs are dropped
+    if kind == 'error':
+        return f"{output.get('ename', 'Error')}: {output.get('evalue', '')}"
+    return ''
+
+def _truncated(lines, limit):
+    if limit < 0 or len(lines) <= limit:
+        return lines
+    return lines[:limit] + [f"... ({len(lines) - limit} more lines)"]
+
+def native_notebook_markdown(notebook_path, max_output_lines=None):
+    """Markdown for a notebook from one JSON parse: markdown cells, fenced code, text outputs."""
+    limit = MAX_OUTPUT_LINES if max_output_lines is None else max_output_lines
+    with open(notebook_path, 'r', encoding='utf-8') as f:
+        nb = json.load(f)
+    metadata = nb.get('metadata') or {}
+    language = ((metadata.get('language_info') or {}).get('name')
+                or (metadata.get('kernelspec') or {}).get('language') or 'python')
+
+    blocks = []
+    for cell in nb.get('cells', []):
+        source = _joined(cell.get('source')).rstrip('\n')
+        kind = cell.get('cell_type')
+        if kind == 'markdown':
+            blocks.append(source)
+        elif kind == 'raw':
+            if ((cell.get('metadata') or {}).get('raw_mimetype') or '').lower() in RAW_MIMETYPES:
+                blocks.append(source)
+        elif kind == 'code':
+            if source.strip():
+                blocks.append(f"```{language}\n{source}\n```")
+            if limit == 0:
+                continue
+            lines = [line for output in cell.get('outputs', []) for line in _output_text(output).splitlines()]
+            if lines:
+                blocks.append('\n'.join('    ' + line for line in _truncated(lines, limit)))
+    return '\n\n'.join(block for block in blocks if block.strip()) + '\n'
+
+def _notebook_markdown(notebook_path):
+    if NOTEBOOK_CONVERTER == 'nbconvert':
+        return _nbconvert_markdown(notebook_path)
+    return native_notebook_markdown(notebook_path)
+
 def convert_notebook_to_md(notebook_path):
     """Convert Jupyter notebook to markdown."""
     try:
-        with open(notebook_path, 'r', encoding='utf-8') as f:
-            notebook_content = json.load(f)
-        
-        # Create a notebook object
-        nb = nbformat.reads(json.dumps(notebook_content), as_version=4)
-        
-        # Configure and create the markdown exporter
-        md_exporter = MarkdownExporter()
-        
-        # Convert notebook to markdown
-        markdown, _ = md_exporter.from_notebook_node(nb)
-        return markdown
+        return _notebook_markdown(notebook_path)
     except Exception as e:
         print(f"Error converting notebook {notebook_path}: {str(e)}")
         return f"Error converting notebook {notebook_path}\n\n"
@@ -56,7 +180,7 @@ def convert_mdx_to_md(content):
     content = re.sub(r'<[^>]+>', '', content)
     return content.strip()
 
-def process_file(file_path):
+def process_file(file_path, docs_root=DOCS_ROOT):
     """Process a single file and return its markdown content."""
     try:
         # Handle Jupyter notebooks
@@ -77,6 +201,27 @@ def process_file(file_path):
         print(f"Error processing file {file_path}: {str(e)}")
         return f"Error processing file {file_path}\n\n"
 
+def file_header(file_path, docs_root=DOCS_ROOT):
+    return f"\n\n# {file_path.relative_to(docs_root)}\n\n"
+
+def convert_for_cache(file_path, docs_root=DOCS_ROOT):
+    """Return (section, fragment) for one file; fragment is None when conversion failed.
+
+    `section` is exactly what `process_file` returns. `fragment` is the same text without the
+    per-path header, so a renamed file can reuse it. Failures are not cached, and they are
+    retried on the next run.
+    """
+    try:
+        if file_path.suffix == '.ipynb':
+            fragment = _notebook_markdown(file_path)
+        else:
+            fragment = file_path.read_text(encoding='utf-8')
+            if file_path.suffix == '.mdx':
+                fragment = convert_mdx_to_md(fragment)
+        return file_header(file_path, docs_root) + fragment, fragment
+    except Exception:
+        return process_file(file_path, docs_root), None
+
 def should_process_directory(dir_path):
     """Check if directory should be processed."""
     dir_name = dir_path.name
@@ -112,17 +257,428 @@ def get_files_in_order(root_dir):
     
     return ordered_files
 
-if __name__ == '__main__':
-    # Set the root directory
-    docs_root = Path('/home/nauman/repos/langchain/docs/docs')
-    output_file = docs_root / 'llms-full.txt'
-    
-    # Process all files
-    with open(output_file, 'w', encoding='utf-8') as out_f:
-        files = get_files_in_order(docs_root)
+def iter_converted(files, docs_root=DOCS_ROOT, workers=WORKERS, convert=process_file):
+    """Yield (file_path, convert(file_path, docs_root)) for `files` in order, converting notebooks in `workers` processes.
+
+    .md/.mdx files are cheap and are converted inline by the writer (shipping them to a worker
+    costs more than converting them); notebooks further down the list run ahead in the pool, at
+    most `workers * WINDOW_PER_WORKER` of them converted-or-converting at any time.
+    """
+    if workers <= 1:
         for file_path in files:
+            yield file_path, convert(file_path, docs_root)
+        return
+
+    limit = workers * WINDOW_PER_WORKER
+    with ProcessPoolExecutor(max_workers=workers, initializer=configure,
+                             initargs=(NOTEBOOK_CONVERTER, MAX_OUTPUT_LINES)) as pool:
+        pending = deque()              # (path, future or None) in output order
+        in_flight = 0
+        files = iter(files)
+
+        def fill():
+            nonlocal in_flight
+            while in_flight < limit and (file_path := next(files, None)) is not None:
+                future = None
+                if file_path.suffix == '.ipynb':
+                    future = pool.submit(convert, file_path, docs_root)
+                    in_flight += 1
+                pending.append((file_path, future))
+
+        fill()
+        while pending:
+            file_path, future = pending.popleft()
+            if future is None:
+                yield file_path, convert(file_path, docs_root)
+            else:
+                content = future.result()
+                in_flight -= 1
+                fill()
+                yield file_path, content
+
+@lru_cache(maxsize=None)
+def _encoder():
+    """tiktoken encoder for ENCODING, or None (with a warning) to fall back to characters / 4."""
+    try:
+        import tiktoken
+    except ImportError:
+        print("tiktoken is not installed; estimating tokens as characters / 4")
+        return None
+    return tiktoken.get_encoding(ENCODING)
+
+def tokenizer_name():
+    return f"tiktoken:{ENCODING}" if _encoder() else "chars/4"
+
+def count_tokens(text):
+    encoder = _encoder()
+    if encoder is None:
+        return (len(text) + 3) // 4
+    return len(encoder.encode(text, disallowed_special=()))
+
+def split_headings(text):
+    """Split text before every markdown heading outside code fences; returns [(heading, level, piece)].
+
+    The pieces concatenate back to `text`; a piece before the first heading has heading None.
+    """
+    pieces, start, pos, fence, current = [], 0, 0, None, (None, 0)
+    for line in text.splitlines(keepends=True):
+        if m := FENCE.match(line):
+            fence = None if fence == m.group(1) else fence or m.group(1)
+        elif fence is None and (h := HEADING.match(line)):
+            if pos > start:
+                pieces.append((*current, text[start:pos]))
+            start, current = pos, (h.group(2).strip(), len(h.group(1)))
+        pos += len(line)
+    if pos > start:
+        pieces.append((*current, text[start:]))
+    return pieces
+
+def _split_line(line, budget):
+    """Pieces of one over-budget line, each at most `budget` tokens, cut between characters.
+
+    The longest fitting prefix is found by bisection over a window of `budget * 32` characters
+    (no token is that long on average), so a huge minified line costs O(log) counts per piece.
+    """
+    pieces = []
+    while line:
+        lo, hi = 1, min(len(line), budget * 32)
+        while lo < hi:
+            mid = (lo + hi + 1) // 2
+            if count_tokens(line[:mid]) <= budget:
+                lo = mid
+            else:
+                hi = mid - 1
+        pieces.append((line[:lo], count_tokens(line[:lo])))
+        line = line[lo:]
+    return pieces
+
+def _split_lines(piece, budget):
+    """Chunks of `piece` of at most `budget` tokens, cut between lines (a longer line is cut inside)."""
+    chunks, lines, used = [], [], 0
+    for line in piece.splitlines(keepends=True):
+        tokens = count_tokens(line)
+        if lines and used + tokens > budget:
+            chunks.append((''.join(lines), used))
+            lines, used = [], 0
+        if tokens > budget:
+            chunks.extend(_split_line(line, budget))
+            continue
+        lines.append(line)
+        used += tokens
+    if lines:
+        chunks.append((''.join(lines), used))
+    return chunks
+
+def write_shards(sections, out_dir, budget):
+    """Write (relative path, text) sections as token-budgeted shards plus index.json; returns the index path."""
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    shards, entries = [], []
+    shard, used, offset = None, 0, 0
+
+    def start_shard():
+        nonlocal shard, used, offset
+        if shard:
+            shard.close()
+        name = f"llms-full.{len(shards):05d}.txt"
+        shards.append({'file': name, 'tokens': 0, 'bytes': 0})
+        shard, used, offset = open(out_dir / name, 'wb'), 0, 0
+
+    def write(rel, heading, level, text, tokens, continued=False):
+        nonlocal used, offset
+        if shard is None or (used and used + tokens > budget):
+            start_shard()
+        data = text.encode('utf-8')
+        if heading is not None:
+            entries.append({'heading': heading, 'level': level, 'file': rel, 'shard': shards[-1]['file'],
+                            'offset': offset, 'bytes': len(data), 'tokens': tokens, 'continued': continued})
+        shard.write(data)
+        used, offset = used + tokens, offset + len(data)
+        shards[-1]['tokens'], shards[-1]['bytes'] = used, offset
+
+    try:
+        for rel, text in sections:
+            pieces = [(heading, level, piece, count_tokens(piece)) for heading, level, piece in split_headings(text)]
+            total = sum(p[3] for p in pieces)
+            if used and used + total > budget and total <= budget:
+                start_shard()                                   # keep the whole file in one shard
+            for heading, level, piece, tokens in pieces:
+                if tokens <= budget:
+                    write(rel, heading, level, piece, tokens)
+                    continue
+                for i, (chunk, chunk_tokens) in enumerate(_split_lines(piece, budget)):
+                    write(rel, heading, level, chunk, chunk_tokens, continued=i > 0)
+    finally:
+        if shard:
+            shard.close()
+
+    names = {s['file'] for s in shards}
+    for old in out_dir.glob('llms-full.*.txt'):                 # shards left over from a larger build
+        if old.name not in names:
+            old.unlink()
+    index = out_dir / 'index.json'
+    tmp = index.with_suffix('.tmp')
+    tmp.write_text(json.dumps({'tokenizer': tokenizer_name(), 'budget': budget, 'shards': shards,
+                               'sections': entries}, indent=1), encoding='utf-8')
+    os.replace(tmp, index)
+    return index
+
+def read_section(out_dir, entry, index=None):
+    """Text of one index entry plus its subsections and continuations, read by seeking into the shards."""
+    out_dir = Path(out_dir)
+    sections = (index or json.loads((out_dir / 'index.json').read_text(encoding='utf-8')))['sections']
+    start = next(i for i, e in enumerate(sections) if e == entry)
+    parts = []
+    for i, e in enumerate(sections[start:]):
+        if i and (e['file'] != entry['file'] or not e['continued'] and e['level'] <= entry['level']):
+            break
+        with open(out_dir / e['shard'], 'rb') as f:
+            f.seek(e['offset'])
+            parts.append(f.read(e['bytes']))
+    return b''.join(parts).decode('utf-8')
+
+def lookup(out_dir, query):
+    """Index entries whose heading or file path contains `query` (case-insensitive)."""
+    index = json.loads((Path(out_dir) / 'index.json').read_text(encoding='utf-8'))
+    query = query.lower()
+    return index, [e for e in index['sections']
+                   if not e['continued'] and (query in e['heading'].lower() or query in e['file'].lower())]
+
+def write_output(sections, output_file, shard_tokens=None):
+    """Write (relative path, text) sections to `output_file`, or as shards into that directory."""
+    if shard_tokens:
+        return write_shards(sections, output_file, shard_tokens)
+    with open(output_file, 'w', encoding='utf-8') as out_f:
+        for _, text in sections:
+            out_f.write(text)
+    return output_file
+
+def default_cache_dir(docs_root):
+    """Per-docs-tree cache directory under CACHE_ROOT."""
+    key = hashlib.sha256(str(Path(docs_root).resolve()).encode()).hexdigest()[:16]
+    return CACHE_ROOT / key
+
+@lru_cache(maxsize=None)
+def _converter_key():
+    """Changes whenever the conversion could change: this script or the installed nbconvert."""
+    from importlib.metadata import PackageNotFoundError, version
+
+    try:
+        nbconvert = version('nbconvert')
+    except PackageNotFoundError:
+        nbconvert = None
+    return hashlib.sha256(Path(__file__).read_bytes() + f'nbconvert={nbconvert}'.encode()).hexdigest()
+
+def _cache_key():
+    return f"{_converter_key()}:{NOTEBOOK_CONVERTER}:{MAX_OUTPUT_LINES}"
+
+def _content_digest(file_path):
+    # Fragments are named by this, so it covers everything the conversion depends on: the
+    # converter (see _cache_key), the suffix (.md and .mdx convert differently) and the bytes.
+    key = f"{_cache_key()}:{file_path.suffix}".encode()
+    return hashlib.sha256(key + b'\0' + file_path.read_bytes()).hexdigest()
+
+def load_manifest(cache_dir):
+    """The cache manifest, or an empty one if it is missing, unreadable or from another converter."""
+    try:
+        manifest = json.loads((cache_dir / 'manifest.json').read_text(encoding='utf-8'))
+        if manifest.get('converter') == _cache_key():
+            return manifest
+    except (OSError, ValueError):
+        pass
+    return {'converter': _cache_key(), 'files': {}, 'output': None}
+
+def save_manifest(cache_dir, manifest):
+    path = cache_dir / 'manifest.json'
+    tmp = path.with_suffix('.tmp')
+    tmp.write_text(json.dumps(manifest), encoding='utf-8')
+    os.replace(tmp, path)
+
+def _output_stat(output_file):
+    try:
+        st = os.stat(output_file)
+    except FileNotFoundError:
+        return None
+    return [str(Path(output_file).resolve()), st.st_mtime_ns, st.st_size]
+
+def generate(docs_root=DOCS_ROOT, output_file=None, workers=WORKERS, verbose=True, cache_dir=None, rebuild=False,
+             shard_tokens=SHARD_TOKENS):
+    """Write llms-full.txt for `docs_root`; returns (output path, number of files, seconds).
+
+    With `cache_dir`, only new or changed files are converted (see the module docstring);
+    `rebuild` ignores the existing manifest and reconverts everything. With `shard_tokens`,
+    `output_file` is a directory of shards and the returned path is its index.json.
+    """
+    if shard_tokens:
+        output_file = output_file or docs_root / 'llms-shards'
+        target = Path(output_file) / 'index.json'
+    else:
+        output_file = target = output_file or docs_root / 'llms-full.txt'
+    started = time.perf_counter()
+    files = get_files_in_order(docs_root)
+    if cache_dir is None:
+        def sections():
+            for file_path, content in iter_converted(files, docs_root, workers):
+                if verbose:
+                    print(f"Processing: {file_path}")
+                yield str(file_path.relative_to(docs_root)), content + '\n\n'
+        target = write_output(sections(), output_file, shard_tokens)
+        return target, len(files), time.perf_counter() - started
+
+    fragments_dir = cache_dir / 'fragments'
+    fragments_dir.mkdir(parents=True, exist_ok=True)
+    old = {'converter': _cache_key(), 'files': {}, 'output': None} if rebuild else load_manifest(cache_dir)
+    entries, stale, hashed = {}, [], 0
+    for file_path in files:
+        rel = str(file_path.relative_to(docs_root))
+        st = file_path.stat()
+        entry = old['files'].get(rel)
+        if entry is None or (entry[0], entry[1]) != (st.st_mtime_ns, st.st_size):
+            digest = _content_digest(file_path)       # stat changed: hash to see if the content did
+            hashed += 1
+            entry = [st.st_mtime_ns, st.st_size, digest]
+        if rebuild or not (fragments_dir / f'{entry[2]}.md').exists():
+            stale.append(file_path)
+        entries[rel] = entry
+    removed = len(old['files'].keys() - entries.keys())
+
+    failed = {}                                       # path -> section text for files that didn't convert
+    for file_path, (section, fragment) in iter_converted(stale, docs_root, workers, convert_for_cache):
+        if verbose:
             print(f"Processing: {file_path}")
-            content = process_file(file_path)
-            out_f.write(content + '\n\n')
-    
-    print(f"\nDocumentation has been generated at: {output_file}")
+        if fragment is None:
+            failed[file_path] = section
+            continue
+        path = fragments_dir / f'{entries[str(file_path.relative_to(docs_root))][2]}.md'
+        tmp = path.with_suffix('.tmp')
+        tmp.write_text(fragment, encoding='utf-8')
+        os.replace(tmp, path)
+
+    shape = [shard_tokens, shard_tokens and tokenizer_name()]
+    layout = hashlib.sha256(json.dumps([shape, [[rel, e[2]] for rel, e in entries.items()]]).encode()).hexdigest()
+    output = old.get('output') or {}
+    unchanged = (not stale and not failed and output.get('layout') == layout
+                 and output.get('stat') == _output_stat(target))
+
+    def sections():
+        for file_path in files:
+            rel = str(file_path.relative_to(docs_root))
+            if file_path in failed:
+                yield rel, failed[file_path] + '\n\n'
+                continue
+            fragment = (fragments_dir / f'{entries[rel][2]}.md').read_text(encoding='utf-8')
+            yield rel, file_header(file_path, docs_root) + fragment + '\n\n'
+
+    if not unchanged:
+        write_output(sections(), output_file, shard_tokens)
+
+    # Failed files stay out of the manifest so they are retried next time.
+    manifest = {
+        'converter': _cache_key(),
+        'files': {rel: e for rel, e in entries.items() if docs_root / rel not in failed},
+        'output': {'layout': layout, 'stat': _output_stat(target)} if not failed else None,
+    }
+    save_manifest(cache_dir, manifest)
+    live = {f"{e[2]}.md" for e in manifest['files'].values()}
+    for path in fragments_dir.iterdir():
+        if path.name not in live:
+            path.unlink()
+    if verbose:
+        print(f"Cache {cache_dir}: {len(stale) - len(failed)} converted, {len(failed)} failed, "
+              f"{len(files) - len(stale)} reused, {removed} removed, {hashed} re-hashed"
+              f"{', output unchanged' if unchanged else ''}")
+    return target, len(files), time.perf_counter() - started
+
+def bench(docs_root, worker_counts):
+    """Time a full build per worker count, checking every build is byte-identical."""
+    results, reference = [], None
+    with tempfile.TemporaryDirectory() as tmp:
+        for workers in worker_counts:
+            output, n_files, seconds = generate(docs_root, Path(tmp) / f'llms-full.{workers}.txt', workers, verbose=False,
+                                                shard_tokens=None)
+            digest = hashlib.sha256(output.read_bytes()).hexdigest()
+            reference = reference or digest
+            results.append((workers, n_files, seconds, digest == reference))
+    base = results[0][2]
+    print(f"{'workers':>7} {'files':>6} {'seconds':>8} {'speedup':>8}  identical")
+    for workers, n_files, seconds, same in results:
+        print(f"{workers:>7} {n_files:>6} {seconds:>8.2f} {base / seconds:>7.2f}x  {same}")
+    return results
+
+def _cold_start(converter, notebook_path):
+    """Seconds from a fresh interpreter to the first converted notebook (imports included)."""
+    code = ("import time; started = time.perf_counter(); from pathlib import Path; import generate_llmstxt as g; "
+            f"g.configure({converter!r}); g._notebook_markdown(Path({str(notebook_path)!r})); "
+            "print(time.perf_counter() - started)")
+    run = subprocess.run([sys.executable, '-c', code], cwd=Path(__file__).parent, capture_output=True, text=True)
+    return float(run.stdout) if run.returncode == 0 else None
+
+def bench_notebooks(docs_root, repeats=3):
+    """Compare the native and nbconvert converters: cold start and warm ms per notebook."""
+    notebooks = [f for f in get_files_in_order(docs_root) if f.suffix == '.ipynb']
+    if not notebooks:
+        print(f"No notebooks under {docs_root}")
+        return {}
+    results = {}
+    for converter in ('native', 'nbconvert'):
+        starts = [_cold_start(converter, notebooks[0]) for _ in range(repeats)]
+        if None in starts:
+            print(f"{converter}: unavailable (is it installed?)")
+            continue
+        configure(converter)
+        _notebook_markdown(notebooks[0])
+        started = time.perf_counter()
+        size = sum(len(_notebook_markdown(f)) for f in notebooks)
+        per_file = (time.perf_counter() - started) / len(notebooks)
+        results[converter] = (min(starts), per_file, size)
+    print(f"{len(notebooks)} notebooks")
+    print(f"{'converter':>10} {'cold start':>11} {'ms/notebook':>12} {'chars':>10}")
+    for converter, (start, per_file, size) in results.items():
+        print(f"{converter:>10} {start:>10.3f}s {per_file * 1e3:>12.2f} {size:>10}")
+    if len(results) == 2:
+        (nb_start, nb_file, _), (na_start, na_file, _) = results['nbconvert'], results['native']
+        print(f"native speedup: {nb_start / na_start:.1f}x cold start, {nb_file / na_file:.1f}x per notebook")
+    return results
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Concatenate a docs tree into llms-full.txt.")
+    parser.add_argument('--docs-root', type=Path, default=DOCS_ROOT, help="Root of the docs tree")
+    parser.add_argument('--output', type=Path, default=None,
+                        help="Output file (default: <docs-root>/llms-full.txt), or directory with --shard-tokens "
+                             "(default: <docs-root>/llms-shards)")
+    parser.add_argument('--workers', type=int, default=WORKERS, help="Conversion processes (1 = sequential)")
+    parser.add_argument('--cache-dir', type=Path, default=None,
+                        help="Conversion cache (default: $LLMSTXT_CACHE/<hash of docs root>)")
+    parser.add_argument('--no-cache', action='store_true', help="Convert every file and leave the cache alone")
+    parser.add_argument('--rebuild', action='store_true', help="Ignore the cache manifest and reconvert everything")
+    parser.add_argument('--shard-tokens', type=int, default=SHARD_TOKENS,
+                        help="Write shards of at most this many tokens plus index.json instead of one file")
+    parser.add_argument('--lookup', default=None, metavar='QUERY',
+                        help="Print the indexed sections whose heading or file matches QUERY (reads --output)")
+    parser.add_argument('--nbconvert', action='store_true', help="Convert notebooks with nbconvert instead of natively")
+    parser.add_argument('--max-output-lines', type=int, default=MAX_OUTPUT_LINES,
+                        help="Native converter: lines kept per code cell output (0 drops outputs, -1 keeps all)")
+    parser.add_argument('--bench-notebooks', action='store_true',
+                        help="Only compare native and nbconvert notebook conversion (startup and per file)")
+    parser.add_argument('--bench', type=int, nargs='+', default=None, metavar='N',
+                        help="Only time full builds with these worker counts and report the speedup")
+    args = parser.parse_args()
+    configure('nbconvert' if args.nbconvert else None, args.max_output_lines)
+
+    if args.lookup:
+        shard_dir = args.output or args.docs_root / 'llms-shards'
+        index, matches = lookup(shard_dir, args.lookup)
+        for entry in matches:
+            print(f"── {entry['file']} › {entry['heading']} ({entry['shard']} @ {entry['offset']}, {entry['tokens']} tokens)")
+            print(read_section(shard_dir, entry, index))
+    elif args.bench_notebooks:
+        bench_notebooks(args.docs_root)
+    elif args.bench:
+        bench(args.docs_root, args.bench)
+    else:
+        cache_dir = None if args.no_cache else args.cache_dir or default_cache_dir(args.docs_root)
+        output_file, n_files, seconds = generate(args.docs_root, args.output, args.workers,
+                                                 cache_dir=cache_dir, rebuild=args.rebuild,
+                                                 shard_tokens=args.shard_tokens)
+        print(f"\nDocumentation has been generated at: {output_file}")
+        print(f"{n_files} files in {seconds:.1f}s with {args.workers} worker(s)")
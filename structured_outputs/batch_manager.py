@@ -0,0 +1,304 @@
+#!/usr/bin/env python
+"""
+batch_manager.py – submit, poll, download and resubmit many Batch-API jobs from one state file
+
+Every shard written by `garment_analyzer_batch.py` becomes a job that moves through
+
+    pending → uploaded → submitting → submitted → (validating/in_progress/finalizing) → terminal
+            → downloaded → done
+
+and the state file is rewritten atomically after every transition, so a crash (or Ctrl-C) at any
+point resumes where it stopped: an uploaded shard is not uploaded again, a finished batch is not
+downloaded twice.  `submitting` is saved (with the input file id) before the batch is created; a
+job found in that phase on resume first looks for a batch already created from its input file
+(batches carry the shard name in their metadata) and only creates one if there is none.
+
+Output and error files are downloaded as soon as a job reaches a terminal state.  Every custom_id
+of the shard that did not come back with a 200 (errors, failed requests, expired or cancelled
+batches) is written to a retry shard and submitted as a new job, up to `--max-attempts`.  A failed
+packed task (several images, see packing.py) is split in half for the retry, and a packed answer
+that left some image IDs out has just those images resubmitted.
+
+Usage:
+    python batch_manager.py run garment_batch_tasks-*.jsonl            # add shards, poll until done
+    python batch_manager.py run                                         # resume after a crash
+    python batch_manager.py status
+
+Set OPENAI_BASE_URL=http://127.0.0.1:8808/v1 to run against `mock_openai_server.py`.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import time
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+
+import httpx
+from dotenv import load_dotenv
+from openai import OpenAI, OpenAIError
+
+from clients import get_sync_client
+from packing import pack_ids, split_pack_task
+
+load_dotenv("/home/nauman/.env")
+
+STATE_FILE = Path("batch_state.json")
+RESULTS_DIR = Path("batch_results")
+ENDPOINT = "/v1/chat/completions"
+TERMINAL = {"completed", "failed", "expired", "cancelled"}
+
+
+@dataclass
+class Job:
+    shard: str                               # local input JSONL
+    attempt: int = 1
+    phase: str = "pending"                   # pending | uploaded | submitting | submitted | downloaded | done
+    status: str | None = None                # remote batch status
+    input_file_id: str | None = None
+    batch_id: str | None = None
+    submit_started: float | None = None      # when `submitting` began; bounds the resume lookup
+    output_path: str | None = None
+    error_path: str | None = None
+    succeeded: int = 0
+    retried: int = 0
+    note: str | None = None
+
+
+@dataclass
+class State:
+    jobs: list[Job] = field(default_factory=list)
+
+    @classmethod
+    def load(cls, path: Path) -> State:
+        if not path.exists():
+            return cls()
+        return cls([Job(**job) for job in json.loads(path.read_text())["jobs"]])
+
+    def save(self, path: Path) -> None:
+        """Atomic rewrite: a crash leaves either the old or the new state, never half of one."""
+        tmp = path.with_suffix(path.suffix + ".tmp")
+        tmp.write_text(json.dumps({"jobs": [asdict(job) for job in self.jobs]}, indent=2))
+        os.replace(tmp, path)
+
+
+def _answered_ids(entry: dict) -> set[str]:
+    """Image IDs in a packed answer (`{"items": [...]}`); empty for anything else."""
+    try:
+        items = json.loads(entry["response"]["body"]["choices"][0]["message"]["content"])["items"]
+        return {item["image_id"] for item in items}
+    except (KeyError, IndexError, TypeError, ValueError):
+        return set()
+
+
+class BatchManager:
+    """Drive every tracked job one step at a time; `run()` polls with backoff until all are done."""
+
+    def __init__(
+        self,
+        state_path: Path = STATE_FILE,
+        results_dir: Path = RESULTS_DIR,
+        window: str = "24h",
+        max_attempts: int = 3,
+        client: OpenAI | None = None,
+    ):
+        self.state_path = state_path
+        self.results_dir = results_dir
+        self.window = window
+        self.max_attempts = max_attempts
+        self.client = client or get_sync_client("openai")
+        self.state = State.load(state_path)
+        results_dir.mkdir(parents=True, exist_ok=True)
+
+    def _save(self) -> None:
+        self.state.save(self.state_path)
+
+    # ───────────────────────────────────────── public API ──
+    def add(self, shard: Path, attempt: int = 1) -> Job:
+        """Track a shard (idempotent: re-adding a tracked shard returns the existing job)."""
+        for job in self.state.jobs:
+            if job.shard == str(shard):
+                return job
+        job = Job(shard=str(shard), attempt=attempt)
+        self.state.jobs.append(job)
+        self._save()
+        return job
+
+    def pending(self) -> list[Job]:
+        return [job for job in self.state.jobs if job.phase != "done"]
+
+    def step(self) -> bool:
+        """Advance every unfinished job as far as it can go right now; True if anything changed."""
+        changed = False
+        for job in list(self.pending()):
+            try:
+                changed |= self._advance(job)
+            except (OpenAIError, httpx.HTTPError) as err:     # transient API/transport trouble: try again next poll
+                print(f"⚠️  {job.shard}: {err}")
+        return changed
+
+    def run(self, min_interval: float = 5.0, max_interval: float = 300.0) -> None:
+        """Poll until every job is done; the interval grows ×1.5 while nothing changes."""
+        interval = min_interval
+        while self.pending():
+            if self.step():
+                interval = min_interval
+            else:
+                interval = min(interval * 1.5, max_interval)
+            if self.pending():
+                time.sleep(interval)
+        self.print_status()
+
+    def print_status(self) -> None:
+        for job in self.state.jobs:
+            print(
+                f"{job.phase:<10} {job.status or '-':<11} attempt {job.attempt}  "
+                f"ok={job.succeeded:<6} retried={job.retried:<6} {job.shard}"
+                + (f"  ({job.note})" if job.note else "")
+            )
+
+    # ──────────────────────────────────────── transitions ──
+    def _advance(self, job: Job) -> bool:
+        changed = False
+        if job.phase == "pending":
+            with open(job.shard, "rb") as f:
+                job.input_file_id = self.client.files.create(file=f, purpose="batch").id
+            job.phase = "uploaded"
+            self._save()
+            print(f"📤  {job.shard} → {job.input_file_id}")
+            changed = True
+
+        if job.phase == "uploaded":
+            job.phase, job.submit_started = "submitting", time.time()
+            self._save()                                      # from here on a resume checks for an existing batch
+
+        if job.phase == "submitting":
+            batch = self._find_batch(job)
+            if batch is None:
+                batch = self.client.batches.create(
+                    input_file_id=job.input_file_id, endpoint=ENDPOINT, completion_window=self.window,
+                    metadata={"shard": Path(job.shard).name[:512], "attempt": str(job.attempt)},
+                )
+                print(f"🚀  {job.shard} → {batch.id}")
+            else:
+                print(f"🔗  {job.shard} → {batch.id} (created before the last interruption)")
+            job.batch_id, job.status, job.phase = batch.id, batch.status, "submitted"
+            self._save()
+            changed = True
+
+        if job.phase == "submitted":
+            batch = self.client.batches.retrieve(job.batch_id)
+            if batch.status != job.status:
+                job.status = batch.status
+                self._save()
+                changed = True
+            if batch.status in TERMINAL:
+                self._download(job, batch)
+                changed = True
+
+        if job.phase == "downloaded":
+            self._resubmit_failures(job)
+            changed = True
+        return changed
+
+    def _find_batch(self, job: Job):
+        """A batch already created from this job's input file (by an interrupted submit), or None."""
+        for batch in self.client.batches.list(limit=100):    # newest first; the SDK follows pages
+            if batch.input_file_id == job.input_file_id:
+                return batch
+            if job.submit_started and batch.created_at < job.submit_started - 300:
+                break                                         # older than this submit attempt (+ clock skew)
+        return None
+
+    def _download(self, job: Job, batch) -> None:
+        stem = Path(job.shard).stem
+        for attr, file_id in (("output_path", batch.output_file_id), ("error_path", batch.error_file_id)):
+            if file_id:
+                target = self.results_dir / f"{stem}.{attr.split('_')[0]}.jsonl"
+                with self.client.files.with_streaming_response.content(file_id) as response:
+                    response.stream_to_file(target)      # constant memory, however large the result file
+                setattr(job, attr, str(target))
+        if batch.status == "failed" and batch.errors:
+            job.note = "; ".join(e.message or "" for e in batch.errors.data or [])
+        job.phase = "downloaded"
+        self._save()
+        print(f"📥  {job.shard}: {batch.status}, files saved to {self.results_dir}")
+
+    def _resubmit_failures(self, job: Job) -> None:
+        """Write every custom_id without a 200 response to a retry shard and track it as a new job.
+
+        Failed packed tasks are split in half; packed answers missing some image IDs are retried
+        for those images only.
+        """
+        ok: dict[str, set[str]] = {}                        # custom_id → image IDs answered (packed tasks)
+        if job.output_path:
+            with open(job.output_path, encoding="utf-8") as f:
+                for line in f:
+                    entry = json.loads(line)
+                    if (entry.get("response") or {}).get("status_code") == 200:
+                        ok[entry["custom_id"]] = _answered_ids(entry)
+        job.succeeded = len(ok)
+
+        if job.status == "failed":
+            job.note = job.note or "batch failed validation; not resubmitted"
+        else:
+            retry = Path(job.shard).with_name(f"{Path(job.shard).stem}.retry{job.attempt}.jsonl")
+            can_retry = job.attempt < self.max_attempts
+            missing = 0
+            with open(job.shard, encoding="utf-8") as src, open(retry, "w", encoding="utf-8") as dst:
+                for line in src:
+                    task = json.loads(line)
+                    ids = pack_ids(task)
+                    if task["custom_id"] in ok:
+                        if not ids:
+                            continue
+                        left = [i for i in ids if i not in ok[task["custom_id"]]]
+                        if not left:
+                            continue
+                        parts = split_pack_task(task, left)
+                    else:
+                        parts = split_pack_task(task) if ids else [task]
+                    missing += 1
+                    if can_retry:
+                        for part in parts:
+                            dst.write(line if part is task else json.dumps(part) + "\n")
+            if missing and can_retry:
+                job.retried = missing
+                self.add(retry, attempt=job.attempt + 1)
+                print(f"🔁  {missing} request(s) from {job.shard} → {retry}")
+            else:
+                retry.unlink()
+                if missing:
+                    job.note = f"{missing} request(s) still failing after {job.attempt} attempt(s)"
+        job.phase = "done"
+        self._save()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Manage many Batch-API jobs from a local state file.")
+    parser.add_argument("command", choices=["run", "submit", "status"],
+                        help="run: submit + poll until done; submit: one step only; status: print state")
+    parser.add_argument("shards", nargs="*", type=Path, help="Task shards to add to the state file")
+    parser.add_argument("--state", type=Path, default=STATE_FILE, help="State file (JSON)")
+    parser.add_argument("--results-dir", type=Path, default=RESULTS_DIR, help="Where output/error files go")
+    parser.add_argument("--window", default="24h", help="Batch completion window")
+    parser.add_argument("--max-attempts", type=int, default=3, help="Submissions per custom_id, including the first")
+    parser.add_argument("--min-interval", type=float, default=5.0, help="Initial poll interval (s)")
+    parser.add_argument("--max-interval", type=float, default=300.0, help="Poll interval cap (s)")
+    args = parser.parse_args()
+
+    manager = BatchManager(args.state, args.results_dir, args.window, args.max_attempts)
+    for shard in args.shards:
+        manager.add(shard)
+    if args.command == "run":
+        manager.run(args.min_interval, args.max_interval)
+    elif args.command == "submit":
+        manager.step()
+        manager.print_status()
+    else:
+        manager.print_status()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,332 @@
+#!/usr/bin/env python
+"""
+benchmark.py – end-to-end throughput benchmark for the structured_outputs pipeline
+
+Generates a synthetic image set (and a synthetic Batch result file), starts the local mock
+OpenAI server (see mock_openai_server.py) with a configurable latency distribution, error rate
+and RPM limit, and times each stage in a fresh process:
+
+    interactive  – `analyse_paths` (preprocess pool + scheduler + HTTP) against the mock
+    batch        – `iter_tasks` + `write_sharded` (Batch task shards on disk)
+    parse        – `parse_jsonl` (result JSONL → DataFrame)
+    parquet      – `write_parquet` (result JSONL → partitioned Parquet)
+
+For every stage it reports items/sec, p50/p95/p99 per-image latency (interactive), peak RSS (the
+stage process, and sampled across it plus its preprocessing workers) and CPU utilisation.  Results are saved as JSON
+together with the git revision, so two runs can be compared with `--compare`.
+
+Usage:
+    python benchmark.py --images 500 --latency 0.3 --latency-dist lognormal --error-rate 0.01
+    python benchmark.py --stages parse parquet --result-lines 500000 --output after.json --compare before.json
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import io
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import redirect_stdout
+from dataclasses import asdict
+from multiprocessing import get_context
+from pathlib import Path
+
+from PIL import Image
+
+from mock_openai_server import MockConfig, _completion, serve
+from preprocess import WORKERS
+
+STAGES = ("interactive", "batch", "parse", "parquet")
+WORKDIR = Path(os.getenv("BENCHMARK_DIR", "bench_data"))
+VOCAB = {
+    "color": ["black", "white", "red", "blue", "gray", "beige", "multicolor"],
+    "trend": ["athletic", "casual", "formal", "streetwear", "vintage", "classic"],
+    "category": ["men's", "women's", "kid's", "unisex"],
+    "price": ["budget", "mid-range", "premium"],
+}
+
+
+# ───────────────────────────────────────── synthetic data ──
+def make_images(outdir: Path, count: int, size: tuple[int, int], seed: int = 0) -> list[Path]:
+    """Write `count` distinct, textured JPEGs (reused if they already exist)."""
+    outdir.mkdir(parents=True, exist_ok=True)
+    rng = random.Random(seed)
+    w, h = size
+    paths = []
+    for i in range(count):
+        path = outdir / f"synthetic_{i:06d}.jpg"
+        if not path.exists():
+            # upscaled random blocks: photo-like JPEG sizes and distinct perceptual hashes
+            noise = Image.frombytes("RGB", (w // 16, h // 16), rng.randbytes(w // 16 * h // 16 * 3))
+            noise.resize(size, Image.Resampling.BICUBIC).save(path, quality=90)
+        paths.append(path)
+    return paths
+
+
+def make_results(path: Path, lines: int, malformed_rate: float = 0.01, seed: int = 0) -> Path:
+    """Write a Batch-API style result JSONL with `lines` answers (a few of them malformed)."""
+    if path.exists() and sum(1 for _ in path.open("rb")) == lines:
+        return path
+    rng = random.Random(seed)
+    with path.open("w", encoding="utf-8") as f:
+        for i in range(lines):
+            body = _completion({"model": "gpt-4o-2024-08-06"}, 1500)
+            content = {key: rng.choice(values) for key, values in VOCAB.items()}
+            body["choices"][0]["message"]["content"] = (
+                "{not json" if rng.random() < malformed_rate else json.dumps(content)
+            )
+            f.write(json.dumps({
+                "id": f"batch_req_{i}", "custom_id": f"synthetic_{i:06d}",
+                "response": {"status_code": 200, "request_id": f"req_{i}", "body": body}, "error": None,
+            }) + "\n")
+    return path
+
+
+# ─────────────────────────────────────────────── stages ──
+def _stage_interactive(image_dir: Path, concurrency: int, rpm: float, tpm: float, workers: int) -> dict:
+    from garment_analyzer_strict import analyse_paths    # imported here: the client reads OPENAI_BASE_URL
+
+    paths = sorted(image_dir.glob("*.jpg"))
+    with redirect_stdout(io.StringIO()):                  # per-image output would dominate the timing
+        stats = asyncio.run(analyse_paths(paths, concurrency, rpm, tpm, workers))
+    return {
+        "items": stats.completed, "failed": stats.failed, "retries": stats.retries,
+        "rate_limited": stats.rate_limited, "server_errors": stats.server_errors,
+        "latency": {k: round(v, 4) for k, v in stats.percentiles().items()},
+    }
+
+
+def _stage_batch(image_dir: Path, outdir: Path, workers: int) -> dict:
+    from garment_analyzer_batch import iter_tasks, write_sharded
+
+    shards, total = write_sharded(iter_tasks(image_dir, workers), outdir)
+    return {"items": total, "shards": len(shards), "bytes": sum(p.stat().st_size for p in shards)}
+
+
+def _stage_parse(results: Path) -> dict:
+    from parse_jsonl import parse_jsonl
+
+    df = parse_jsonl(results, results.with_suffix(".errors.jsonl"))
+    return {"items": len(df), "dataframe_mb": round(df.memory_usage(deep=True).sum() / 2**20, 2)}
+
+
+def _stage_parquet(results: Path, outdir: Path) -> dict:
+    from parse_jsonl import write_parquet
+
+    return {"items": write_parquet(results, outdir, errors_path=results.with_suffix(".errors.jsonl"))}
+
+
+def _cpu_seconds() -> float:
+    own, children = resource.getrusage(resource.RUSAGE_SELF), resource.getrusage(resource.RUSAGE_CHILDREN)
+    return own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime
+
+
+def _tree_rss(pid: int) -> int:
+    """Resident bytes of `pid` and all of its descendants (Linux /proc; 0 elsewhere)."""
+    rss, children = {}, {}
+    for entry in os.listdir("/proc") if os.path.isdir("/proc") else ():
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                fields = f.read().rsplit(")", 1)[1].split()   # the command name may contain spaces
+        except OSError:
+            continue                                        # process exited while we looked
+        children.setdefault(int(fields[1]), []).append(int(entry))
+        rss[int(entry)] = int(fields[21]) * resource.getpagesize()
+    total, stack = 0, [pid]
+    while stack:
+        p = stack.pop()
+        total += rss.get(p, 0)
+        stack.extend(children.get(p, ()))
+    return total
+
+
+class PeakRSS(threading.Thread):
+    """Sample the RSS of this process tree (stage + preprocessing workers) and keep the maximum.
+
+    `ru_maxrss` is no substitute on Linux: it survives fork/exec, so a fresh stage process would
+    report its parent's peak.
+    """
+
+    def __init__(self, interval: float = 0.05):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.peak = 0
+        self._done = threading.Event()
+
+    def run(self) -> None:
+        while not self._done.is_set():
+            self.peak = max(self.peak, _tree_rss(os.getpid()))
+            self._done.wait(self.interval)
+
+    def stop(self) -> int:
+        self._done.set()
+        self.join()
+        return self.peak
+
+
+def _peak_own_rss() -> int:
+    try:
+        with open("/proc/self/status") as f:                # VmHWM resets on exec, unlike ru_maxrss
+            return next(int(line.split()[1]) * 1024 for line in f if line.startswith("VmHWM:"))
+    except OSError:
+        kb = 1 if sys.platform == "darwin" else 1024        # ru_maxrss is bytes on macOS, KiB elsewhere
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * kb
+
+
+def _measured(name: str, kwargs: dict) -> dict:
+    """Run one stage (in a fresh process) and add wall time, throughput, CPU and peak RSS."""
+    sampler = PeakRSS()
+    sampler.start()
+    cpu, started = _cpu_seconds(), time.perf_counter()
+    result = globals()[f"_stage_{name}"](**kwargs)
+    wall = time.perf_counter() - started
+    cpu = _cpu_seconds() - cpu
+    tree = sampler.stop()
+    return {
+        **result,
+        "seconds": round(wall, 3),
+        "items_per_sec": round(result["items"] / wall, 2),
+        "cpu_seconds": round(cpu, 2),
+        "cpu_utilisation": round(cpu / wall / (os.cpu_count() or 1), 3),   # fraction of all cores
+        "peak_rss_mb": round(_peak_own_rss() / 2**20, 1),
+        "peak_tree_rss_mb": round(tree / 2**20, 1) if tree else None,      # None where /proc is missing
+    }
+
+
+def run_stage(name: str, **kwargs) -> dict:
+    # a fresh interpreter per stage keeps peak RSS and CPU accounting from leaking between stages
+    with ProcessPoolExecutor(1, mp_context=get_context("spawn")) as pool:
+        return pool.submit(_measured, name, kwargs).result()
+
+
+# ───────────────────────────────────────────── reporting ──
+def _git_revision() -> str:
+    try:
+        return subprocess.run(
+            ["git", "describe", "--always", "--dirty"], capture_output=True, text=True, check=True,
+            cwd=Path(__file__).parent,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def compare(current: dict, baseline: dict, tolerance: float) -> list[str]:
+    """Print per-stage deltas against `baseline`; returns the regressions beyond `tolerance`."""
+    regressions = []
+    print(f"\n📊 vs {baseline.get('revision', '?')} ({baseline.get('timestamp', '?')})")
+    for stage, now in current["stages"].items():
+        before = baseline.get("stages", {}).get(stage)
+        if before is None:
+            continue
+        checks = [("items_per_sec", +1), ("peak_rss_mb", -1)]
+        if "latency" in now and "latency" in before:
+            checks.append(("p95", -1))
+        for metric, better in checks:
+            old = before["latency"][metric] if metric == "p95" else before[metric]
+            new = now["latency"][metric] if metric == "p95" else now[metric]
+            change = (new - old) / old if old else 0.0
+            flag = "  ⚠️ regression" if change * better < -tolerance else ""
+            print(f"   {stage:<12} {metric:<14} {old:>10.2f} → {new:>10.2f}  ({change:+.1%}){flag}")
+            if flag:
+                regressions.append(f"{stage}.{metric}")
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark the garment pipeline against a local mock endpoint.")
+    parser.add_argument("--stages", nargs="+", default=list(STAGES), choices=STAGES)
+    parser.add_argument("--images", type=int, default=300, help="Synthetic images to generate")
+    parser.add_argument("--image-size", default="1600x1200", help="Synthetic image size WxH")
+    parser.add_argument("--result-lines", type=int, default=200_000, help="Synthetic Batch result lines")
+    parser.add_argument("--workdir", type=Path, default=WORKDIR, help="Where synthetic data and outputs go")
+    parser.add_argument("--workers", type=int, default=WORKERS, help="Image preprocessing processes")
+    parser.add_argument("--concurrency", type=int, default=32, help="Max in-flight requests")
+    parser.add_argument("--rpm", type=float, default=10_000, help="Client requests-per-minute budget")
+    parser.add_argument("--tpm", type=float, default=10_000_000, help="Client tokens-per-minute budget")
+    mock = parser.add_argument_group("mock endpoint")
+    mock.add_argument("--latency", type=float, default=0.3, help="Mean seconds of latency per request")
+    mock.add_argument("--latency-dist", default="lognormal", choices=("fixed", "exponential", "lognormal"))
+    mock.add_argument("--latency-sigma", type=float, default=0.6, help="Lognormal shape parameter")
+    mock.add_argument("--rate-limit-rate", type=float, default=0.0, help="Fraction of requests that get a 429")
+    mock.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests that get a 500")
+    mock.add_argument("--mock-rpm", type=int, default=0, help="Server-side RPM limit (0 = unlimited)")
+    mock.add_argument("--retry-after", type=float, default=0.5, help="Retry-After value in seconds")
+    parser.add_argument("--output", type=Path, default=None, help="JSON report (default: benchmark-<rev>.json)")
+    parser.add_argument("--compare", type=Path, default=None, help="Earlier JSON report to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="Relative change that counts as a regression")
+    args = parser.parse_args()
+
+    size = tuple(int(v) for v in args.image_size.lower().split("x"))
+    image_dir = args.workdir / f"images_{args.images}_{args.image_size}"
+    config = MockConfig(
+        latency=args.latency, rate_limit_rate=args.rate_limit_rate, error_rate=args.error_rate,
+        rpm=args.mock_rpm, retry_after=args.retry_after,
+        latency_dist=args.latency_dist, latency_sigma=args.latency_sigma,
+    )
+    server, state = serve(config)
+    os.environ["OPENAI_BASE_URL"] = f"http://127.0.0.1:{server.server_port}/v1"   # inherited by stage processes
+    os.environ["OPENAI_API_KEY"] = "sk-benchmark"
+
+    revision = _git_revision()
+    report = {
+        "revision": revision,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "config": {**{k: v for k, v in vars(args).items() if k not in ("output", "compare", "workdir")},
+                   "mock": asdict(config)},
+        "stages": {},
+    }
+
+    try:
+        if {"interactive", "batch"} & set(args.stages):
+            print(f"🖼️  {args.images} synthetic {args.image_size} images in {image_dir}")
+            make_images(image_dir, args.images, size)
+        if {"parse", "parquet"} & set(args.stages):
+            results = make_results(args.workdir / f"results_{args.result_lines}.jsonl", args.result_lines)
+            print(f"🧾 {args.result_lines} synthetic result lines in {results}")
+
+        for stage in args.stages:
+            kwargs = {
+                "interactive": lambda: dict(image_dir=image_dir, concurrency=args.concurrency,
+                                            rpm=args.rpm, tpm=args.tpm, workers=args.workers),
+                "batch": lambda: dict(image_dir=image_dir, outdir=args.workdir / "shards", workers=args.workers),
+                "parse": lambda: dict(results=results),
+                "parquet": lambda: dict(results=results, outdir=args.workdir / "parquet"),
+            }[stage]()
+            result = report["stages"][stage] = run_stage(stage, **kwargs)
+            latency = result.get("latency")
+            print(
+                f"⏱️  {stage:<12} {result['items_per_sec']:>10.1f} items/sec  "
+                + (f"p50 {latency['p50']:.3f}s p95 {latency['p95']:.3f}s p99 {latency['p99']:.3f}s  " if latency else "")
+                + f"cpu {result['cpu_utilisation']:.0%}  peak RSS {result['peak_rss_mb']:.0f} MB "
+                f"(with workers {result['peak_tree_rss_mb'] or 0:.0f} MB)"
+            )
+    finally:
+        server.shutdown()
+    report["mock_counts"] = state.counts
+
+    output = args.output or Path(f"benchmark-{revision}.json")
+    output.write_text(json.dumps(report, indent=2))
+    print(f"💾 Saved {output}")
+
+    if args.compare:
+        regressions = compare(report, json.loads(args.compare.read_text()), args.tolerance)
+        if regressions:
+            print(f"❌ {len(regressions)} regression(s): {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,313 @@
+#!/usr/bin/env python
+"""
+calibrate_resolution.py – pick the cheapest resize / JPEG quality / detail that keeps labels stable
+
+Every sample image is encoded at each rung of a ladder (max side × JPEG quality × detail level)
+and classified.  The highest-fidelity rung (largest side, best quality, `high` detail) is the
+reference; for every other rung we measure how often all four labels agree with it, plus image
+bytes, image tokens and cost per 1,000 images.  The cheapest rung whose agreement stays at or
+above `--target` is recommended, as the environment settings that apply it.
+
+Two classifiers are available:
+
+    offline  – a deterministic pixel-statistics stand-in (no network, no key) that sees the image
+               at the resolution the chosen detail level would give the model
+    api      – the real model through garment_analyzer_strict (one request per image per rung)
+
+Usage:
+    python calibrate_resolution.py sample/ --limit 200 --target 0.95
+    python calibrate_resolution.py sample/ --classifier api --sides 768 512 384 --qualities 88 70 --details high low
+    python calibrate_resolution.py sample/ --labels sample_labels.jsonl --out calibration.json
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import base64
+import colorsys
+import json
+import math
+import random
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass, field
+from io import BytesIO
+from itertools import product
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+from preprocess import WORKERS, encode_jpeg_variants
+
+SIDES = (1024, 768, 512, 384, 256)
+QUALITIES = (95, 88, 75, 60)
+DETAILS = ("high", "low")
+FIELDS = ("color", "trend", "category", "price")
+IMAGE_SUFFIXES = {".jpg", ".jpeg", ".png", ".webp"}
+
+
+@dataclass(frozen=True)
+class Rung:
+    max_side: int
+    quality: int
+    detail: str
+
+
+@dataclass
+class RungResult:
+    rung: Rung
+    images: int = 0
+    jpeg_bytes: int = 0
+    image_tokens: int = 0
+    agree: int = 0                                   # all four labels equal the reference
+    field_agree: dict[str, int] = field(default_factory=lambda: dict.fromkeys(FIELDS, 0))
+    label_correct: int = 0                           # all four labels equal the human labels
+    labelled: int = 0
+    cost_per_1k: float = 0.0
+
+    @property
+    def agreement(self) -> float:
+        return self.agree / self.images if self.images else 0.0
+
+    @property
+    def accuracy(self) -> float | None:
+        return self.label_correct / self.labelled if self.labelled else None
+
+
+# ──────────────────────────────────── offline stand-in ──
+PALETTE = {
+    "black": (20, 20, 20), "white": (235, 235, 235), "red": (200, 30, 40), "green": (40, 140, 60),
+    "blue": (40, 70, 180), "yellow": (230, 210, 50), "brown": (120, 80, 40), "orange": (240, 140, 30),
+    "purple": (120, 50, 150), "pink": (240, 150, 190), "gray": (128, 128, 128), "beige": (220, 200, 160),
+}
+TRENDS = ("classic", "formal", "casual", "vintage", "traditional", "athletic", "streetwear")
+CATEGORIES = ("men's", "unisex", "women's", "kid's")
+PRICES = ("premium", "mid-range", "budget")
+ANALYSIS_SIDE = 384                     # finest detail the stand-in "resolves"
+
+
+def _model_view(jpeg: bytes, detail: str) -> Image.Image:
+    """The image as the model would receive it: ≤512px for low detail, ≤2048 / short side ≤768 otherwise."""
+    img = Image.open(BytesIO(jpeg)).convert("RGB")
+    if detail == "low":
+        img.thumbnail((512, 512), Image.Resampling.BILINEAR)
+    else:
+        img.thumbnail((2048, 2048), Image.Resampling.BILINEAR)
+        if min(img.size) > 768:
+            scale = 768 / min(img.size)
+            img = img.resize((round(img.width * scale), round(img.height * scale)), Image.Resampling.BILINEAR)
+    return img
+
+
+def classify_offline(jpeg: bytes, detail: str) -> dict[str, str]:
+    """Deterministic stand-in for the vision model.
+
+    Colour comes from the centre crop's mean RGB, trend from fine-texture energy, category from
+    brightness and price from saturation – so, like the real model, its answers drift once
+    downscaling, compression or low detail remove information.  Features are measured on a
+    fixed 384px grid (area-averaged), so detail lost to downscaling or compression moves them and
+    the pixel count alone does not.
+    """
+    view = _model_view(jpeg, detail)
+    scale = ANALYSIS_SIDE / max(view.size)
+    view = view.resize((round(view.width * scale), round(view.height * scale)), Image.Resampling.BOX)
+    arr = np.asarray(view, dtype=np.float32) / 255
+    h, w, _ = arr.shape
+    centre = arr[h // 4: h - h // 4, w // 4: w - w // 4].reshape(-1, 3)
+    mean = centre.mean(axis=0) * 255
+    spread = centre.std(axis=0).mean()
+    color = "multicolor" if spread > 0.28 else min(
+        PALETTE, key=lambda name: sum((a - b) ** 2 for a, b in zip(PALETTE[name], mean))
+    )
+    gray = arr.mean(axis=2)
+    texture = float(np.abs(np.diff(gray, axis=0)).mean() + np.abs(np.diff(gray, axis=1)).mean())
+    trend = TRENDS[min(max(int(math.log2(max(texture, 1e-6) / 0.001)), 0), len(TRENDS) - 1)]   # one per doubling
+    brightness = float(gray.mean())
+    category = CATEGORIES[min(int(brightness * len(CATEGORIES)), len(CATEGORIES) - 1)]
+    saturation = colorsys.rgb_to_hsv(*(mean / 255))[1]
+    price = PRICES[min(int(saturation * len(PRICES) * 1.5), len(PRICES) - 1)]
+    return {"color": color, "trend": trend, "category": category, "price": price}
+
+
+# ─────────────────────────────────────────── workers ──
+def _encode_rungs(path: Path, rungs: list[Rung], offline: bool) -> list[dict]:
+    """Encode one image at every rung (once per side/quality pair); classify offline if asked."""
+    encoded: dict[tuple[int, int], bytes] = {}
+    for side in {rung.max_side for rung in rungs}:
+        qualities = {rung.quality for rung in rungs if rung.max_side == side}
+        for quality, jpeg in encode_jpeg_variants(path, side, qualities).items():
+            encoded[(side, quality)] = jpeg
+    out = []
+    for rung in rungs:
+        jpeg = encoded[(rung.max_side, rung.quality)]
+        with Image.open(BytesIO(jpeg)) as img:
+            size = img.size
+        out.append({
+            "bytes": len(jpeg), "size": size,
+            "labels": classify_offline(jpeg, rung.detail) if offline else None,
+            "b64": None if offline else base64.b64encode(jpeg).decode(),
+        })
+    return out
+
+
+async def _classify_api(encoded: list[list[dict]], rungs: list[Rung], concurrency: int) -> None:
+    """Fill in `labels` for every (image, rung) with the real model.
+
+    A request that errors, fails schema validation or comes back as a refusal (`parsed` is None)
+    is recorded as a failed rung entry – it never agrees – rather than aborting the whole ladder.
+    """
+    from openai import OpenAIError
+    from pydantic import ValidationError
+    from garment_analyzer_strict import _request_openai, estimate_request_tokens
+    from scheduler import RequestScheduler
+
+    scheduler = RequestScheduler(concurrency=concurrency)
+
+    async def _one(job: tuple[dict, Rung]) -> bool:
+        entry, rung = job
+        entry["labels"] = {}                                 # a failed request never agrees
+        try:
+            response = await scheduler.run(lambda: _request_openai(entry["b64"], rung.detail),
+                                           estimate_request_tokens(rung.detail, rung.max_side))
+        except (OpenAIError, ValidationError) as err:
+            print(f"❌ {rung} – {type(err).__name__}: {err}")
+            return False
+        message = response.choices[0].message
+        parsed = message.parsed
+        if parsed is None:
+            print(f"❌ {rung} – refused: {message.refusal or 'no parsed output'}")
+            return False
+        entry["labels"] = {name: getattr(parsed, name).value for name in FIELDS}
+        return True
+
+    jobs = ((entry, rung) for image in encoded for entry, rung in zip(image, rungs))
+    print(f"📈 {(await scheduler.drain(jobs, _one)).summary()}")
+
+
+# ─────────────────────────────────────────── calibration ──
+def calibrate(
+    paths: list[Path],
+    rungs: list[Rung],
+    classifier: str = "offline",
+    labels: dict[str, dict] | None = None,
+    workers: int = WORKERS,
+    concurrency: int = 16,
+) -> list[RungResult]:
+    """Evaluate every rung on `paths`; `rungs[0]` is the reference.
+
+    Tokens and costs are priced for the model that classifies: `garment_analyzer_strict.MODEL`
+    (OPENAI_VISION_MODEL) with the api classifier, the default gpt-4o model offline.
+    """
+    from cost_calculator import DEFAULT_MODEL, VisionAPICostCalculator, resized_dimensions, tile_tokens
+
+    calculator = VisionAPICostCalculator()
+    if classifier == "api":
+        from garment_analyzer_strict import MODEL as model
+    else:
+        model = DEFAULT_MODEL
+    if model not in calculator.pricing:
+        raise ValueError(f"No pricing entry for {model!r} in the pricing table (COST_PRICING); cannot cost the ladder")
+    price = calculator.pricing[model]
+
+    with ProcessPoolExecutor(workers) as pool:
+        encoded = list(pool.map(_encode_rungs, paths, [rungs] * len(paths), [classifier == "offline"] * len(paths)))
+    if classifier == "api":
+        asyncio.run(_classify_api(encoded, rungs, concurrency))
+
+    results = [RungResult(rung) for rung in rungs]
+    for path, image in zip(paths, encoded):
+        reference = image[0]["labels"]
+        truth = (labels or {}).get(path.name)
+        for result, entry in zip(results, image):
+            w, h = resized_dimensions(np.array([entry["size"][0]]), np.array([entry["size"][1]]), result.rung.max_side)
+            result.images += 1
+            result.jpeg_bytes += entry["bytes"]
+            result.image_tokens += int(tile_tokens(w, h, result.rung.detail,
+                                                   price["image_base_tokens"], price["image_tile_tokens"])[0])
+            result.agree += bool(reference) and entry["labels"] == reference
+            for name in FIELDS:
+                result.field_agree[name] += bool(reference) and entry["labels"].get(name) == reference[name]
+            if truth is not None:
+                result.labelled += 1
+                result.label_correct += all(entry["labels"].get(name) == truth.get(name) for name in FIELDS)
+    for result in results:
+        mean_tokens = result.image_tokens / max(result.images, 1)
+        result.cost_per_1k = 1000 * calculator.calculate_single_call_cost(
+            result.rung.detail, image_tokens=mean_tokens, model=model)["total_cost"]
+    return results
+
+
+def choose(results: list[RungResult], target: float) -> RungResult:
+    """Cheapest rung at or above `target` agreement (the reference always qualifies)."""
+    qualifying = [r for r in results if r.agreement >= target] or results[:1]
+    return min(qualifying, key=lambda r: (r.cost_per_1k, r.jpeg_bytes))
+
+
+def _load_labels(path: Path) -> dict[str, dict]:
+    """JSONL with an `image` (file name) key plus color/trend/category/price."""
+    with path.open(encoding="utf-8") as f:
+        rows = [json.loads(line) for line in f if line.strip()]
+    return {row["image"]: row for row in rows}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Find the cheapest image resolution/quality/detail that keeps labels stable.")
+    parser.add_argument("folder", type=Path, help="Folder with sample images")
+    parser.add_argument("--limit", type=int, default=200, help="Random sample size (0 = all images)")
+    parser.add_argument("--seed", type=int, default=0, help="Sampling seed")
+    parser.add_argument("--sides", type=int, nargs="+", default=list(SIDES), help="Max-side ladder")
+    parser.add_argument("--qualities", type=int, nargs="+", default=list(QUALITIES), help="JPEG quality ladder")
+    parser.add_argument("--details", nargs="+", default=list(DETAILS), choices=("high", "auto", "low"))
+    parser.add_argument("--target", type=float, default=0.95, help="Minimum agreement with the reference")
+    parser.add_argument("--classifier", default="offline", choices=("offline", "api"))
+    parser.add_argument("--labels", type=Path, default=None, help="Optional human labels (JSONL) for accuracy")
+    parser.add_argument("--workers", type=int, default=WORKERS, help="Encoding processes")
+    parser.add_argument("--concurrency", type=int, default=16, help="In-flight requests (api classifier)")
+    parser.add_argument("--out", type=Path, default=None, help="Write every rung's metrics as JSON")
+    args = parser.parse_args()
+
+    paths = sorted(p for p in args.folder.iterdir() if p.suffix.lower() in IMAGE_SUFFIXES)
+    if args.limit and len(paths) > args.limit:
+        paths = sorted(random.Random(args.seed).sample(paths, args.limit))
+    detail_order = sorted(args.details, key=("high", "auto", "low").index)
+    rungs = [Rung(side, quality, detail) for side, quality, detail in product(
+        sorted(args.sides, reverse=True), sorted(args.qualities, reverse=True), detail_order)]
+    labels = _load_labels(args.labels) if args.labels else None
+
+    print(f"🔬 {len(paths)} images × {len(rungs)} settings ({args.classifier} classifier); "
+          f"reference = {rungs[0].max_side}px q{rungs[0].quality} {rungs[0].detail}")
+    results = calibrate(paths, rungs, args.classifier, labels, args.workers, args.concurrency)
+    best = choose(results, args.target)
+
+    print(f"\n{'Side':>5} {'Q':>3} {'Detail':<6} {'KB/img':>7} {'Tok/img':>8} {'$/1k':>7} {'Agree':>6} "
+          + " ".join(f"{name[:5]:>6}" for name in FIELDS) + ("  Accuracy" if labels else ""))
+    for r in sorted(results, key=lambda r: r.cost_per_1k):
+        n = max(r.images, 1)
+        print(f"{r.rung.max_side:>5} {r.rung.quality:>3} {r.rung.detail:<6} {r.jpeg_bytes / n / 1024:>7.1f} "
+              f"{r.image_tokens / n:>8.0f} {r.cost_per_1k:>7.3f} {r.agreement:>6.1%} "
+              + " ".join(f"{r.field_agree[name] / n:>6.1%}" for name in FIELDS)
+              + (f"  {'n/a' if r.accuracy is None else f'{r.accuracy:.1%}':>8}" if labels else "")
+              + ("  ← chosen" if r is best else ""))
+
+    reference = results[0]
+    print(f"\n🎯 Cheapest setting with ≥{args.target:.0%} agreement: {best.rung.max_side}px, quality "
+          f"{best.rung.quality}, detail {best.rung.detail} – {best.agreement:.1%} agreement, "
+          f"{1 - best.jpeg_bytes / max(reference.jpeg_bytes, 1):.0%} fewer bytes, "
+          f"${best.cost_per_1k:.3f} vs ${reference.cost_per_1k:.3f} per 1k images")
+    print(f"   PREPROCESS_MAX_SIDE={best.rung.max_side} PREPROCESS_JPEG_QUALITY={best.rung.quality} "
+          f"OPENAI_IMAGE_DETAIL={best.rung.detail}")
+
+    if args.out:
+        args.out.write_text(json.dumps({
+            "classifier": args.classifier, "images": len(paths), "target": args.target,
+            "chosen": asdict(best.rung),
+            "rungs": [{**asdict(r.rung), "jpeg_bytes": r.jpeg_bytes, "image_tokens": r.image_tokens,
+                       "cost_per_1k": r.cost_per_1k, "agreement": r.agreement, "accuracy": r.accuracy,
+                       "field_agreement": {k: v / max(r.images, 1) for k, v in r.field_agree.items()}}
+                      for r in results],
+        }, indent=2))
+        print(f"💾 Saved {args.out}")
+
+
+if __name__ == "__main__":
+    main()
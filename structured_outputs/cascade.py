@@ -0,0 +1,232 @@
+"""
+cascade.py – local SigLIP zero-shot pass in front of the vision LLM
+
+Every image is scored on-device against each controlled vocabulary (color, trend, category,
+price) with a fashion SigLIP model (the one `clip/clip_variants.py` uses).  A field whose top
+label reaches its confidence threshold is accepted locally; an image with any field below its
+threshold is escalated to the LLM, whose answer fills in only those fields.  Images with every
+field accepted never reach the API.
+
+Scoring is batched: concurrent `decide()` calls are gathered into batches of up to
+`batch_size` images (the same micro-batching as request packing, see packing.py) and run in a
+worker thread, so the event loop keeps driving in-flight API calls meanwhile.
+
+Requires `torch` and `open_clip_torch` (imported on first use).  The model is loaded through
+`clip/registry.py`, so a process that already uses it for embeddings shares one copy.
+
+Usage:
+    python cascade.py /data/catalogue/*.jpg --thresholds color=0.6 trend=0.8      # dry run: escalation rates
+    python garment_analyzer_strict.py /data/catalogue/*.jpg --cascade             # route through the cascade
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import base64
+import os
+import sys
+from dataclasses import dataclass, field
+from io import BytesIO
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+from packing import RequestPacker
+
+CLIP_DIR = Path(__file__).resolve().parent.parent / "clip"   # registry.py lives with the CLIP scripts
+
+CASCADE_MODEL = os.getenv("CASCADE_MODEL", "hf-hub:Marqo/marqo-fashionSigLIP")
+CASCADE_BATCH = int(os.getenv("CASCADE_BATCH", 32))
+DEFAULT_THRESHOLDS = {"color": 0.60, "trend": 0.75, "category": 0.70, "price": 0.80}
+THRESHOLDS = {
+    name: float(os.getenv(f"CASCADE_THRESHOLD_{name.upper()}", value)) for name, value in DEFAULT_THRESHOLDS.items()
+}
+# zero-shot text prompts per field; `{}` is the vocabulary value
+TEMPLATES = {
+    "color": "a photo of a {} garment",
+    "trend": "a photo of a {} style garment",
+    "category": "a photo of {} clothing",
+    "price": "a photo of a {} fashion item",
+}
+
+
+# ───────────────────────────────────────────── scorer ──
+class SiglipScorer:
+    """Zero-shot label probabilities for every field, from one image embedding per image."""
+
+    def __init__(self, vocabularies: dict[str, list[str]], model_name: str = CASCADE_MODEL, device: str | None = None):
+        import torch
+
+        if str(CLIP_DIR) not in sys.path:
+            sys.path.append(str(CLIP_DIR))
+        from registry import get_model
+
+        self.torch = torch
+        self.encoder = get_model(model_name, device)
+        self.device = self.encoder.device
+        self.preprocess = self.encoder.preprocess
+        self.vocabularies = vocabularies
+        self.logit_scale = self.encoder.logit_scale or 100.0
+        with torch.inference_mode():                        # text side is fixed: embed every label once
+            self.text_features = {
+                name: self._normalise(self.encoder.encode_text(
+                    [TEMPLATES.get(name, "{}").format(v) for v in values]
+                ).float())
+                for name, values in vocabularies.items()
+            }
+
+    def _normalise(self, x):
+        return x / x.norm(dim=-1, keepdim=True)
+
+    def probabilities(self, images: list[Image.Image]) -> dict[str, np.ndarray]:
+        """{field: (n_images, n_labels) softmax probabilities}."""
+        torch = self.torch
+        batch = torch.stack([self.preprocess(img) for img in images]) if self.preprocess else images
+        # bf16 only pays off on GPU; on CPU it is barely faster and shifts scores vs fp32
+        with torch.inference_mode(), torch.autocast(self.device, dtype=torch.bfloat16, enabled=self.device == "cuda"):
+            image_features = self._normalise(self.encoder.encode_image(batch).float())
+        return {
+            name: (self.logit_scale * image_features @ text.float().T).softmax(dim=-1).cpu().numpy()
+            for name, text in self.text_features.items()
+        }
+
+
+# ──────────────────────────────────────────── routing ──
+@dataclass
+class Decision:
+    """Local labels for one image and the fields that still need the LLM."""
+    labels: dict[str, str]
+    confidence: dict[str, float]
+    escalate: list[str]
+
+    def merge(self, llm: dict[str, str]) -> dict[str, str]:
+        """Accepted local labels + the LLM's answer for the escalated fields."""
+        return {**self.labels, **{name: llm[name] for name in self.escalate}}
+
+
+def route(
+    probs: dict[str, np.ndarray], vocabularies: dict[str, list[str]], thresholds: dict[str, float]
+) -> list[Decision]:
+    """Turn per-field probabilities into one `Decision` per image (vectorised per field)."""
+    n = len(next(iter(probs.values())))
+    top = {name: p.argmax(axis=1) for name, p in probs.items()}
+    conf = {name: p.max(axis=1) for name, p in probs.items()}
+    low = {name: conf[name] < thresholds.get(name, 1.0) for name in probs}
+    return [
+        Decision(
+            labels={name: vocabularies[name][top[name][i]] for name in probs},
+            confidence={name: float(conf[name][i]) for name in probs},
+            escalate=[name for name in probs if low[name][i]],
+        )
+        for i in range(n)
+    ]
+
+
+@dataclass
+class CascadeStats:
+    images: int = 0
+    escalated: int = 0
+    fields: dict[str, int] = field(default_factory=dict)     # field → images escalated because of it
+
+    def add(self, decision: Decision) -> None:
+        self.images += 1
+        self.escalated += bool(decision.escalate)
+        for name in decision.escalate:
+            self.fields[name] = self.fields.get(name, 0) + 1
+
+    def summary(self) -> str:
+        n = max(self.images, 1)
+        per_field = ", ".join(f"{name} {count / n:.0%}" for name, count in sorted(self.fields.items()))
+        return (
+            f"cascade: {self.images - self.escalated}/{self.images} images labelled locally, "
+            f"{self.escalated / n:.1%} escalated (per field: {per_field or 'none'})"
+        )
+
+
+class Cascade:
+    """Batched local scoring + threshold routing for concurrent callers.
+
+        decision = await cascade.decide(b64)
+        if decision.escalate: ... call the LLM, then decision.merge(llm_fields)
+    """
+
+    def __init__(
+        self,
+        vocabularies: dict[str, list[str]],
+        thresholds: dict[str, float] | None = None,
+        scorer: SiglipScorer | None = None,
+        batch_size: int = CASCADE_BATCH,
+        linger: float = 0.02,
+    ):
+        self.vocabularies = vocabularies
+        self.thresholds = {**THRESHOLDS, **(thresholds or {})}
+        self.scorer = scorer or SiglipScorer(vocabularies)
+        self.batch_size = batch_size
+        self.stats = CascadeStats()
+        self._batcher = RequestPacker(self._score, batch_size, linger=linger, split_on=())
+
+    def _decide_batch(self, jpegs: list[str]) -> list[Decision]:
+        images = [Image.open(BytesIO(base64.b64decode(b64))).convert("RGB") for b64 in jpegs]
+        return route(self.scorer.probabilities(images), self.vocabularies, self.thresholds)
+
+    async def _score(self, batch: list[tuple[str, str]]) -> dict[str, Decision]:
+        decisions = await asyncio.to_thread(self._decide_batch, [b64 for _, b64 in batch])
+        return {key: decision for (key, _), decision in zip(batch, decisions)}
+
+    async def decide(self, b64: str) -> Decision:
+        decision = await self._batcher.submit(b64)
+        self.stats.add(decision)
+        return decision
+
+
+def parse_thresholds(pairs: list[str]) -> dict[str, float]:
+    """["color=0.6", "trend=0.8"] → {"color": 0.6, "trend": 0.8}"""
+    out = {}
+    for pair in pairs:
+        name, _, value = pair.partition("=")
+        if name not in DEFAULT_THRESHOLDS or not value:
+            raise argparse.ArgumentTypeError(f"Expected <field>=<threshold> with field in {list(DEFAULT_THRESHOLDS)}: {pair!r}")
+        out[name] = float(value)
+    return out
+
+
+# ─────────────────────────────────────── CLI entry‑point ──
+def main() -> None:
+    from garment_analyzer_strict import VOCABULARIES
+    from preprocess import WORKERS, preprocess_stream
+
+    parser = argparse.ArgumentParser(description="Dry-run the local SigLIP cascade and report escalation rates.")
+    parser.add_argument("images", nargs="+", type=Path, help="Image files")
+    parser.add_argument("--thresholds", nargs="*", default=[], help="Per-field confidence thresholds, e.g. color=0.6")
+    parser.add_argument("--batch-size", type=int, default=CASCADE_BATCH, help="Images per SigLIP forward pass")
+    parser.add_argument("--workers", type=int, default=WORKERS, help="Image preprocessing processes")
+    parser.add_argument("--verbose", action="store_true", help="Print every image's decision")
+    args = parser.parse_args()
+
+    cascade = Cascade(VOCABULARIES, parse_thresholds(args.thresholds), batch_size=args.batch_size)
+    print(f"🧮  {CASCADE_MODEL} on {cascade.scorer.device}; thresholds {cascade.thresholds}")
+
+    async def _run() -> None:
+        async def _one(item) -> None:
+            if item.error is not None:
+                print(f"❌ {item.path.name} – {item.error}")
+                return
+            decision = await cascade.decide(item.b64)
+            if args.verbose:
+                status = f"→ LLM for {', '.join(decision.escalate)}" if decision.escalate else "local"
+                print(f"{item.path.name}: {decision.labels} {status}")
+
+        pending: set[asyncio.Task] = set()
+        async for item in preprocess_stream(args.images, workers=args.workers, queue_size=args.batch_size * 2):
+            pending.add(asyncio.create_task(_one(item)))
+            if len(pending) >= args.batch_size * 2:
+                _, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        await asyncio.gather(*pending)
+
+    asyncio.run(_run())
+    print(f"🏷️  {cascade.stats.summary()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+"""
+clients.py – one place to build (and reuse) tuned OpenAI / OpenRouter clients
+
+Every entry point used to call `OpenAI()` / `AsyncOpenAI()` with default connection settings, and
+`annotate_front_img` re-wrapped its client with `instructor.from_openai` on every call.  Here each
+(provider, settings) combination is built once per process on the SDK's own httpx client
+(`DefaultHttpxClient`, so redirect handling and other SDK defaults are kept) with an explicit
+connection pool (size, keep-alive, optional HTTP/2, timeouts) and cached, as is its instructor wrapper.
+
+`pool_stats(client)` reports how many TCP connections were opened versus how many requests were
+sent, plus the live pool state, so connection reuse can be checked under high concurrency.
+
+Usage:
+    client = get_async_client("openai", max_retries=0)
+    client = get_sync_client("openrouter")
+    structured = get_instructor_client("openrouter", mode=instructor.Mode.JSON)
+    print(pool_stats(client))
+
+Connection settings can be tuned through the environment:
+    OPENAI_MAX_CONNECTIONS, OPENAI_MAX_KEEPALIVE, OPENAI_KEEPALIVE_EXPIRY, OPENAI_HTTP2,
+    OPENAI_CONNECT_TIMEOUT, OPENAI_READ_TIMEOUT
+"""
+from __future__ import annotations
+
+import importlib.util
+import os
+import threading
+from dataclasses import dataclass, field, replace
+from functools import lru_cache
+
+import httpx
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient, DefaultHttpxClient, OpenAI
+
+PROVIDERS = {
+    # provider: (base_url or None for the SDK default / OPENAI_BASE_URL, API-key env var)
+    "openai": (None, "OPENAI_API_KEY"),
+    "openrouter": ("https://openrouter.ai/api/v1", "OPENROUTER_API_KEY"),
+}
+
+
+def _env(name: str, default, cast=float):
+    # read when a client is built, not at import, so values from load_dotenv() are honoured
+    return field(default_factory=lambda: cast(os.getenv(name, default)))
+
+
+@dataclass(frozen=True)
+class PoolConfig:
+    max_connections: int = _env("OPENAI_MAX_CONNECTIONS", 100, int)
+    max_keepalive: int = _env("OPENAI_MAX_KEEPALIVE", 50, int)
+    keepalive_expiry: float = _env("OPENAI_KEEPALIVE_EXPIRY", 60)
+    http2: bool = _env("OPENAI_HTTP2", "0", lambda v: v == "1")
+    connect_timeout: float = _env("OPENAI_CONNECT_TIMEOUT", 10)
+    read_timeout: float = _env("OPENAI_READ_TIMEOUT", 120)
+    max_retries: int = 2                     # SDK-level retries; set 0 when a scheduler owns retries
+
+    def limits(self) -> httpx.Limits:
+        return httpx.Limits(
+            max_connections=self.max_connections,
+            max_keepalive_connections=self.max_keepalive,
+            keepalive_expiry=self.keepalive_expiry,
+        )
+
+    def timeout(self) -> httpx.Timeout:
+        return httpx.Timeout(self.read_timeout, connect=self.connect_timeout)
+
+
+# ───────────────────────────────────────── pool statistics ──
+@dataclass
+class _Counters:
+    requests: int = 0
+    connections_opened: int = 0
+    lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+
+_COUNTERS: dict[int, _Counters] = {}        # id(httpx client) → counters
+
+
+def _http2_available(requested: bool) -> bool:
+    if requested and importlib.util.find_spec("h2") is None:
+        print("⚠️  HTTP/2 requested but the 'h2' package is missing (pip install 'httpx[http2]'); using HTTP/1.1")
+        return False
+    return requested
+
+
+def _sync_hooks(counters: _Counters) -> dict:
+    def _trace(event: str, info: dict) -> None:
+        if event == "connection.connect_tcp.complete":
+            with counters.lock:
+                counters.connections_opened += 1
+
+    def _on_request(request: httpx.Request) -> None:
+        with counters.lock:
+            counters.requests += 1
+        request.extensions["trace"] = _trace
+
+    return {"request": [_on_request]}
+
+
+def _async_hooks(counters: _Counters) -> dict:
+    async def _trace(event: str, info: dict) -> None:
+        if event == "connection.connect_tcp.complete":
+            counters.connections_opened += 1
+
+    async def _on_request(request: httpx.Request) -> None:
+        counters.requests += 1
+        request.extensions["trace"] = _trace
+
+    return {"request": [_on_request]}
+
+
+def pool_stats(client: OpenAI | AsyncOpenAI) -> dict:
+    """Requests sent, TCP connections opened, reuse ratio and the current pool occupancy.
+
+    The pool fields come from private httpx/httpcore attributes; if those move in a newer
+    release they are reported as None instead of raising.
+    """
+    http_client = getattr(client, "_client", None)       # the httpx client the SDK wraps
+    counters = _COUNTERS.get(id(http_client), _Counters())
+    requests = counters.requests
+    stats = {
+        "requests": requests,
+        "connections_opened": counters.connections_opened,
+        "reuse_ratio": 1 - counters.connections_opened / requests if requests else 0.0,
+        "pool_open": None,
+        "pool_idle": None,
+        "pool_max": None,
+    }
+    pool = getattr(getattr(http_client, "_transport", None), "_pool", None)
+    try:
+        connections = list(pool.connections)
+        stats["pool_open"] = len(connections)
+        stats["pool_idle"] = sum(1 for c in connections if c.is_idle())
+    except (AttributeError, TypeError):
+        pass
+    stats["pool_max"] = getattr(pool, "_max_connections", None)
+    return stats
+
+
+# ─────────────────────────────────────────── factories ──
+def _resolve(provider: str, overrides: tuple) -> tuple[str | None, str | None, PoolConfig]:
+    if provider not in PROVIDERS:
+        raise ValueError(f"Unknown provider {provider!r}; expected one of {sorted(PROVIDERS)}")
+    base_url, key_env = PROVIDERS[provider]
+    return base_url, os.getenv(key_env), replace(PoolConfig(), **dict(overrides))
+
+
+@lru_cache(maxsize=None)
+def _sync_client(provider: str, overrides: tuple) -> OpenAI:
+    base_url, api_key, cfg = _resolve(provider, overrides)
+    counters = _Counters()
+    http_client = DefaultHttpxClient(
+        limits=cfg.limits(), timeout=cfg.timeout(), http2=_http2_available(cfg.http2),
+        event_hooks=_sync_hooks(counters),
+    )
+    _COUNTERS[id(http_client)] = counters
+    return OpenAI(api_key=api_key, base_url=base_url, max_retries=cfg.max_retries, http_client=http_client)
+
+
+@lru_cache(maxsize=None)
+def _async_client(provider: str, overrides: tuple) -> AsyncOpenAI:
+    base_url, api_key, cfg = _resolve(provider, overrides)
+    counters = _Counters()
+    http_client = DefaultAsyncHttpxClient(
+        limits=cfg.limits(), timeout=cfg.timeout(), http2=_http2_available(cfg.http2),
+        event_hooks=_async_hooks(counters),
+    )
+    _COUNTERS[id(http_client)] = counters
+    return AsyncOpenAI(api_key=api_key, base_url=base_url, max_retries=cfg.max_retries, http_client=http_client)
+
+
+def get_sync_client(provider: str = "openai", **overrides) -> OpenAI:
+    """Process-wide synchronous client for `provider`; `overrides` are PoolConfig fields."""
+    return _sync_client(provider, tuple(sorted(overrides.items())))
+
+
+def get_async_client(provider: str = "openai", **overrides) -> AsyncOpenAI:
+    """Process-wide async client for `provider`; `overrides` are PoolConfig fields."""
+    return _async_client(provider, tuple(sorted(overrides.items())))
+
+
+@lru_cache(maxsize=None)
+def _instructor_client(provider: str, mode, use_async: bool, overrides: tuple):
+    import instructor                                    # optional dependency, only needed here
+
+    base = _async_client(provider, overrides) if use_async else _sync_client(provider, overrides)
+    return instructor.from_openai(base, mode=mode) if mode is not None else instructor.from_openai(base)
+
+
+def get_instructor_client(provider: str = "openai", mode=None, use_async: bool = False, **overrides):
+    """Instructor-wrapped client built once per (provider, mode, settings) and reused."""
+    return _instructor_client(provider, mode, use_async, tuple(sorted(overrides.items())))
@@ -2,12 +2,63 @@
 """
 OpenAI Vision API Cost Calculator for Garment Analysis
 Comprehensive analysis of costs for processing images at scale
+
+`--scan DIR` replaces the fixed per-detail image-token constants with an exact forecast: only the
+image headers are read (no pixel decoding), each image is resized the way `image_to_base64`
+would (longest side ≤ `--max-side`), and the provider's tile formula is applied to the whole
+corpus as numpy arrays.
+
+`--usage FILE...` streams Batch result JSONL files (any size, constant memory) and totals the
+real `usage` blocks per model, detail level and day, reports the drift from the estimates and –
+with `--update-defaults` – writes the observed token sizes to `cost_calibration.json`, which
+later runs load instead of the built-in assumptions.
+
+Prices come from `pricing.json` (or any JSON/YAML file passed with `--pricing`), one entry per
+model.  `--sweep` evaluates the full grid model × detail × Batch × prompt caching × volume ×
+completion length with numpy, writes the DataFrame with `--out`, and prints the Pareto-optimal
+configurations (cheapest for a given model quality, detail level and turnaround).
+
+Usage:
+    python cost_calculator.py
+    python cost_calculator.py --scan /data/catalogue/ --max-side 512 --detail auto low
+    python cost_calculator.py --usage batch_results/*.output.jsonl --usage-detail auto --update-defaults
+    python cost_calculator.py --sweep --pricing pricing.yaml --volumes 1000 100000 --out sweep.parquet
 """
 
+import argparse
+import os
+from concurrent.futures import ThreadPoolExecutor
+from collections import defaultdict
 from dataclasses import dataclass
-from typing import Dict, List
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
 import json
 
+import numpy as np
+import pandas as pd
+from PIL import Image
+
+from parse_jsonl import iter_lines, loads
+from preprocess import MAX_SIDE
+
+IMAGE_SUFFIXES = {".jpg", ".jpeg", ".png", ".webp"}   # same filter as garment_analyzer_batch.py
+CALIBRATION_FILE = Path(os.getenv("COST_CALIBRATION", "cost_calibration.json"))
+PRICING_FILE = Path(os.getenv("COST_PRICING", Path(__file__).with_name("pricing.json")))
+DETAIL_RANK = {"low": 0, "auto": 1, "high": 2}
+SWEEP_VOLUMES = np.unique(np.geomspace(10, 10_000_000, 61).round().astype(np.int64))
+SWEEP_COMPLETIONS = np.array([20, 45, 100, 200, 400])
+DEFAULT_MODEL = "gpt-4o-2024-08-06"            # the model `image_tokens` / `prompt_sizes` describe
+
+
+def load_pricing(path: Path) -> Dict[str, Dict[str, float]]:
+    """{model: {input_per_1k, output_per_1k, cached_input_per_1k, batch_discount, ...}} from JSON or YAML."""
+    text = path.read_text()
+    if path.suffix.lower() in (".yaml", ".yml"):
+        import yaml                                   # optional: only needed for YAML pricing tables
+        return yaml.safe_load(text)
+    return json.loads(text)
+
 @dataclass
 class CostBreakdown:
     scenario_name: str
@@ -19,17 +70,223 @@ class CostBreakdown:
     savings_percentage: float
     monthly_cost_1k_daily: float
 
+@dataclass
+class TokenDistribution:
+    """Per-image token counts for a scanned corpus at one detail level."""
+    detail: str
+    max_side: int
+    tokens: np.ndarray              # int64, one entry per readable image
+    unreadable: int = 0
+
+    @property
+    def count(self) -> int:
+        return int(self.tokens.size)
+
+    @property
+    def total(self) -> int:
+        return int(self.tokens.sum())
+
+    @property
+    def mean(self) -> float:
+        return float(self.tokens.mean()) if self.tokens.size else 0.0
+
+    def percentiles(self, points=(50, 95, 99)) -> Dict[str, float]:
+        if not self.tokens.size:
+            return {f"p{p}": 0.0 for p in points}
+        return {f"p{p}": float(v) for p, v in zip(points, np.percentile(self.tokens, points))}
+
+    def histogram(self) -> Dict[int, int]:
+        """{tokens per image: number of images} – only a handful of distinct values exist."""
+        values, counts = np.unique(self.tokens, return_counts=True)
+        return dict(zip(values.tolist(), counts.tolist()))
+
+
+def _header_size(path: str) -> Optional[Tuple[int, int]]:
+    try:
+        with Image.open(path) as img:        # lazy: parses the header, pixels are never decoded
+            return img.size
+    except (OSError, SyntaxError, ValueError):
+        return None
+
+
+def scan_image_sizes(image_dir: Path, workers: int = 16) -> Tuple[np.ndarray, np.ndarray, int]:
+    """Read (width, height) from every image header in `image_dir`.
+
+    Returns (widths, heights, unreadable).  Header reads are I/O bound, so a thread pool hides
+    file-open latency on network or cold storage.
+    """
+    with os.scandir(image_dir) as entries:
+        paths = [e.path for e in entries
+                 if e.is_file() and os.path.splitext(e.name)[1].lower() in IMAGE_SUFFIXES]
+    with ThreadPoolExecutor(workers) as pool:
+        sizes = [s for s in pool.map(_header_size, paths, chunksize=256) if s is not None]
+    dims = np.array(sizes, dtype=np.int64).reshape(-1, 2)
+    return dims[:, 0], dims[:, 1], len(paths) - len(sizes)
+
+
+def resized_dimensions(widths: np.ndarray, heights: np.ndarray, max_side: int = MAX_SIDE) -> Tuple[np.ndarray, np.ndarray]:
+    """Dimensions after `Image.thumbnail((max_side, max_side))`, vectorised.
+
+    Shrink only; the long side becomes `max_side` and the short side is floor or ceil of the
+    scaled value, whichever keeps the aspect ratio closer (Pillow's rule, ties go to floor).
+    """
+    w, h = widths.astype(np.float64), heights.astype(np.float64)
+    aspect = w / h
+    landscape = aspect > 1
+    short = np.where(landscape, max_side / aspect, max_side * aspect)
+    lo, hi = np.floor(short), np.ceil(short)
+    lo_err = np.where(landscape, np.abs(aspect - max_side / np.maximum(lo, 1)), np.abs(aspect - lo / max_side))
+    hi_err = np.where(landscape, np.abs(aspect - max_side / hi), np.abs(aspect - hi / max_side))
+    short = np.maximum(np.where(hi_err < lo_err, hi, lo), 1)
+    shrink = (w > max_side) | (h > max_side)
+    new_w = np.where(shrink, np.where(landscape, max_side, short), w).astype(np.int64)
+    new_h = np.where(shrink, np.where(landscape, short, max_side), h).astype(np.int64)
+    return new_w, new_h
+
+
+def tile_tokens(widths: np.ndarray, heights: np.ndarray, detail: str,
+                base_tokens: int = 85, tile_tokens_each: int = 170) -> np.ndarray:
+    """OpenAI image-token formula, vectorised over the corpus.
+
+    low: a flat `base_tokens`.  high (and auto, which we budget as high): fit within 2048×2048,
+    shrink so the shortest side is at most 768, then `base_tokens + tile_tokens_each` per 512px tile.
+    """
+    if detail == "low":
+        return np.full(widths.shape, base_tokens, dtype=np.int64)
+    w, h = widths.astype(np.float64), heights.astype(np.float64)
+    fit = np.minimum(1.0, 2048 / np.maximum(w, h))
+    w, h = w * fit, h * fit
+    short = np.minimum(1.0, 768 / np.minimum(w, h))
+    w, h = w * short, h * short
+    tiles = np.ceil(w / 512) * np.ceil(h / 512)
+    return (base_tokens + tile_tokens_each * tiles).astype(np.int64)
+
+
+@dataclass
+class UsageTotals:
+    """Running sums of the `usage` blocks for one (model, detail, day) group."""
+    requests: int = 0
+    failed: int = 0
+    images: int = 0                 # images classified; more than `requests` for packed requests
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    cached_tokens: int = 0
+    min_prompt: Optional[int] = None
+    max_prompt: Optional[int] = None
+
+    def add(self, usage: dict, images: int = 1) -> None:
+        prompt = usage.get("prompt_tokens", 0)
+        self.requests += 1
+        self.images += images
+        self.prompt_tokens += prompt
+        self.completion_tokens += usage.get("completion_tokens", 0)
+        self.cached_tokens += (usage.get("prompt_tokens_details") or {}).get("cached_tokens", 0)
+        self.min_prompt = prompt if self.min_prompt is None else min(self.min_prompt, prompt)
+        self.max_prompt = prompt if self.max_prompt is None else max(self.max_prompt, prompt)
+
+    def merge(self, other: "UsageTotals") -> None:
+        for name in ("requests", "failed", "images", "prompt_tokens", "completion_tokens", "cached_tokens"):
+            setattr(self, name, getattr(self, name) + getattr(other, name))
+        for name, pick in (("min_prompt", min), ("max_prompt", max)):
+            values = [v for v in (getattr(self, name), getattr(other, name)) if v is not None]
+            setattr(self, name, pick(values) if values else None)
+
+    @property
+    def mean_prompt(self) -> float:
+        return self.prompt_tokens / self.requests if self.requests else 0.0
+
+    @property
+    def mean_completion(self) -> float:
+        return self.completion_tokens / self.requests if self.requests else 0.0
+
+    @property
+    def images_per_request(self) -> float:
+        return self.images / self.requests if self.requests else 0.0
+
+
+def _image_count(body: dict) -> int:
+    """Images a response classified: the length of `items` for a packed request, else 1."""
+    try:
+        content = json.loads(body["choices"][0]["message"]["content"])
+    except (KeyError, IndexError, TypeError, ValueError):
+        return 1
+    items = content.get("items") if isinstance(content, dict) else None
+    return len(items) if isinstance(items, list) and items else 1
+
+
+def iter_usage(path: Path) -> Iterator[Tuple[str, str, Optional[dict], int]]:
+    """Yield (model, UTC day, usage or None for failed requests, images) for every line of a result JSONL."""
+    with path.open("rb") as f:
+        for line in iter_lines(f):
+            try:
+                record = loads(line)
+            except ValueError:
+                yield "unknown", "unknown", None, 0
+                continue
+            if not isinstance(record, dict):                       # not a result record (e.g. a bare list)
+                continue
+            body = (record.get("response") or {}).get("body") or {}
+            day = datetime.fromtimestamp(body["created"], timezone.utc).date().isoformat() if "created" in body else "unknown"
+            usage = body.get("usage")
+            yield body.get("model", "unknown"), day, usage, _image_count(body) if usage else 0
+
+
+def aggregate_usage(paths: Iterable[Path], detail: str = "auto") -> Dict[Tuple[str, str, str], UsageTotals]:
+    """Stream every file once and total usage per (model, detail, day); memory is O(groups)."""
+    totals: Dict[Tuple[str, str, str], UsageTotals] = defaultdict(UsageTotals)
+    for path in paths:
+        for model, day, usage, images in iter_usage(path):
+            group = totals[(model, detail, day)]
+            if usage:
+                group.add(usage, images)
+            else:
+                group.failed += 1
+    return dict(totals)
+
+
+def pareto_front(df: pd.DataFrame) -> np.ndarray:
+    """True for configurations no other configuration beats at the same volume and completion length.
+
+    One configuration dominates another if it is no more expensive, no worse on model quality,
+    detail level and turnaround (interactive beats Batch), and strictly better on at least one.
+    """
+    _, groups = np.unique(np.stack([df["volume"].to_numpy(), df["completion_tokens"].to_numpy()], axis=1),
+                          axis=0, return_inverse=True)
+    groups = groups.ravel()
+    order = np.argsort(groups, kind="stable")
+    size = int(np.count_nonzero(groups == 0))                      # every group has the same grid shape
+    shape = (len(df) // size, size)
+    cost = df["cost_per_image"].to_numpy()[order].reshape(shape)
+    better = np.stack([                                            # larger is better on every axis
+        -cost,
+        df["quality_rank"].to_numpy()[order].reshape(shape),
+        df["detail"].map(DETAIL_RANK).to_numpy(dtype=np.float64)[order].reshape(shape),
+        (~df["batch"].to_numpy())[order].reshape(shape).astype(np.float64),
+    ])                                                             # (objectives, groups, configs)
+    ge = (better[:, :, :, None] >= better[:, :, None, :]).all(axis=0)   # [g, i, j]: i at least as good as j
+    gt = (better[:, :, :, None] > better[:, :, None, :]).any(axis=0)
+    dominated = (ge & gt).any(axis=1)                              # some i dominates j
+    front = np.empty(len(df), dtype=bool)
+    front[order] = ~dominated.ravel()
+    return front
+
+
 class VisionAPICostCalculator:
-    def __init__(self):
+    def __init__(self, calibration: Optional[Path] = CALIBRATION_FILE, pricing: Optional[Path] = PRICING_FILE):
         # Current OpenAI pricing (January 2025)
         self.pricing = {
-            "gpt-4o-2024-08-06": {
+            DEFAULT_MODEL: {
                 "input_per_1k": 0.0025,     # $2.50 per 1M tokens
                 "output_per_1k": 0.010,     # $10.00 per 1M tokens  
                 "cached_input_per_1k": 0.00125,  # 50% discount for cached tokens
                 "batch_discount": 0.5,      # 50% discount for batch API
+                "image_base_tokens": 85,    # per image, every detail level
+                "image_tile_tokens": 170,   # per 512px tile at high/auto detail
+                "quality_rank": 3,          # higher is better; only compared between models
             }
         }
+        if pricing is not None and pricing.exists():
+            self.pricing.update(load_pricing(pricing))
         
         # Token costs for different image detail levels
         self.image_tokens = {
@@ -45,16 +302,110 @@ class VisionAPICostCalculator:
             "completion": 45,          # Structured JSON response
         }
 
+        # Observed sizes from a previous `--usage ... --update-defaults` run override the assumptions
+        self.calibrated_from = None
+        if calibration is not None and calibration.exists():
+            data = json.loads(calibration.read_text())
+            self.image_tokens.update(data.get("image_tokens", {}))
+            self.prompt_sizes.update(data.get("prompt_sizes", {}))
+            self.calibrated_from = calibration
+
+    def scan_image_tokens(self,
+                          image_dir: Path,
+                          details=("low", "auto", "high"),
+                          max_side: int = MAX_SIDE,
+                          model: str = DEFAULT_MODEL) -> Dict[str, TokenDistribution]:
+        """Exact per-image token distribution for every image in `image_dir`, per detail level.
+
+        Headers are scanned once; the resize and tile formula are numpy operations, so a
+        1M-image corpus is forecast in seconds.
+        """
+        price = self.pricing[model]
+        widths, heights, unreadable = scan_image_sizes(image_dir)
+        widths, heights = resized_dimensions(widths, heights, max_side)
+        return {
+            detail: TokenDistribution(
+                detail, max_side,
+                tile_tokens(widths, heights, detail, price["image_base_tokens"], price["image_tile_tokens"]),
+                unreadable,
+            )
+            for detail in details
+        }
+
+    def actual_cost(self, model: str, totals: UsageTotals, use_batch: bool = True) -> Optional[float]:
+        """Cost of the recorded usage at list prices (None for a model missing from `pricing`)."""
+        price = self.pricing.get(model)
+        if price is None:
+            return None
+        fresh = totals.prompt_tokens - totals.cached_tokens
+        cost = (fresh / 1000 * price["input_per_1k"]
+                + totals.cached_tokens / 1000 * price["cached_input_per_1k"]
+                + totals.completion_tokens / 1000 * price["output_per_1k"])
+        return cost * (1 - price["batch_discount"]) if use_batch else cost
+
+    def reference_tiles(self, detail: str, image_size: Tuple[int, int] = (MAX_SIDE, MAX_SIDE),
+                        max_side: int = MAX_SIDE) -> int:
+        """Number of 512px tiles an `image_size` image costs at `detail` after preprocessing (0 for low)."""
+        w, h = resized_dimensions(np.array([image_size[0]]), np.array([image_size[1]]), max_side)
+        return int(tile_tokens(w, h, detail, base_tokens=0, tile_tokens_each=1)[0])
+
+    def model_image_tokens(self, detail: str, model: str = DEFAULT_MODEL) -> int:
+        """Image tokens per request for `model`.
+
+        The default model uses `self.image_tokens` (assumed or calibrated); other models price
+        the tile count of a `MAX_SIDE` reference image with their own base/tile tokens.
+        """
+        if model == DEFAULT_MODEL:
+            return self.image_tokens[detail]
+        price = self.pricing[model]
+        return int(price["image_base_tokens"] + price["image_tile_tokens"] * self.reference_tiles(detail))
+
+    def estimated_prompt_tokens(self, detail: str, model: str = DEFAULT_MODEL) -> int:
+        return (self.prompt_sizes["system_prompt"] + self.prompt_sizes["user_prompt"]
+                + self.model_image_tokens(detail, model))
+
+    def calibrate(self, totals: Dict[Tuple[str, str, str], UsageTotals]) -> Dict:
+        """Replace the assumed token sizes with observed means.
+
+        Prompt text and image tokens arrive as one number, so the text size is only re-derived
+        from low-detail data (where the image is a flat 85 tokens); other detail levels keep the
+        text estimate and take the remainder as their image tokens.
+        """
+        by_detail: Dict[str, UsageTotals] = defaultdict(UsageTotals)
+        for (_, detail, _), group in totals.items():
+            by_detail[detail].merge(group)
+        observed = {d: t for d, t in by_detail.items() if t.requests}
+        if not observed:
+            return {}
+        if "low" in observed:
+            text = observed["low"].mean_prompt - self.image_tokens["low"] - self.prompt_sizes["user_prompt"]
+            self.prompt_sizes["system_prompt"] = max(round(text), 0)
+        text = self.prompt_sizes["system_prompt"] + self.prompt_sizes["user_prompt"]
+        for detail, group in observed.items():
+            if detail != "low":
+                self.image_tokens[detail] = max(round(group.mean_prompt - text), 0)
+        requests = sum(t.requests for t in observed.values())
+        self.prompt_sizes["completion"] = round(sum(t.completion_tokens for t in observed.values()) / requests)
+        return {"image_tokens": dict(self.image_tokens), "prompt_sizes": dict(self.prompt_sizes),
+                "requests": requests, "updated": datetime.now(timezone.utc).isoformat(timespec="seconds")}
+
     def calculate_single_call_cost(self, 
                                  image_detail: str = "auto",
                                  use_batch: bool = False,
-                                 cache_system_prompt: bool = False) -> Dict:
-        """Calculate cost for a single API call."""
+                                 cache_system_prompt: bool = False,
+                                 image_tokens: Optional[float] = None,
+                                 model: str = DEFAULT_MODEL) -> Dict:
+        """Calculate cost for a single API call to `model`.
+
+        `image_tokens` overrides the per-detail estimate, e.g. with a scanned corpus mean.
+        """
         
         # Token calculations
+        price = self.pricing[model]
         system_tokens = self.prompt_sizes["system_prompt"]
         user_tokens = self.prompt_sizes["user_prompt"] 
-        image_tokens = self.image_tokens[image_detail]
+        if image_tokens is None:
+            image_tokens = self.model_image_tokens(image_detail, model)
         completion_tokens = self.prompt_sizes["completion"]
         
         # Input cost calculation
@@ -65,21 +416,21 @@ class VisionAPICostCalculator:
             cached_tokens = 0
             fresh_tokens = system_tokens + user_tokens
             
-        fresh_input_cost = (fresh_tokens / 1000) * self.pricing["gpt-4o-2024-08-06"]["input_per_1k"]
-        cached_input_cost = (cached_tokens / 1000) * self.pricing["gpt-4o-2024-08-06"]["cached_input_per_1k"]
-        image_cost = (image_tokens / 1000) * self.pricing["gpt-4o-2024-08-06"]["input_per_1k"]
+        fresh_input_cost = (fresh_tokens / 1000) * price["input_per_1k"]
+        cached_input_cost = (cached_tokens / 1000) * price["cached_input_per_1k"]
+        image_cost = (image_tokens / 1000) * price["input_per_1k"]
         
         input_cost = fresh_input_cost + cached_input_cost + image_cost
         
         # Output cost
-        output_cost = (completion_tokens / 1000) * self.pricing["gpt-4o-2024-08-06"]["output_per_1k"]
+        output_cost = (completion_tokens / 1000) * price["output_per_1k"]
         
         # Total before batch discount
         subtotal = input_cost + output_cost
         
         # Apply batch discount
         if use_batch:
-            batch_savings = subtotal * self.pricing["gpt-4o-2024-08-06"]["batch_discount"]
+            batch_savings = subtotal * price["batch_discount"]
             total_cost = subtotal - batch_savings
         else:
             batch_savings = 0
@@ -93,8 +444,8 @@ class VisionAPICostCalculator:
             "text_tokens": fresh_tokens + cached_tokens,
             "batch_savings": batch_savings,
             "cached_savings": (cached_tokens / 1000) * (
-                self.pricing["gpt-4o-2024-08-06"]["input_per_1k"] - 
-                self.pricing["gpt-4o-2024-08-06"]["cached_input_per_1k"]
+                price["input_per_1k"] - 
+                price["cached_input_per_1k"]
             ) if cache_system_prompt else 0
         }
 
@@ -138,9 +489,8 @@ class VisionAPICostCalculator:
         
         return results
 
-    def calculate_scale_analysis(self) -> Dict:
+    def calculate_scale_analysis(self, scales=(10, 100, 1000, 10000, 100000)) -> Dict:
         """Analyze costs at different scales."""
-        scales = [10, 100, 1000, 10000, 100000]
         
         # Best case scenario: Batch + Caching + Auto detail
         single_cost = self.calculate_single_call_cost("auto", True, True)["total_cost"]
@@ -158,6 +508,54 @@ class VisionAPICostCalculator:
         
         return analysis
 
+    def sweep(self,
+              models: Optional[List[str]] = None,
+              details=("low", "auto", "high"),
+              volumes: np.ndarray = SWEEP_VOLUMES,
+              completion_tokens: np.ndarray = SWEEP_COMPLETIONS,
+              image_size: Tuple[int, int] = (MAX_SIDE, MAX_SIDE),
+              max_side: int = MAX_SIDE) -> pd.DataFrame:
+        """Cost of every model × detail × Batch × caching × volume × completion-length combination.
+
+        The grid is built with numpy broadcasting, so tens of thousands of scenarios take
+        milliseconds.  Every model is charged for the same whole number of 512px tiles – those of
+        an `image_size` image resized to `max_side` – at its own base/tile token rates.
+        """
+        models = models or list(self.pricing)
+        tiles = {d: self.reference_tiles(d, image_size, max_side) for d in details}
+
+        m, d, b, c, v, n = (a.ravel() for a in np.meshgrid(
+            np.arange(len(models)), np.arange(len(details)), [False, True], [False, True],
+            np.asarray(volumes), np.asarray(completion_tokens), indexing="ij",
+        ))
+        keys = ("input_per_1k", "output_per_1k", "cached_input_per_1k", "batch_discount",
+                "image_base_tokens", "image_tile_tokens", "quality_rank")
+        missing = {name: [k for k in keys if k not in self.pricing[name]] for name in models}
+        missing = {name: ks for name, ks in missing.items() if ks}
+        if missing:
+            raise ValueError(f"Pricing entries are missing keys needed for the sweep: {missing}")
+        price = {key: np.array([self.pricing[name][key] for name in models], dtype=np.float64)[m] for key in keys}
+        is_low = np.array([detail == "low" for detail in details])[d]
+        image = price["image_base_tokens"] + np.where(
+            is_low, 0, price["image_tile_tokens"] * np.array([tiles[x] for x in details])[d])
+
+        system, user = self.prompt_sizes["system_prompt"], self.prompt_sizes["user_prompt"]
+        cached = np.where(c, system, 0)
+        fresh = system + user - cached + image
+        per_image = (fresh * price["input_per_1k"] + cached * price["cached_input_per_1k"]
+                     + n * price["output_per_1k"]) / 1000 * np.where(b, 1 - price["batch_discount"], 1)
+
+        df = pd.DataFrame({
+            "model": pd.Categorical.from_codes(m, models),
+            "detail": pd.Categorical.from_codes(d, list(details)),
+            "batch": b, "cache_prompt": c, "volume": v, "completion_tokens": n,
+            "image_tokens": image.round().astype(np.int64),
+            "quality_rank": price["quality_rank"],
+            "cost_per_image": per_image, "total_cost": per_image * v,
+        })
+        df["pareto"] = pareto_front(df)
+        return df
+
     def print_comprehensive_analysis(self):
         """Print a comprehensive cost analysis."""
         
@@ -267,6 +665,148 @@ class VisionAPICostCalculator:
         
         print("\n" + "=" * 80)
 
+    def print_corpus_forecast(self, image_dir: Path, details=("low", "auto", "high"), max_side: int = MAX_SIDE):
+        """Scan `image_dir` and print the exact token distribution and cost forecast per detail."""
+
+        distributions = self.scan_image_tokens(image_dir, details, max_side)
+        first = next(iter(distributions.values()))
+        print(f"🔍 CORPUS FORECAST: {first.count:,} images in {image_dir} "
+              f"(resized to ≤{max_side}px, {first.unreadable} unreadable)")
+        print("=" * 80)
+        print(f"{'Detail':<8} {'Mean':>7} {'p50':>6} {'p95':>6} {'Max':>6} {'Image tokens':>14} "
+              f"{'Individual':>12} {'Batch+Cache':>12}")
+        print("-" * 80)
+        for detail, dist in distributions.items():
+            pct = dist.percentiles()
+            individual = self.calculate_single_call_cost(detail, False, False, dist.mean)["total_cost"]
+            optimised = self.calculate_single_call_cost(detail, True, True, dist.mean)["total_cost"]
+            print(f"{detail:<8} {dist.mean:>7.1f} {pct['p50']:>6.0f} {pct['p95']:>6.0f} "
+                  f"{int(dist.tokens.max(initial=0)):>6} {dist.total:>14,} "
+                  f"{f'${individual * dist.count:,.2f}':>12} {f'${optimised * dist.count:,.2f}':>12}")
+        print()
+        for detail, dist in distributions.items():
+            print(f"   {detail:<5} tokens/image → images: {dist.histogram()}")
+
+    def print_usage_reconciliation(self, paths: List[Path], detail: str = "auto", use_batch: bool = True,
+                                   update_defaults: bool = False, calibration: Path = CALIBRATION_FILE):
+        """Total the real usage in `paths`, compare it with the estimates and optionally recalibrate."""
+
+        totals = aggregate_usage(paths, detail)
+        print(f"🧾 ACTUAL USAGE: {len(paths)} result file(s), "
+              f"{'Batch' if use_batch else 'interactive'} prices")
+        print("=" * 96)
+        print(f"{'Model':<22} {'Detail':<6} {'Day':<11} {'OK':>8} {'Failed':>6} {'Prompt':>12} "
+              f"{'Cached':>10} {'Completion':>11} {'Cost':>10}")
+        print("-" * 96)
+        for (model, group_detail, day), group in sorted(totals.items()):
+            cost = self.actual_cost(model, group, use_batch)
+            print(f"{model:<22} {group_detail:<6} {day:<11} {group.requests:>8,} {group.failed:>6,} "
+                  f"{group.prompt_tokens:>12,} {group.cached_tokens:>10,} {group.completion_tokens:>11,} "
+                  f"{'n/a' if cost is None else f'${cost:,.2f}':>10}")
+
+        print()
+        print("📐 DRIFT FROM ESTIMATES (per image):")
+        print("-" * 72)
+        by_model: Dict[Tuple[str, str], UsageTotals] = defaultdict(UsageTotals)
+        for (model, group_detail, _), group in totals.items():
+            by_model[(model, group_detail)].merge(group)
+        for (model, group_detail), group in sorted(by_model.items()):
+            if not group.requests:
+                continue
+            if model not in self.pricing:
+                print(f"   {model} / {group_detail}  (no pricing entry; skipped)")
+                continue
+            images = max(group.images, group.requests)
+            estimate = self.calculate_single_call_cost(group_detail, use_batch, False, model=model)["total_cost"]
+            cost = self.actual_cost(model, group, use_batch)
+            rows = [
+                ("prompt tokens", group.prompt_tokens / images, self.estimated_prompt_tokens(group_detail, model)),
+                ("completion tokens", group.completion_tokens / images, self.prompt_sizes["completion"]),
+                ("cost ($)", cost / images, estimate),
+            ]
+            print(f"   {model} / {group_detail}  (prompt tokens {group.min_prompt}–{group.max_prompt}, "
+                  f"{group.cached_tokens / max(group.prompt_tokens, 1):.0%} cached)")
+            if group.images > group.requests:
+                print(f"      packed: {group.images_per_request:.1f} images/request – actuals are per image, "
+                      f"and the shared prompt text is spread over each pack")
+            for label, actual, expected in rows:
+                drift = (actual - expected) / expected if expected else 0.0
+                print(f"      {label:<18} actual {actual:>10.4f}  estimate {expected:>10.4f}  drift {drift:+.1%}")
+
+        if update_defaults:
+            calibration.write_text(json.dumps({**self.calibrate(totals), "source": [str(p) for p in paths]}, indent=2))
+            print(f"\n💾 Updated defaults written to {calibration}: "
+                  f"image_tokens={self.image_tokens} prompt_sizes={self.prompt_sizes}")
+
+    def print_sweep(self, df: pd.DataFrame, top: int = 12):
+        """Print the cheapest Pareto-optimal configurations at a few volumes of the sweep."""
+
+        volumes = np.sort(df["volume"].unique())
+        if len(volumes) > 4:
+            volumes = volumes[np.linspace(0, len(volumes) - 1, 4).astype(int)]
+        lengths = df["completion_tokens"].unique()
+        completion = lengths[np.abs(lengths - self.prompt_sizes["completion"]).argmin()]
+
+        front = df[df["pareto"]]
+        print(f"🧮 SCENARIO SWEEP: {len(df):,} scenarios, {len(front):,} Pareto-optimal")
+        print("=" * 92)
+        for volume in volumes:
+            group = front[(front["volume"] == volume) & (front["completion_tokens"] == completion)]
+            print(f"📦 {volume:,} images, {completion} completion tokens")
+            for row in group.sort_values("total_cost").head(top).itertuples():
+                mode = "batch" if row.batch else "interactive"
+                print(f"   {row.model:<20} {row.detail:<5} {mode:<12} {'cached' if row.cache_prompt else '':<7}"
+                      f"{row.image_tokens:>6} img tok  ${row.cost_per_image:.5f}/image  ${row.total_cost:,.2f}")
+        print()
+
 if __name__ == "__main__":
-    calculator = VisionAPICostCalculator()
-    calculator.print_comprehensive_analysis() 
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="OpenAI Vision API cost analysis for garment classification.")
+    parser.add_argument("--scan", type=Path, default=None,
+                        help="Forecast exact image tokens for every image in this directory")
+    parser.add_argument("--max-side", type=int, default=MAX_SIDE,
+                        help="Longest side after preprocessing (as in image_to_base64)")
+    parser.add_argument("--detail", nargs="+", default=["low", "auto", "high"], choices=["low", "auto", "high"])
+    parser.add_argument("--usage", type=Path, nargs="+", default=None,
+                        help="Batch result JSONL file(s) to total actual usage and cost from")
+    parser.add_argument("--usage-detail", default="auto", choices=["low", "auto", "high"],
+                        help="Image detail the --usage requests were sent with")
+    parser.add_argument("--interactive", action="store_true",
+                        help="Price --usage at interactive rates (default: Batch discount)")
+    parser.add_argument("--update-defaults", action="store_true",
+                        help="Write the observed token sizes to the calibration file")
+    parser.add_argument("--calibration", type=Path, default=CALIBRATION_FILE,
+                        help="Calibration file loaded at start-up and written by --update-defaults")
+    parser.add_argument("--pricing", type=Path, default=PRICING_FILE, help="Pricing table (JSON or YAML)")
+    parser.add_argument("--sweep", action="store_true",
+                        help="Evaluate every model × detail × batch × caching × volume × completion scenario")
+    parser.add_argument("--models", nargs="+", default=None, help="Models to sweep (default: all priced)")
+    parser.add_argument("--volumes", type=int, nargs="+", default=None, help="Image volumes to sweep")
+    parser.add_argument("--completion", type=int, nargs="+", default=None, help="Completion lengths to sweep")
+    parser.add_argument("--image-size", type=int, nargs=2, default=None, metavar=("W", "H"),
+                        help="Source image size the sweep's tile counts are taken from (default: --max-side square)")
+    parser.add_argument("--out", type=Path, default=None, help="Write the sweep DataFrame (.csv or .parquet)")
+    args = parser.parse_args()
+
+    calculator = VisionAPICostCalculator(args.calibration, args.pricing)
+    if calculator.calibrated_from:
+        print(f"📎 Using calibrated token sizes from {calculator.calibrated_from}\n")
+    if args.sweep:
+        sweep = calculator.sweep(
+            args.models,
+            volumes=SWEEP_VOLUMES if args.volumes is None else np.array(args.volumes),
+            completion_tokens=SWEEP_COMPLETIONS if args.completion is None else np.array(args.completion),
+            image_size=tuple(args.image_size or (args.max_side, args.max_side)),
+            max_side=args.max_side,
+        )
+        calculator.print_sweep(sweep)
+        if args.out:
+            sweep.to_parquet(args.out) if args.out.suffix == ".parquet" else sweep.to_csv(args.out, index=False)
+            print(f"💾 Saved {len(sweep):,} scenarios to {args.out}")
+    elif args.usage:
+        calculator.print_usage_reconciliation(
+            args.usage, args.usage_detail, not args.interactive, args.update_defaults, args.calibration
+        )
+    elif args.scan:
+        calculator.print_corpus_forecast(args.scan, args.detail, args.max_side)
+    else:
+        calculator.print_comprehensive_analysis() 
\ No newline at end of file
@@ -2,103 +2,233 @@
 """
 garment_batch_job.py – submit a vision-classification Batch job
 
+Tasks are streamed straight to disk and split into shards that respect the Batch API's
+per-file limits (requests and bytes); a manifest maps every custom_id to its shard, so memory
+stays flat whether the folder holds 1k or 1M images.  The shards are handed to `BatchManager`
+(see batch_manager.py), which submits them and – with `--wait` – polls, downloads and resubmits
+failed requests until every job is done.
+
 Usage:
     python garment_batch_job.py /home/nauman/data/wargon/test_images/ 
+    python garment_batch_job.py /data/catalogue/ --outdir shards/ --max-requests 50000 --max-mb 190 --wait
+    python garment_batch_job.py /data/catalogue/ --pack 16      # 16 images per task (see packing.py)
 """
 from __future__ import annotations
 
 import argparse
 import json
+import os
 from pathlib import Path
+from itertools import islice
+from typing import Iterable, Iterator
 
 from dotenv import load_dotenv
-from openai import OpenAI, OpenAIError
 
 # --- reuse the “strict” script so the prompt & helpers stay in one place ----------
 from garment_analyzer_strict import (
     SYSTEM_PROMPT,               # full controlled-vocabulary prompt  :contentReference[oaicite:0]{index=0}
-    image_to_base64,             # down-size & encode helper          :contentReference[oaicite:1]{index=1}
+    PACK_SYSTEM_PROMPT, PACK_USER_PROMPT, max_pack_size,
 )
+from packing import pack_ids, pack_max_tokens, pack_messages
+from clients import get_sync_client
+from batch_manager import RESULTS_DIR, STATE_FILE, BatchManager
+from image_cache import CACHE_DIR, CACHE_MAX_BYTES, ImageCache
+from preprocess import WORKERS, preprocess_iter   # same resize/quality path, run in a process pool
 # -------------------------------------------------------------------------------
 
 load_dotenv("/home/nauman/.env")                    # so OPENAI_API_KEY is picked up by the SDK
-client = OpenAI()                # ← synchronous client is fine for Batch
+client = get_sync_client("openai")   # ← shared synchronous client is fine for Batch
 
 MODEL          = "gpt-4o-2024-08-06"   # keep in sync with garment_analyzer_strict.py
 TEMPERATURE    = 0
 IMAGE_DETAIL   = "auto"
 MAX_TOKENS     = 256
 OUTFILE        = Path("garment_batch_tasks.jsonl")
+IMAGE_SUFFIXES = {".jpg", ".jpeg", ".png", ".webp"}
+MAX_REQUESTS_PER_FILE = 50_000          # Batch API: requests per input file
+MAX_BYTES_PER_FILE    = 200_000_000     # Batch API: 200 MB per input file
 
 
-def build_tasks(image_dir: Path) -> list[dict]:
-    """Create one Batch-API task per image (Base64 inlined)."""
-    img_paths = sorted(
-        p for p in image_dir.iterdir()
-        if p.suffix.lower() in {".jpg", ".jpeg", ".png", ".webp"}
-    )
-    tasks: list[dict] = []
-
-    for idx, path in enumerate(img_paths):
-        b64 = image_to_base64(path)                # identical resize/quality path
-        task = {
-            "custom_id": path.stem,
-            "method": "POST",
-            "url": "/v1/chat/completions",
-            "body": {
-                "model": MODEL,
-                "temperature": TEMPERATURE,
-                "max_tokens": MAX_TOKENS,
-                "response_format": {"type": "json_object"},
-                "messages": [
-                    {"role": "system", "content": SYSTEM_PROMPT},
-                    {
-                        "role": "user",
-                        "content": [
-                            {"type": "text", "text": "Analyse this garment."},
-                            {
-                                "type": "image_url",
-                                "image_url": {
-                                    "url": f"data:image/jpeg;base64,{b64}",
-                                    "detail": IMAGE_DETAIL,
-                                },
+def iter_image_paths(image_dir: Path) -> Iterator[Path]:
+    """Yield image files sorted by name, so shard contents are reproducible across runs."""
+    with os.scandir(image_dir) as entries:
+        names = sorted(
+            entry.name for entry in entries
+            if entry.is_file() and os.path.splitext(entry.name)[1].lower() in IMAGE_SUFFIXES
+        )
+    for name in names:
+        yield image_dir / name
+
+
+def make_task(custom_id: str, b64: str) -> dict:
+    """One Batch-API chat-completions task with the image inlined as Base64."""
+    return {
+        "custom_id": custom_id,
+        "method": "POST",
+        "url": "/v1/chat/completions",
+        "body": {
+            "model": MODEL,
+            "temperature": TEMPERATURE,
+            "max_tokens": MAX_TOKENS,
+            "response_format": {"type": "json_object"},
+            "messages": [
+                {"role": "system", "content": SYSTEM_PROMPT},
+                {
+                    "role": "user",
+                    "content": [
+                        {"type": "text", "text": "Analyse this garment."},
+                        {
+                            "type": "image_url",
+                            "image_url": {
+                                "url": f"data:image/jpeg;base64,{b64}",
+                                "detail": IMAGE_DETAIL,
                             },
-                        ],
-                    },
-                ],
-            },
-        }
-        tasks.append(task)
+                        },
+                    ],
+                },
+            ],
+        },
+    }
+
+
+def make_pack_task(custom_id: str, images: list[tuple[str, str]]) -> dict:
+    """One Batch-API task carrying several (image_id, Base64 JPEG) images; answers `{"items": [...]}`."""
+    return {
+        "custom_id": custom_id,
+        "method": "POST",
+        "url": "/v1/chat/completions",
+        "body": {
+            "model": MODEL,
+            "temperature": TEMPERATURE,
+            "max_tokens": pack_max_tokens(len(images)),
+            "response_format": {"type": "json_object"},
+            "messages": pack_messages(PACK_SYSTEM_PROMPT, PACK_USER_PROMPT, images, IMAGE_DETAIL),
+        },
+    }
+
+
+def iter_tasks(
+    image_dir: Path, workers: int = WORKERS, cache: ImageCache | None = None, pack: int = 1
+) -> Iterator[dict]:
+    """Yield one Batch-API task per image (or per `pack` images), preprocessing in `workers` processes.
+
+    Packed tasks get custom_id `pack-000000`, `pack-000001`, …; the image stems are the image IDs.
+    """
+    items = preprocess_iter(iter_image_paths(image_dir), workers=workers, cache=cache)
+    size = max_pack_size(pack, tpm=None, detail=IMAGE_DETAIL) if pack > 1 else 1
+    n = 0
+    while chunk := list(islice(items, size)):
+        for item in chunk:
+            if item.error is not None:
+                raise RuntimeError(f"Failed to preprocess {item.path}: {item.error}")
+        if size == 1:
+            yield make_task(chunk[0].path.stem, chunk[0].b64)
+        else:
+            yield make_pack_task(f"pack-{n:06d}", [(item.path.stem, item.b64) for item in chunk])
+        n += 1
+
+
+def build_tasks(
+    image_dir: Path, workers: int = WORKERS, cache: ImageCache | None = None, pack: int = 1
+) -> list[dict]:
+    """Create one Batch-API task per image (Base64 inlined), preprocessing in `workers` processes.
+
+    Holds every task in memory – prefer `iter_tasks` + `ShardedJSONLWriter` for large folders.
+    """
+    tasks = list(iter_tasks(image_dir, workers, cache, pack))
 
     # --- sanity check ----------------------------------------------------------
-    if len(tasks) != len(img_paths):           # should never happen, but be safe
+    n_images = sum(1 for _ in iter_image_paths(image_dir))
+    n_tasked = sum(len(pack_ids(task) or [None]) for task in tasks)
+    if n_tasked != n_images:                   # should never happen, but be safe
         raise RuntimeError(
-            f"Found {len(img_paths)} images but built {len(tasks)} tasks."
+            f"Found {n_images} images but built tasks for {n_tasked}."
         )
     return tasks
 
 
-def write_jsonl(tasks: list[dict], outfile: Path) -> None:
+def write_jsonl(tasks: Iterable[dict], outfile: Path) -> None:
     with outfile.open("w") as f:
         for obj in tasks:
             f.write(json.dumps(obj) + "\n")
 
 
-def submit_batch(jsonl_file: Path, window: str):
-    """Upload JSONL & create Batch job."""
-    try:
-        batch_file = client.files.create(file=jsonl_file.open("rb"), purpose="batch")
-        print(f"📤  Uploaded tasks file – id: {batch_file.id}")
+class ShardedJSONLWriter:
+    """Stream tasks to `<prefix>-00000.jsonl`, `<prefix>-00001.jsonl`, … rolling over before a shard
+    would exceed `max_requests` lines or `max_bytes` bytes.  `<prefix>.manifest.jsonl` records
+    `{"custom_id", "shard", "line"}` for every task as it is written (plus `"images"` for packed tasks)."""
+
+    def __init__(
+        self,
+        outdir: Path,
+        prefix: str = OUTFILE.stem,
+        max_requests: int = MAX_REQUESTS_PER_FILE,
+        max_bytes: int = MAX_BYTES_PER_FILE,
+    ):
+        self.outdir = outdir
+        self.prefix = prefix
+        self.max_requests = max_requests
+        self.max_bytes = max_bytes
+        self.shards: list[Path] = []
+        self.total = 0
+        self._file = None
+        self._lines = 0
+        self._bytes = 0
+        outdir.mkdir(parents=True, exist_ok=True)
+        self.manifest_path = outdir / f"{prefix}.manifest.jsonl"
+        self._manifest = self.manifest_path.open("w", encoding="utf-8")
+
+    def _roll(self) -> None:
+        if self._file is not None:
+            self._file.close()
+        path = self.outdir / f"{self.prefix}-{len(self.shards):05d}.jsonl"
+        self.shards.append(path)
+        self._file = path.open("wb")
+        self._lines = self._bytes = 0
+
+    def write(self, task: dict) -> None:
+        line = (json.dumps(task) + "\n").encode()
+        if len(line) > self.max_bytes:
+            raise ValueError(f"Task {task['custom_id']} alone is {len(line)} bytes (> {self.max_bytes}).")
+        if (
+            self._file is None
+            or self._lines >= self.max_requests
+            or self._bytes + len(line) > self.max_bytes
+        ):
+            self._roll()
+        self._file.write(line)
+        entry = {"custom_id": task["custom_id"], "shard": self.shards[-1].name, "line": self._lines}
+        if images := pack_ids(task):
+            entry["images"] = images
+        self._manifest.write(json.dumps(entry) + "\n")
+        self._lines += 1
+        self._bytes += len(line)
+        self.total += 1
+
+    def close(self) -> list[Path]:
+        if self._file is not None:
+            self._file.close()
+        self._manifest.close()
+        return self.shards
+
+    def __enter__(self) -> ShardedJSONLWriter:
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
 
-        job = client.batches.create(
-            input_file_id=batch_file.id,
-            endpoint="/v1/chat/completions",
-            completion_window=window, 
-        )
-        print("🚀  Batch job submitted successfully!\n")
-        print(job)                              # prints id, status, etc.
-    except OpenAIError as err:
-        print(f"❌  Batch submission failed: {err}")
+
+def write_sharded(
+    tasks: Iterable[dict],
+    outdir: Path,
+    max_requests: int = MAX_REQUESTS_PER_FILE,
+    max_bytes: int = MAX_BYTES_PER_FILE,
+) -> tuple[list[Path], int]:
+    """Write a task stream to size-bounded shards; returns (shard paths, number of tasks)."""
+    with ShardedJSONLWriter(outdir, max_requests=max_requests, max_bytes=max_bytes) as writer:
+        for task in tasks:
+            writer.write(task)
+    return writer.shards, writer.total
 
 
 def main() -> None:
@@ -109,13 +239,57 @@ def main() -> None:
     parser.add_argument(
         "--window", default="24h", help="Batch completion window (e.g. 1h, 24h)"
     )
+    parser.add_argument(
+        "--wait", action="store_true", help="Poll until every batch is done and results are downloaded"
+    )
+    parser.add_argument(
+        "--workers", type=int, default=WORKERS, help="Image preprocessing processes"
+    )
+    parser.add_argument(
+        "--outdir", type=Path, default=Path("."), help="Directory for task shards and manifest"
+    )
+    parser.add_argument(
+        "--max-requests", type=int, default=MAX_REQUESTS_PER_FILE, help="Max tasks per shard"
+    )
+    parser.add_argument(
+        "--max-mb", type=float, default=MAX_BYTES_PER_FILE / 1e6, help="Max shard size in MB"
+    )
+    parser.add_argument(
+        "--cache-dir", type=Path, default=CACHE_DIR, help="Preprocessed-image cache directory"
+    )
+    parser.add_argument(
+        "--cache-max-gb", type=float, default=CACHE_MAX_BYTES / 2**30, help="Image cache size cap"
+    )
+    parser.add_argument(
+        "--no-cache", action="store_true", help="Always re-encode images"
+    )
+    parser.add_argument(
+        "--pack", type=int, default=1, help="Images per task (capped by token limits)"
+    )
     args = parser.parse_args()
 
-    tasks = build_tasks(args.folder)
-    write_jsonl(tasks, OUTFILE)
-    print(f"📝  Wrote {len(tasks)} tasks to {OUTFILE}")
+    cache = None if args.no_cache else ImageCache(args.cache_dir, int(args.cache_max_gb * 2**30))
+    try:
+        shards, total = write_sharded(
+            iter_tasks(args.folder, args.workers, cache, args.pack),
+            args.outdir,
+            max_requests=args.max_requests,
+            max_bytes=int(args.max_mb * 1e6),
+        )
+    finally:
+        if cache is not None:
+            cache.close()
+            print(f"🗄️  {cache.stats.summary()}")
+    print(f"📝  Wrote {total} tasks to {len(shards)} shard(s) in {args.outdir}")
 
-    submit_batch(OUTFILE, args.window)
+    manager = BatchManager(args.outdir / STATE_FILE.name, args.outdir / RESULTS_DIR.name, args.window, client=client)
+    for shard in shards:
+        manager.add(shard)
+    if args.wait:
+        manager.run()                              # poll, download, resubmit failures until done
+    else:
+        manager.step()                             # upload + submit; resume later with batch_manager.py run
+        manager.print_status()
 
 
 if __name__ == "__main__":
@@ -4,32 +4,48 @@ Requires: openai>=1.16.0, pydantic>=2.7, pillow, python-dotenv
 
 Usage:
     python garment_analyzer_strict.py /home/nauman/data/wargon/test_images/test1.jpg /home/nauman/data/wargon/test_images/test2.jpg
+    python garment_analyzer_strict.py /home/nauman/data/wargon/test_images/*.jpg --concurrency 32 --rpm 500 --tpm 200000
+    python garment_analyzer_strict.py /home/nauman/data/wargon/test_images/*.jpg --pack 16   # 16 images per request
+    python garment_analyzer_strict.py /home/nauman/data/wargon/test_images/*.jpg --cascade   # local SigLIP first
+    python garment_analyzer_strict.py /home/nauman/data/wargon/test_images/*.jpg --checkpoint run.sqlite   # resumable
 """
 from __future__ import annotations
 
 import asyncio
-import base64
 import json
 import os
 from enum import Enum
-from io import BytesIO
 from pathlib import Path
 from typing import Iterable
 
+import numpy as np
+
 from dotenv import load_dotenv
-from openai import AsyncOpenAI, OpenAIError
+from openai import BadRequestError, LengthFinishReasonError, OpenAIError
 from pydantic import BaseModel, Field, ValidationError
-from PIL import Image
+
+from cascade import CASCADE_MODEL, Cascade, parse_thresholds
+from clients import get_async_client, pool_stats
+from packing import ITEM_PROMPT_TOKENS, PackItemMissing, RequestPacker, pack_max_tokens, pack_messages, pack_size
+from image_cache import CACHE_DIR, CACHE_MAX_BYTES, ImageCache
+from run_store import CHECKPOINT_DB, RunStore
+from result_cache import MAX_DISTANCE, RESULTS_DB, ResultStore, prompt_hash
+from cost_calculator import resized_dimensions, tile_tokens
+from preprocess import MAX_SIDE, WORKERS, Preprocessed, preprocess_stream
+from scheduler import RequestScheduler, ThroughputStats
 
 # ─────────────────────────────────────── configuration ──
 load_dotenv("/home/nauman/.env")
-API_KEY = os.getenv("OPENAI_API_KEY")
 MODEL = os.getenv("OPENAI_VISION_MODEL", "gpt-4o-2024-08-06")  # vision-enabled model (e.g. gpt-4.1, gpt-4o-mini)
 TEMPERATURE = float(os.getenv("OPENAI_TEMPERATURE", 0))  # deterministic classification
 IMAGE_DETAIL = os.getenv("OPENAI_IMAGE_DETAIL", "auto")   # "low"|"auto"|"high"
 MAX_TOKENS = 256
+CONCURRENCY = int(os.getenv("OPENAI_CONCURRENCY", 16))   # max in-flight requests
+RPM_LIMIT = float(os.getenv("OPENAI_RPM", 500))          # requests per minute for MODEL on our tier
+TPM_LIMIT = float(os.getenv("OPENAI_TPM", 200_000))      # tokens per minute for MODEL on our tier
 
-client = AsyncOpenAI(api_key=API_KEY)
+# shared, pooled client; retries are owned by the scheduler (shared backoff + Retry-After), not by the SDK
+client = get_async_client("openai", max_retries=0, max_connections=max(CONCURRENCY, 100))
 
 # ─────────────────────────────── controlled vocabularies ──
 class Color(str, Enum):
@@ -56,6 +72,19 @@ class GarmentAnalysis(BaseModel):
     category: Category = Field(..., description="Target demographic")
     price: Price = Field(..., description="Estimated price range")
 
+VOCABULARIES = {
+    name: [member.value for member in enum]
+    for name, enum in (("color", Color), ("trend", Trend), ("category", Category), ("price", Price))
+}
+
+class PackedGarment(GarmentAnalysis):
+    """One image's classification inside a packed (multi-image) response."""
+    image_id: str = Field(..., description="The image_id given just before the image")
+
+class GarmentPack(BaseModel):
+    """Structured classification of every image in a packed request."""
+    items: list[PackedGarment]
+
 # ──────────────────────────────────────── prompts ──
 ALLOWED_VALUES = (
     f"- color: {{{', '.join(c.value for c in Color)}}}\n"
@@ -72,22 +101,60 @@ SYSTEM_PROMPT = (
     f"{ALLOWED_VALUES}"
 )
 
-# ───────────────────────────── helper functions ──
-def image_to_base64(path: Path, max_side: int = 512, quality: int = 88) -> str:
-    """Open, RGB‑convert, thumbnail and base64‑encode an image."""
-    with Image.open(path) as img:
-        if img.mode != "RGB":
-            img = img.convert("RGB")
-        img.thumbnail((max_side, max_side), Image.Resampling.LANCZOS)
-        buf = BytesIO()
-        img.save(buf, format="JPEG", quality=quality)
-        return base64.b64encode(buf.getvalue()).decode()
+USER_PROMPT = "Analyse this garment."
+PROMPT_HASH = prompt_hash(SYSTEM_PROMPT, USER_PROMPT, json.dumps(GarmentAnalysis.model_json_schema(), sort_keys=True))
 
-async def _call_openai(b64: str) -> GarmentAnalysis:
-    """Single request to OpenAI with strict JSON‑schema output."""
+PACK_SYSTEM_PROMPT = (
+    "You are a senior fashion merchandiser.\n"
+    "You are given several garment images, each preceded by a text part `image_id: <id>`. "
+    "Classify the garment in **every** image into **exactly** the controlled vocabularies below. "
+    "Return *only* a JSON object `{\"items\": [...]}` with one entry per image and the keys "
+    "`image_id` (copied verbatim), `color`, `trend`, `category`, `price`. "
+    "Do **not** include any additional keys or explanatory text.\n\n"
+    "Controlled vocabularies:\n"
+    f"{ALLOWED_VALUES}"
+)
+PACK_USER_PROMPT = "Analyse each garment."
+PACK_PROMPT_HASH = prompt_hash(
+    PACK_SYSTEM_PROMPT, PACK_USER_PROMPT, json.dumps(GarmentPack.model_json_schema(), sort_keys=True)
+)
+
+def image_token_bound(max_side: int = MAX_SIDE) -> dict[str, int]:
+    """Upper bound on image tokens per detail level for a thumbnail of at most `max_side` px.
+
+    Every aspect ratio is pushed through the same resize as preprocessing (`resized_dimensions`)
+    and the OpenAI tile formula; the worst case is kept.
+    """
+    heights = np.arange(1, 4 * max_side + 1)
+    w, h = resized_dimensions(np.full(heights.shape, 4 * max_side), heights, max_side)
+    return {detail: int(tile_tokens(w, h, detail).max()) for detail in ("low", "auto", "high")}
+
+IMAGE_TOKENS = image_token_bound(MAX_SIDE)           # follows PREPROCESS_MAX_SIDE (one 512px tile → 255 at the default)
+
+def estimate_request_tokens(detail: str = IMAGE_DETAIL, max_side: int = MAX_SIDE) -> int:
+    """Rough TPM charge for one request: prompt text (~4 chars/token) + image + completion budget."""
+    text_tokens = (len(SYSTEM_PROMPT) + len(USER_PROMPT)) // 4
+    image_tokens = IMAGE_TOKENS if max_side == MAX_SIDE else image_token_bound(max_side)
+    return text_tokens + image_tokens.get(detail, image_tokens["high"]) + MAX_TOKENS
+
+def pack_text_tokens() -> int:
+    return (len(PACK_SYSTEM_PROMPT) + len(PACK_USER_PROMPT)) // 4
+
+def estimate_pack_tokens(n: int, detail: str = IMAGE_DETAIL) -> int:
+    """Rough TPM charge for a pack of `n` images: shared prompt text + per-image parts + completion budget."""
+    image_tokens = IMAGE_TOKENS.get(detail, IMAGE_TOKENS["high"]) + ITEM_PROMPT_TOKENS
+    return pack_text_tokens() + n * image_tokens + pack_max_tokens(n)
+
+def max_pack_size(requested: int, tpm: float | None = TPM_LIMIT, detail: str = IMAGE_DETAIL) -> int:
+    """Largest pack ≤ `requested` that fits the prompt/completion limits and the TPM budget."""
+    return pack_size(requested, IMAGE_TOKENS.get(detail, IMAGE_TOKENS["high"]), pack_text_tokens(), tpm)
+
+# ───────────────────────────── helper functions ──
+async def _request_openai(b64: str, detail: str = IMAGE_DETAIL):
+    """Single request to OpenAI with strict JSON‑schema output; returns the full parsed completion."""
     # schema = GarmentAnalysis.model_json_schema(ref_template="#/$defs/{model}")
 
-    response = await client.beta.chat.completions.parse(
+    return await client.beta.chat.completions.parse(
         model=MODEL,
         temperature=TEMPERATURE,
         max_tokens=MAX_TOKENS,
@@ -97,12 +164,12 @@ async def _call_openai(b64: str) -> GarmentAnalysis:
             {
                 "role": "user",
                 "content": [
-                    {"type": "text", "text": "Analyse this garment."},
+                    {"type": "text", "text": USER_PROMPT},
                     {
                         "type": "image_url",
                         "image_url": {
                             "url": f"data:image/jpeg;base64,{b64}",
-                            "detail": IMAGE_DETAIL,
+                            "detail": detail,
                         },
                     },
                 ],
@@ -110,19 +177,129 @@ async def _call_openai(b64: str) -> GarmentAnalysis:
         ],
     )
 
+async def _request_pack(images: list[tuple[str, str]], detail: str = IMAGE_DETAIL):
+    """One request carrying several (image_id, base64 JPEG) images; parsed as a `GarmentPack`."""
+    return await client.beta.chat.completions.parse(
+        model=MODEL,
+        temperature=TEMPERATURE,
+        max_tokens=pack_max_tokens(len(images)),
+        response_format=GarmentPack,
+        messages=pack_messages(PACK_SYSTEM_PROMPT, PACK_USER_PROMPT, images, detail),
+    )
+
+async def _call_openai(b64: str) -> GarmentAnalysis:
+    """Single request to OpenAI with strict JSON‑schema output."""
+    response = await _request_openai(b64)
     return response.choices[0].message.parsed
 
-async def analyse_paths(paths: Iterable[Path]) -> None:
-    """Analyse many images concurrently and pretty‑print results."""
-    async def _analyse(path: Path):
+async def analyse_paths(
+    paths: Iterable[Path],
+    concurrency: int = CONCURRENCY,
+    rpm: float = RPM_LIMIT,
+    tpm: float = TPM_LIMIT,
+    workers: int = WORKERS,
+    cache: ImageCache | None = None,
+    results: ResultStore | None = None,
+    checkpoint: RunStore | None = None,
+    pack: int = 1,
+    cascade: Cascade | None = None,
+) -> ThroughputStats:
+    """Analyse many images under a concurrency cap and RPM/TPM budget, pretty‑printing results.
+
+    Images are decoded/resized in a `workers`-process pool while earlier requests are in flight;
+    with an `ImageCache`, previously preprocessed images are read back instead.  With a
+    `ResultStore`, exact and near-duplicate images reuse a stored `GarmentAnalysis`.  With a
+    `RunStore`, every outcome is checkpointed and images that already succeeded are skipped
+    (their stored result is printed instead).
+    With `pack` > 1, up to that many images (fewer if the token limits demand it) share one
+    request; packs that fail or come back incomplete are split and retried (see packing.py).
+    With a `Cascade`, images whose every field clears its local SigLIP threshold skip the API;
+    for the rest, the LLM's answer replaces only the low-confidence fields.
+    Returns the scheduler's throughput/latency statistics.
+    """
+    scheduler = RequestScheduler(concurrency=concurrency, rpm=rpm, tpm=tpm)
+    tokens = estimate_request_tokens()
+
+    async def _classify(b64: str) -> tuple[str, int]:
+        response = await scheduler.run(lambda: _request_openai(b64), tokens)
+        usage = response.usage
+        return response.choices[0].message.parsed.model_dump_json(), usage.total_tokens if usage else 0
+
+    async def _send_pack(images: list[tuple[str, str]]) -> dict[str, tuple[str, int]]:
+        response = await scheduler.run(lambda: _request_pack(images), estimate_pack_tokens(len(images)))
+        usage = response.usage
+        items = response.choices[0].message.parsed.items
+        share = (usage.total_tokens if usage else 0) // max(len(items), 1)
+        return {
+            item.image_id: (GarmentAnalysis.model_validate(item.model_dump(exclude={"image_id"})).model_dump_json(), share)
+            for item in items
+        }
+
+    packer = None
+    if pack > 1:
+        packer = RequestPacker(
+            _send_pack, max_pack_size(pack, tpm),
+            split_on=(ValidationError, LengthFinishReasonError, BadRequestError),
+        )
+    classify = packer.submit if packer is not None else _classify
+
+    def _failed(path: Path, error: str) -> bool:
+        print(f"\n❌ {path.name} – {error}")
+        if checkpoint is not None:
+            checkpoint.record(path, "failed", error=error)
+        return False
+
+    async def _analyse(item: Preprocessed) -> bool:
+        if item.error is not None:
+            return _failed(item.path, item.error)
         try:
-            b64 = image_to_base64(path)
-            parsed = await _call_openai(b64)
-            print(f"\n✅ {path.name}\n{parsed.model_dump_json(indent=2)}")
-        except (OpenAIError, ValidationError) as err:
-            print(f"\n❌ {path.name} – {err}")
+            decision = await cascade.decide(item.b64) if cascade is not None else None
+            if decision is not None and not decision.escalate:
+                parsed, mark = GarmentAnalysis.model_validate(decision.labels), "🏷️ "
+            else:
+                if results is None:
+                    (text, _), cached = await classify(item.b64), False
+                else:
+                    text, cached = await results.get_or_compute(item.phash, lambda: classify(item.b64))
+                parsed = GarmentAnalysis.model_validate_json(text)
+                if decision is not None:
+                    parsed = GarmentAnalysis.model_validate(decision.merge(parsed.model_dump(mode="json")))
+                mark = "♻️ " if cached else "✅"
+            print(f"\n{mark} {item.path.name}\n{parsed.model_dump_json(indent=2)}")
+            if checkpoint is not None:
+                checkpoint.record(item.path, "ok", result=parsed.model_dump_json())
+            return True
+        except (OpenAIError, ValidationError, PackItemMissing) as err:
+            return _failed(item.path, str(err))
 
-    await asyncio.gather(*[_analyse(p) for p in paths])
+    def _stored(path: Path, result: str) -> None:
+        parsed = GarmentAnalysis.model_validate_json(result)
+        print(f"\n💾 {path.name} (checkpoint)\n{parsed.model_dump_json(indent=2)}")
+
+    if checkpoint is not None:
+        paths = checkpoint.pending(paths, on_skip=_stored)
+    consumers = concurrency * (packer.max_items if packer else 1)   # enough waiting images to fill every pack
+    if cascade is not None:
+        consumers = max(consumers, cascade.batch_size * 2)          # …and to keep SigLIP batches full
+    images = preprocess_stream(paths, workers=workers, queue_size=consumers * 2, cache=cache)
+    try:
+        stats = await scheduler.drain(images, _analyse, workers=consumers)
+    finally:
+        if checkpoint is not None:
+            checkpoint.flush()                              # keep progress even if the run is interrupted
+    print(f"\n📈 {stats.summary()}")
+    print(f"🔌 connections: {pool_stats(client)}")
+    if packer is not None:
+        print(f"📦 {packer.stats.summary()}")
+    if cascade is not None:
+        print(f"🏷️  {cascade.stats.summary()}")
+    if checkpoint is not None:
+        print(f"💾 checkpoint: skipped {checkpoint.skipped} already-done image(s); totals {checkpoint.counts()}")
+    if cache is not None:
+        print(f"🗄️  {cache.stats.summary()}")
+    if results is not None:
+        print(f"♻️  {results.stats.summary()}")
+    return stats
 
 # ────────────────────────────── CLI entry‑point ──
 if __name__ == "__main__":
@@ -130,6 +307,43 @@ if __name__ == "__main__":
 
     parser = argparse.ArgumentParser(description="Classify garment images with OpenAI Vision models (strict outputs).")
     parser.add_argument("images", nargs="+", type=Path, help="Path(s) to image file(s)")
+    parser.add_argument("--concurrency", type=int, default=CONCURRENCY, help="Max in-flight requests")
+    parser.add_argument("--rpm", type=float, default=RPM_LIMIT, help="Requests-per-minute budget")
+    parser.add_argument("--tpm", type=float, default=TPM_LIMIT, help="Tokens-per-minute budget")
+    parser.add_argument("--workers", type=int, default=WORKERS, help="Image preprocessing processes")
+    parser.add_argument("--cache-dir", type=Path, default=CACHE_DIR, help="Preprocessed-image cache directory")
+    parser.add_argument("--cache-max-gb", type=float, default=CACHE_MAX_BYTES / 2**30, help="Image cache size cap")
+    parser.add_argument("--no-cache", action="store_true", help="Always re-encode images")
+    parser.add_argument("--results-db", type=Path, default=RESULTS_DB, help="Result store (SQLite)")
+    parser.add_argument("--max-distance", type=int, default=MAX_DISTANCE,
+                        help="Max dHash Hamming distance for an image to count as a duplicate (0 = exact)")
+    parser.add_argument("--no-result-cache", action="store_true", help="Call the API for every image")
+    parser.add_argument("--checkpoint", type=Path, default=CHECKPOINT_DB, metavar="PATH",
+                        help="Record progress in this SQLite file; re-runs with the same model and prompt "
+                             "skip images that already succeeded (default: off)")
+    parser.add_argument("--pack", type=int, default=1,
+                        help="Images per request (capped by token limits; failed packs are split and retried)")
+    parser.add_argument("--cascade", action="store_true",
+                        help="Label confident images locally with SigLIP; send only the rest to the API")
+    parser.add_argument("--cascade-thresholds", nargs="*", default=[], metavar="FIELD=P",
+                        help="Per-field confidence thresholds for --cascade, e.g. color=0.6 price=0.9")
     args = parser.parse_args()
 
-    asyncio.run(analyse_paths(args.images))
+    cache = None if args.no_cache else ImageCache(args.cache_dir, int(args.cache_max_gb * 2**30))
+    run_prompt_hash = PACK_PROMPT_HASH if args.pack > 1 else PROMPT_HASH
+    results = None if args.no_result_cache else ResultStore(
+        args.results_db, MODEL, run_prompt_hash, IMAGE_DETAIL, args.max_distance
+    )
+    cascade = Cascade(VOCABULARIES, parse_thresholds(args.cascade_thresholds)) if args.cascade else None
+    if cascade is not None:                             # locally labelled fields change the answers too
+        run_prompt_hash = prompt_hash(run_prompt_hash, CASCADE_MODEL, json.dumps(cascade.thresholds, sort_keys=True))
+    checkpoint = None if args.checkpoint is None else RunStore(args.checkpoint, MODEL, run_prompt_hash)
+    try:
+        asyncio.run(analyse_paths(
+            args.images, args.concurrency, args.rpm, args.tpm, args.workers, cache, results, checkpoint, args.pack,
+            cascade,
+        ))
+    finally:
+        for store in (cache, results, checkpoint):
+            if store is not None:
+                store.close()
@@ -0,0 +1,138 @@
+"""
+image_cache.py – content-addressed on-disk cache for preprocessed (resized + JPEG-encoded) images
+
+Key   = sha256(file bytes ‖ max_side ‖ quality), so renames and copies hit, and edits miss.
+Value = the encoded JPEG, stored as `objects/<k[:2]>/<k>.jpg` (raw bytes; base64 is re-applied on read).
+
+Worker processes only touch the object files (`load_or_encode`); the LRU index lives in a small
+SQLite database owned by the parent process (`ImageCache`), which records every access and evicts
+least-recently-used objects once the cache grows past `max_bytes`.
+
+Usage:
+    cache = ImageCache(Path("~/.cache/garment_analyzer/images").expanduser(), max_bytes=5 * 2**30)
+    for item in preprocess_iter(paths, cache=cache): ...
+    print(cache.stats.summary())
+"""
+from __future__ import annotations
+
+import hashlib
+import os
+import sqlite3
+import time
+from dataclasses import dataclass
+from pathlib import Path
+
+CACHE_DIR = Path(os.getenv("IMAGE_CACHE_DIR", "~/.cache/garment_analyzer/images")).expanduser()
+CACHE_MAX_BYTES = int(float(os.getenv("IMAGE_CACHE_MAX_GB", 5)) * 2**30)
+
+
+def cache_key(data: bytes, max_side: int, quality: int) -> str:
+    """Content address of a preprocessed image: source bytes plus every parameter that changes the output."""
+    digest = hashlib.sha256(data)
+    digest.update(f"|{max_side}|{quality}".encode())
+    return digest.hexdigest()
+
+
+def object_path(objects_dir: Path, key: str) -> Path:
+    return objects_dir / key[:2] / f"{key}.jpg"
+
+
+def write_object(objects_dir: Path, key: str, jpeg: bytes) -> None:
+    """Atomically store an encoded JPEG (tmp file + rename, safe across worker processes)."""
+    path = object_path(objects_dir, key)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(f".{os.getpid()}.tmp")
+    tmp.write_bytes(jpeg)
+    os.replace(tmp, path)
+
+
+def read_object(objects_dir: Path, key: str) -> bytes | None:
+    """Return the cached JPEG, or None if absent (or evicted between lookup and read)."""
+    try:
+        return object_path(objects_dir, key).read_bytes()
+    except FileNotFoundError:
+        return None
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    bytes_evicted: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def summary(self) -> str:
+        return (
+            f"image cache: {self.hits} hits, {self.misses} misses ({self.hit_rate:.1%} hit rate), "
+            f"{self.evictions} evicted ({self.bytes_evicted / 2**20:.1f} MiB)"
+        )
+
+
+class ImageCache:
+    """LRU index over the object store; single writer, lives in the parent process."""
+
+    COMMIT_EVERY = 256                         # index updates are batched; objects themselves are already durable
+    LOW_WATERMARK = 0.9                        # evict down to 90 % of the cap so we don't evict on every insert
+
+    def __init__(self, root: Path = CACHE_DIR, max_bytes: int = CACHE_MAX_BYTES):
+        self.root = root
+        self.objects_dir = root / "objects"
+        self.max_bytes = max_bytes
+        self.stats = CacheStats()
+        self.objects_dir.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(root / "index.sqlite")
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, size INTEGER, last_access REAL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS entries_lru ON entries (last_access)")
+        self.total_bytes = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        self._uncommitted = 0
+
+    def record(self, key: str, size: int, hit: bool) -> None:
+        """Note an access reported by a worker and evict if the cache is over its cap."""
+        if hit:
+            self.stats.hits += 1
+        else:
+            self.stats.misses += 1
+        previous = self._db.execute("SELECT size FROM entries WHERE key = ?", (key,)).fetchone()
+        self._db.execute(
+            "INSERT OR REPLACE INTO entries (key, size, last_access) VALUES (?, ?, ?)",
+            (key, size, time.time()),
+        )
+        self.total_bytes += size - (previous[0] if previous else 0)
+        self._uncommitted += 1
+        if self.total_bytes > self.max_bytes:
+            self._evict()
+        if self._uncommitted >= self.COMMIT_EVERY:
+            self._db.commit()
+            self._uncommitted = 0
+
+    def _evict(self) -> None:
+        target = self.max_bytes * self.LOW_WATERMARK
+        rows = self._db.execute("SELECT key, size FROM entries ORDER BY last_access").fetchall()
+        for key, size in rows:
+            if self.total_bytes <= target:
+                break
+            object_path(self.objects_dir, key).unlink(missing_ok=True)
+            self._db.execute("DELETE FROM entries WHERE key = ?", (key,))
+            self.total_bytes -= size
+            self.stats.evictions += 1
+            self.stats.bytes_evicted += size
+        self._db.commit()
+        self._uncommitted = 0
+
+    def close(self) -> None:
+        self._db.commit()
+        self._db.close()
+
+    def __enter__(self) -> ImageCache:
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
@@ -0,0 +1,340 @@
+#!/usr/bin/env python
+"""
+mock_openai_server.py – local OpenAI-compatible stand-in that injects rate-limit errors
+
+Serves `POST /v1/chat/completions` with a valid garment classification so that
+`garment_analyzer_strict.py` can be exercised end to end without an API key or a bill.
+A configurable fraction of requests (plus anything beyond the real RPM budget) gets a
+429 with a `Retry-After` header, and another fraction gets a 500.
+
+It also stands in for the Files and Batches endpoints used by `batch_manager.py`:
+uploaded batch inputs "complete" `--batch-delay` seconds after creation, with
+`--batch-failure-rate` of their requests failing, and `--batch-expire-rate` of the
+batches expiring with only half of their requests answered.
+
+Request latency is fixed or drawn from an exponential / lognormal distribution with the
+same mean, so tail behaviour can be benchmarked (see benchmark.py).
+
+Packed requests (several `image_id: …` text parts, see packing.py) are answered with
+`{"items": [...]}`, one canned classification per image ID; `--pack-drop-rate` leaves
+that fraction of the IDs out so the split-and-retry path can be exercised.
+
+Usage:
+    python mock_openai_server.py --port 8808 --rate-limit-rate 0.2 --rpm 600
+    python mock_openai_server.py --latency 0.8 --latency-dist lognormal --latency-sigma 0.7
+    OPENAI_BASE_URL=http://127.0.0.1:8808/v1 OPENAI_API_KEY=sk-local \
+        python garment_analyzer_strict.py sample/*.jpg --concurrency 32
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import math
+import random
+import re
+import threading
+import time
+import uuid
+from collections import deque
+from dataclasses import dataclass
+from email.parser import BytesParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CANNED_ANALYSIS = {"color": "black", "trend": "casual", "category": "unisex", "price": "mid-range"}
+
+
+@dataclass
+class MockConfig:
+    latency: float = 0.05              # mean seconds added to every request
+    rate_limit_rate: float = 0.0       # fraction of requests answered with 429
+    error_rate: float = 0.0            # fraction of requests answered with 500
+    rpm: int = 0                       # hard requests-per-minute limit (0 = unlimited)
+    retry_after: float = 1.0           # value sent in the Retry-After header
+    batch_delay: float = 2.0           # seconds until a batch reaches a terminal state
+    batch_failure_rate: float = 0.0    # fraction of batch requests that land in the error file
+    batch_expire_rate: float = 0.0     # fraction of batches that expire half-done
+    latency_dist: str = "fixed"        # "fixed" | "exponential" | "lognormal" around `latency`
+    latency_sigma: float = 0.5         # lognormal shape (bigger = heavier tail)
+    pack_drop_rate: float = 0.0        # fraction of image IDs left out of a packed answer
+
+    def sample_latency(self) -> float:
+        """One request's latency; every distribution has mean `latency`."""
+        if self.latency <= 0 or self.latency_dist == "fixed":
+            return max(self.latency, 0.0)
+        if self.latency_dist == "exponential":
+            return random.expovariate(1 / self.latency)
+        if self.latency_dist == "lognormal":
+            return random.lognormvariate(math.log(self.latency) - self.latency_sigma ** 2 / 2, self.latency_sigma)
+        raise ValueError(f"Unknown latency distribution {self.latency_dist!r}")
+
+
+class MockState:
+    """Thread-safe counters, the sliding RPM window and the files/batches shared by all handler threads."""
+
+    def __init__(self, config: MockConfig):
+        self.config = config
+        self.lock = threading.RLock()                 # advance() adds result files while holding it
+        self.window: deque[float] = deque()
+        self.counts = {"ok": 0, "429": 0, "500": 0}
+        self.files: dict[str, dict] = {}
+        self.batches: dict[str, dict] = {}
+
+    def over_rpm(self) -> bool:
+        if not self.config.rpm:
+            return False
+        now = time.monotonic()
+        with self.lock:
+            while self.window and now - self.window[0] > 60:
+                self.window.popleft()
+            if len(self.window) >= self.config.rpm:
+                return True
+            self.window.append(now)
+            return False
+
+    def count(self, key: str) -> None:
+        with self.lock:
+            self.counts[key] += 1
+
+    # ── files ──
+    def add_file(self, filename: str, purpose: str, data: bytes) -> dict:
+        meta = {
+            "id": f"file-{uuid.uuid4().hex[:24]}", "object": "file", "bytes": len(data),
+            "created_at": int(time.time()), "filename": filename, "purpose": purpose, "status": "processed",
+        }
+        with self.lock:
+            self.files[meta["id"]] = {"meta": meta, "data": data}
+        return meta
+
+    # ── batches ──
+    def add_batch(self, body: dict) -> dict:
+        now = int(time.time())
+        batch = {
+            "id": f"batch_{uuid.uuid4().hex[:24]}", "object": "batch", "endpoint": body["endpoint"],
+            "input_file_id": body["input_file_id"], "completion_window": body.get("completion_window", "24h"),
+            "status": "in_progress", "created_at": now, "in_progress_at": now,
+            "output_file_id": None, "error_file_id": None, "errors": None,
+            "request_counts": {"total": 0, "completed": 0, "failed": 0},
+            "metadata": body.get("metadata"),
+        }
+        with self.lock:
+            self.batches[batch["id"]] = batch
+        return batch
+
+    def advance(self, batch: dict) -> dict:
+        """Move a batch to its terminal state once `batch_delay` has passed, writing its result files."""
+        cfg = self.config
+        if batch["status"] != "in_progress" or time.time() - batch["created_at"] < cfg.batch_delay:
+            return batch
+        lines = self.files[batch["input_file_id"]]["data"].splitlines()
+        expire = random.random() < cfg.batch_expire_rate
+        answered = lines[: len(lines) // 2] if expire else lines
+        out, err = [], []
+        for raw in answered:
+            task = json.loads(raw)
+            failed = random.random() < cfg.batch_failure_rate
+            body = (
+                {"error": {"message": "Injected batch failure (mock).", "type": "server_error"}}
+                if failed else _completion(task["body"], len(raw), cfg.pack_drop_rate)
+            )
+            line = {
+                "id": f"batch_req_{uuid.uuid4().hex[:24]}", "custom_id": task["custom_id"],
+                "response": {"status_code": 500 if failed else 200,
+                             "request_id": uuid.uuid4().hex, "body": body},
+                "error": None,
+            }
+            (err if failed else out).append(json.dumps(line))
+        if out:
+            batch["output_file_id"] = self.add_file("output.jsonl", "batch_output", "\n".join(out).encode() + b"\n")["id"]
+        if err:
+            batch["error_file_id"] = self.add_file("errors.jsonl", "batch_output", "\n".join(err).encode() + b"\n")["id"]
+        batch["request_counts"] = {"total": len(lines), "completed": len(out), "failed": len(err)}
+        batch["status"] = "expired" if expire else "completed"
+        batch["expired_at" if expire else "completed_at"] = int(time.time())
+        return batch
+
+
+def _image_ids(body: dict) -> list[str]:
+    content = (body.get("messages") or [{}])[-1].get("content")
+    if not isinstance(content, list):
+        return []
+    return [
+        part["text"][len("image_id: "):] for part in content
+        if part.get("type") == "text" and part.get("text", "").startswith("image_id: ")
+    ]
+
+
+def _completion(body: dict, request_bytes: int, pack_drop_rate: float = 0.0) -> dict:
+    prompt_tokens = request_bytes // 4                     # same chars-per-token rule of thumb as the client
+    ids = _image_ids(body)
+    if ids:
+        kept = [i for i in ids if len(ids) == 1 or random.random() >= pack_drop_rate]
+        content = json.dumps({"items": [{"image_id": i, **CANNED_ANALYSIS} for i in kept]})
+    else:
+        content = json.dumps(CANNED_ANALYSIS)
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex[:24]}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "mock-vision"),
+        "choices": [
+            {
+                "index": 0,
+                "message": {"role": "assistant", "content": content, "refusal": None},
+                "logprobs": None,
+                "finish_reason": "stop",
+            }
+        ],
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": len(content) // 4,
+            "total_tokens": prompt_tokens + len(content) // 4,
+            "prompt_tokens_details": {"cached_tokens": 0},
+        },
+    }
+
+
+def _parse_multipart(content_type: str, raw: bytes) -> dict[str, tuple[str | None, bytes]]:
+    """Minimal multipart/form-data parser: {field name: (filename, payload)}."""
+    message = BytesParser().parsebytes(f"Content-Type: {content_type}\r\n\r\n".encode() + raw)
+    fields = {}
+    for part in message.get_payload():
+        name = part.get_param("name", header="content-disposition")
+        fields[name] = (part.get_filename(), part.get_payload(decode=True))
+    return fields
+
+
+def make_handler(state: MockState) -> type[BaseHTTPRequestHandler]:
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"                      # keep-alive, like the real API
+
+        def log_message(self, fmt, *args):                 # silence per-request logging
+            pass
+
+        def _send(self, status: int, data: bytes, content_type: str, headers: dict | None = None) -> None:
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(data)))
+            for key, value in (headers or {}).items():
+                self.send_header(key, value)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _send_json(self, status: int, payload: dict, headers: dict | None = None) -> None:
+            self._send(status, json.dumps(payload).encode(), "application/json", headers)
+
+        def _error(self, status: int, code: str, message: str, headers: dict | None = None) -> None:
+            self._send_json(status, {"error": {"message": message, "type": code, "code": code}}, headers)
+
+        def _read_body(self) -> bytes:
+            if self.headers.get("Transfer-Encoding", "").lower() != "chunked":
+                return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            chunks = []                                    # the SDK streams file uploads chunked
+            while (size := int(self.rfile.readline().split(b";")[0], 16)) > 0:
+                chunks.append(self.rfile.read(size))
+                self.rfile.readline()
+            self.rfile.readline()
+            return b"".join(chunks)
+
+        def do_GET(self):
+            path = self.path.split("?")[0].rstrip("/")
+            if m := re.fullmatch(r"/v1/files/([\w-]+)/content", path):
+                entry = state.files.get(m.group(1))
+                if entry is None:
+                    return self._error(404, "not_found", f"No such file {m.group(1)}")
+                return self._send(200, entry["data"], "application/octet-stream")
+            if m := re.fullmatch(r"/v1/files/([\w-]+)", path):
+                entry = state.files.get(m.group(1))
+                return self._send_json(200, entry["meta"]) if entry else self._error(404, "not_found", "No such file")
+            if path == "/v1/batches":                     # newest first, one page
+                with state.lock:
+                    data = [state.advance(b) for b in sorted(state.batches.values(), key=lambda b: b["created_at"], reverse=True)]
+                return self._send_json(200, {
+                    "object": "list", "data": data, "has_more": False,
+                    "first_id": data[0]["id"] if data else None, "last_id": data[-1]["id"] if data else None,
+                })
+            if m := re.fullmatch(r"/v1/batches/([\w-]+)", path):
+                batch = state.batches.get(m.group(1))
+                if batch is None:
+                    return self._error(404, "not_found", f"No such batch {m.group(1)}")
+                with state.lock:
+                    return self._send_json(200, state.advance(batch))
+            return self._error(404, "not_found", f"No route for {self.path}")
+
+        def do_POST(self):
+            raw = self._read_body()
+            path = self.path.split("?")[0].rstrip("/")
+            if path == "/v1/files":
+                fields = _parse_multipart(self.headers["Content-Type"], raw)
+                filename, data = fields["file"]
+                return self._send_json(200, state.add_file(filename or "upload.jsonl", fields["purpose"][1].decode(), data))
+            if path == "/v1/batches":
+                body = json.loads(raw)
+                if body.get("input_file_id") not in state.files:
+                    return self._error(400, "invalid_request_error", "Unknown input_file_id")
+                return self._send_json(200, state.add_batch(body))
+            if path != "/v1/chat/completions":
+                return self._error(404, "not_found", f"No route for {self.path}")
+
+            cfg = state.config
+            time.sleep(cfg.sample_latency())
+            if state.over_rpm() or random.random() < cfg.rate_limit_rate:
+                state.count("429")
+                return self._error(
+                    429, "rate_limit_exceeded", "Rate limit reached (mock).",
+                    {"Retry-After": f"{cfg.retry_after:g}"},
+                )
+            if random.random() < cfg.error_rate:
+                state.count("500")
+                return self._error(500, "server_error", "Injected server error (mock).")
+
+            state.count("ok")
+            self._send_json(200, _completion(json.loads(raw or b"{}"), len(raw), state.config.pack_drop_rate))
+
+    return Handler
+
+
+def serve(config: MockConfig, host: str = "127.0.0.1", port: int = 0) -> tuple[ThreadingHTTPServer, MockState]:
+    """Start the mock server on a background thread; `port=0` picks a free port."""
+    state = MockState(config)
+    server = ThreadingHTTPServer((host, port), make_handler(state))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, state
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Local OpenAI-compatible mock with rate-limit injection.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8808)
+    parser.add_argument("--latency", type=float, default=0.05, help="Mean seconds of latency per request")
+    parser.add_argument("--latency-dist", default="fixed", choices=("fixed", "exponential", "lognormal"),
+                        help="Latency distribution around --latency")
+    parser.add_argument("--latency-sigma", type=float, default=0.5, help="Lognormal shape parameter")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Fraction of requests that get a 429")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests that get a 500")
+    parser.add_argument("--rpm", type=int, default=0, help="Hard requests-per-minute limit (0 = unlimited)")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="Retry-After value in seconds")
+    parser.add_argument("--batch-delay", type=float, default=2.0, help="Seconds until a batch finishes")
+    parser.add_argument("--batch-failure-rate", type=float, default=0.0, help="Fraction of batch requests that fail")
+    parser.add_argument("--batch-expire-rate", type=float, default=0.0, help="Fraction of batches that expire half-done")
+    parser.add_argument("--pack-drop-rate", type=float, default=0.0,
+                        help="Fraction of image IDs missing from packed answers")
+    args = parser.parse_args()
+
+    config = MockConfig(
+        args.latency, args.rate_limit_rate, args.error_rate, args.rpm, args.retry_after,
+        args.batch_delay, args.batch_failure_rate, args.batch_expire_rate, args.latency_dist, args.latency_sigma,
+        args.pack_drop_rate,
+    )
+    server, state = serve(config, args.host, args.port)
+    print(f"🧪  Mock OpenAI server on http://{args.host}:{server.server_port}/v1  (Ctrl-C to stop)")
+    try:
+        while True:
+            time.sleep(5)
+            print(f"   {state.counts}  files={len(state.files)} batches={len(state.batches)}")
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,8 @@
-import os
 import base64
-from openai import OpenAI
 from dotenv import load_dotenv
 
+from clients import get_sync_client
+
 
 load_dotenv() # OPENROUTER_API_KEY is stored in .env file
 
@@ -17,11 +17,8 @@ image_path = "/home/nauman/front_2023_03_23_14_49_40.jpg"
 # Getting the base64 string
 base64_image = encode_image(image_path)
 
-# gets API Key from environment variable OPENAI_API_KEY
-client = OpenAI(
-  base_url="https://openrouter.ai/api/v1",
-  api_key=os.getenv("OPENROUTER_API_KEY"),
-)
+# shared OpenRouter client; gets API Key from environment variable OPENROUTER_API_KEY
+client = get_sync_client("openrouter")
 
 completion = client.chat.completions.create(
 #   extra_headers={
@@ -1,12 +1,12 @@
-import os
 import base64
-from openai import OpenAI
 from dotenv import load_dotenv
 
 from enum import Enum
 from pydantic import BaseModel, Field
 import instructor
 
+from clients import get_instructor_client
+
 
 load_dotenv("/home/nauman/.env") # OPENROUTER_API_KEY is stored in .env file
 
@@ -14,11 +14,8 @@ MODEL = "google/gemini-2.5-flash-preview-05-20"
 # Path to your image
 IMAGE_PATH = "/home/nauman/repos/private/clip_cisutac/sample/test1.jpg"
 
-# Gets API Key from environment variable OPENAI_API_KEY
-client = OpenAI(
-  base_url="https://openrouter.ai/api/v1",
-  api_key=os.getenv("OPENROUTER_API_KEY"),
-)
+# Shared OpenRouter client, wrapped by instructor once; gets API Key from environment variable OPENROUTER_API_KEY
+client = get_instructor_client("openrouter", mode=instructor.Mode.JSON)
 
 #  Function to encode the image
 def encode_image(IMAGE_PATH):
@@ -66,7 +63,7 @@ class ClothingItem(BaseModel):
 
 def annotate_front_img(base64_img: str) -> ClothingItem:
     # response = instructor.from_openai(OpenAI(api_key=os.environ.get("OPENAI_API_KEY"))).chat.completions.create(
-    response = instructor.from_openai(client, mode=instructor.Mode.JSON).chat.completions.create(
+    response = client.chat.completions.create(
         model=MODEL, # 'gpt-4-turbo',
         response_model=ClothingItem, # EmployeeList,
         # seed=SEED, 
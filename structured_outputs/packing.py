@@ -0,0 +1,208 @@
+"""
+packing.py – send several garment images per request instead of one
+
+A single-image request repeats the whole controlled-vocabulary system prompt and pays a full
+round trip for one small JSON answer.  A *pack* carries N images as separate image parts, each
+preceded by a text part `image_id: <id>`, and asks for `{"items": [{"image_id", ...}, ...]}`.
+
+* `pack_size` caps N by the completion budget, the prompt budget and the TPM budget.
+* `pack_messages` / `pack_max_tokens` build the request (interactive and Batch).
+* `RequestPacker` micro-batches concurrent single-image submissions into packs, splits a pack
+  that fails (or comes back with images missing) in half and retries, and adapts its current
+  pack size: +1 after a clean pack, halved after a split.
+* `split_pack_task` does the same split for a failed (or partly answered) Batch task line.
+
+Usage:
+    packer = RequestPacker(send_pack, max_items=pack_size(16, image_tokens=765, text_tokens=200))
+    text, tokens = await packer.submit(b64)          # from many concurrent workers
+"""
+from __future__ import annotations
+
+import asyncio
+import copy
+import itertools
+import os
+import re
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Generic, TypeVar
+
+P = TypeVar("P")
+R = TypeVar("R")
+
+MAX_PACK_IMAGES = int(os.getenv("PACK_MAX_IMAGES", 50))
+MAX_PACK_PROMPT_TOKENS = int(os.getenv("PACK_MAX_PROMPT_TOKENS", 60_000))
+MAX_PACK_COMPLETION_TOKENS = int(os.getenv("PACK_MAX_COMPLETION_TOKENS", 4_096))
+ITEM_COMPLETION_TOKENS = 40          # one {"image_id", color, trend, category, price} entry
+ITEM_PROMPT_TOKENS = 8               # the "image_id: …" text part
+PACK_OVERHEAD_TOKENS = 16            # {"items": [ … ]}
+IMAGE_ID = re.compile(r"^image_id: (.+)$")
+
+
+# ──────────────────────────────────────────── sizing ──
+def pack_max_tokens(n: int) -> int:
+    """Completion budget for a pack of `n` images."""
+    return PACK_OVERHEAD_TOKENS + n * ITEM_COMPLETION_TOKENS
+
+
+def pack_size(requested: int, image_tokens: int, text_tokens: int, tpm: float | None = None) -> int:
+    """Largest N ≤ `requested` whose prompt, completion and TPM charge fit the limits."""
+    per_image = image_tokens + ITEM_PROMPT_TOKENS + ITEM_COMPLETION_TOKENS
+    limits = [
+        requested,
+        MAX_PACK_IMAGES,
+        (MAX_PACK_COMPLETION_TOKENS - PACK_OVERHEAD_TOKENS) // ITEM_COMPLETION_TOKENS,
+        (MAX_PACK_PROMPT_TOKENS - text_tokens) // (image_tokens + ITEM_PROMPT_TOKENS),
+    ]
+    if tpm:
+        limits.append(int((tpm / 4 - text_tokens) // per_image))     # leave room for other packs in flight
+    return max(1, min(limits))
+
+
+# ─────────────────────────────────────────── messages ──
+def pack_messages(system_prompt: str, user_prompt: str, images: list[tuple[str, str]], detail: str) -> list[dict]:
+    """Chat messages with one `image_id: …` text part + one image part per (image_id, base64 JPEG)."""
+    content: list[dict] = [{"type": "text", "text": user_prompt}]
+    for image_id, b64 in images:
+        content.append({"type": "text", "text": f"image_id: {image_id}"})
+        content.append({"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{b64}", "detail": detail}})
+    return [{"role": "system", "content": system_prompt}, {"role": "user", "content": content}]
+
+
+def pack_ids(task: dict) -> list[str] | None:
+    """Image IDs carried by a Batch task, or None for a single-image task."""
+    content = task["body"]["messages"][-1]["content"]
+    ids = [m.group(1) for part in content if part["type"] == "text" and (m := IMAGE_ID.match(part["text"]))]
+    return ids or None
+
+
+def pack_subset(task: dict, image_ids: list[str], custom_id: str) -> dict:
+    """Copy of a packed Batch task that carries only `image_ids`, with its completion budget resized."""
+    content = task["body"]["messages"][-1]["content"]
+    wanted = set(image_ids)
+    kept = content[:1]
+    for i in range(1, len(content) - 1, 2):                 # (image_id text part, image part) pairs
+        m = IMAGE_ID.match(content[i].get("text", ""))
+        if m and m.group(1) in wanted:
+            kept += content[i:i + 2]
+    part = copy.deepcopy(task)                               # strings are shared, only containers are copied
+    part["custom_id"] = custom_id
+    part["body"]["messages"][-1]["content"] = copy.deepcopy(kept)
+    part["body"]["max_tokens"] = pack_max_tokens(len(image_ids))
+    return part
+
+
+def split_pack_task(task: dict, image_ids: list[str] | None = None) -> list[dict]:
+    """Split a packed Batch task (or just its `image_ids`) into halves `<id>.a` / `<id>.b`.
+
+    A single-image remainder keeps one task; single-image tasks are returned unchanged.
+    """
+    ids = image_ids if image_ids is not None else pack_ids(task)
+    if not ids:
+        return [task]
+    if len(ids) == 1:
+        return [pack_subset(task, ids, f"{task['custom_id']}.a")]
+    half = len(ids) // 2
+    return [pack_subset(task, ids[:half], f"{task['custom_id']}.a"),
+            pack_subset(task, ids[half:], f"{task['custom_id']}.b")]
+
+
+# ──────────────────────────────────────────── packer ──
+class PackItemMissing(ValueError):
+    """A single-image pack came back without its image ID."""
+
+
+@dataclass
+class PackStats:
+    packs: int = 0
+    items: int = 0
+    splits: int = 0
+
+    def summary(self) -> str:
+        return (
+            f"packing: {self.items} images in {self.packs} requests "
+            f"({self.items / max(self.packs, 1):.1f}/request, {self.splits} splits)"
+        )
+
+
+class RequestPacker(Generic[P, R]):
+    """Collect concurrent submissions into packs of up to `limit` items and send them together.
+
+    `send([(image_id, payload), …])` returns {image_id: result}.  A pack that raises one of
+    `split_on`, or whose result lacks some IDs, is split in half and the missing items are resent;
+    only a single-item pack fails its submitter.  A pack is sent when it is full or `linger`
+    seconds after its first item arrived.
+    """
+
+    def __init__(
+        self,
+        send: Callable[[list[tuple[str, P]]], Awaitable[dict[str, R]]],
+        max_items: int,
+        linger: float = 0.05,
+        split_on: tuple[type[BaseException], ...] = (Exception,),
+    ):
+        self.send = send
+        self.max_items = max(1, max_items)
+        self.limit = self.max_items
+        self.linger = linger
+        self.split_on = split_on
+        self.stats = PackStats()
+        self._ids = itertools.count()
+        self._pending: list[tuple[str, P, asyncio.Future]] = []
+        self._timer: asyncio.TimerHandle | None = None
+        self._tasks: set[asyncio.Task] = set()
+
+    async def submit(self, payload: P) -> R:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((f"img{next(self._ids)}", payload, future))
+        if len(self._pending) >= self.limit:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.linger, self._flush)
+        return await future
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        pack, self._pending = self._pending, []
+        if pack:
+            task = asyncio.create_task(self._send(pack))
+            self._tasks.add(task)                           # keep a reference until it finishes
+            task.add_done_callback(self._tasks.discard)
+
+    async def _send(self, pack: list[tuple[str, P, asyncio.Future]]) -> None:
+        self.stats.packs += 1
+        error: BaseException | None = None
+        try:
+            results = await self.send([(key, payload) for key, payload, _ in pack])
+        except self.split_on as err:
+            results, error = {}, err
+        except BaseException as err:                        # not a pack-size problem: fail the whole pack
+            for _, _, future in pack:
+                if not future.done():
+                    future.set_exception(err)
+            return
+
+        missing = []
+        for entry in pack:
+            key, _, future = entry
+            if key in results:
+                self.stats.items += 1
+                if not future.done():
+                    future.set_result(results[key])
+            else:
+                missing.append(entry)
+        if not missing:
+            self.limit = min(self.max_items, self.limit + 1)
+            return
+        if len(pack) == 1:
+            future = pack[0][2]
+            if not future.done():
+                future.set_exception(error or PackItemMissing(f"{pack[0][0]} missing from the response"))
+            return
+
+        self.stats.splits += 1
+        self.limit = max(1, len(pack) // 2)
+        half = max(1, len(missing) // 2)
+        await asyncio.gather(*(self._send(chunk) for chunk in (missing[:half], missing[half:]) if chunk))
@@ -2,9 +2,18 @@
 """
 Extract structured garment classifications from an OpenAI Batch‑API result JSONL into a Pandas DataFrame.
 
+The file is read in large binary chunks and decoded with orjson (falling back to the stdlib json
+module) into Arrow record batches whose color/trend/category/price columns are dictionary-encoded
+(categoricals).  With `--parquet`, batches are streamed into a hive-partitioned Parquet dataset as
+they are produced, so millions of result lines are parsed in bounded memory.  Rows that cannot be
+parsed are written to a side file (`<input>.errors.jsonl` by default) instead of being printed.
+Packed tasks (several images per request, see packing.py) answer `{"items": [...]}`; every item
+becomes its own row with the item's `image_id` as its custom_id.
+
 Usage:
     python garment_results_to_dataframe.py --job_id <BATCH_JOB_ID> [--output results.jsonl]  # download & parse
     python garment_results_to_dataframe.py --input <LOCAL_JSONL_PATH>                  # parse existing file
+    python garment_results_to_dataframe.py --input <LOCAL_JSONL_PATH> --parquet results/ [--partition-by category]
 
 Examples:
     python garment_results_to_dataframe.py --job_id abcd1234 --output batch_out.jsonl
@@ -12,10 +21,30 @@ Examples:
 """
 import argparse
 import json
+import shutil
 from pathlib import Path
+from typing import BinaryIO, Iterator, Optional
 
 import pandas as pd
-from openai import OpenAI, OpenAIError
+import pyarrow as pa
+import pyarrow.dataset as ds
+from openai import OpenAIError
+
+from clients import get_sync_client
+
+try:                                             # ~3-5x faster than json on these lines
+    import orjson
+    loads = orjson.loads
+except ImportError:
+    loads = json.loads
+
+FIELDS = ("color", "trend", "category", "price")
+SCHEMA = pa.schema(
+    [("custom_id", pa.string())]
+    + [(name, pa.dictionary(pa.int32(), pa.string())) for name in FIELDS]
+)
+CHUNK_BYTES = 8 * 2**20
+BATCH_ROWS = 65_536
 
 
 def download_results(job_id: str, output: Path) -> Path:
@@ -23,49 +52,132 @@ def download_results(job_id: str, output: Path) -> Path:
     Download batch job result file by job_id and save to output path.
     Returns the path to the downloaded JSONL file.
     """
-    client = OpenAI()
+    client = get_sync_client("openai")
     try:
-        job = client.batches.get(job_id=job_id)
-        file_id = job.result_file_id
-        raw = client.files.download(file_id=file_id)
+        job = client.batches.retrieve(job_id)
+        if not job.output_file_id:
+            raise RuntimeError(f"Batch {job_id} has no output file yet (status: {job.status})")
+        with client.files.with_streaming_response.content(job.output_file_id) as response:
+            response.stream_to_file(output)
     except OpenAIError as e:
         raise RuntimeError(f"Failed to download batch results: {e}")
 
-    output.write_bytes(raw)
     print(f"Downloaded batch results to {output}")
     return output
 
 
-def parse_jsonl(path: Path) -> pd.DataFrame:
+def iter_lines(f: BinaryIO, chunk_bytes: int = CHUNK_BYTES) -> Iterator[bytes]:
+    """Yield non-empty lines from a binary file read `chunk_bytes` at a time."""
+    tail = b""
+    while chunk := f.read(chunk_bytes):
+        lines = (tail + chunk).split(b"\n")
+        tail = lines.pop()
+        yield from (line for line in lines if line.strip())
+    if tail.strip():
+        yield tail
+
+
+def _batch(columns: dict[str, list]) -> pa.RecordBatch:
+    arrays = [pa.array(columns["custom_id"], pa.string())]
+    arrays += [pa.array(columns[name], pa.string()).dictionary_encode() for name in FIELDS]
+    return pa.RecordBatch.from_arrays(arrays, schema=SCHEMA)
+
+
+def iter_record_batches(
+    path: Path,
+    errors_path: Optional[Path] = None,
+    batch_rows: int = BATCH_ROWS,
+    chunk_bytes: int = CHUNK_BYTES,
+) -> Iterator[pa.RecordBatch]:
+    """
+    Stream the batch JSONL file as Arrow record batches with columns:
+    custom_id, color, trend, category, price (the last four dictionary-encoded).
+    Packed results contribute one row per item, keyed by its image_id.
+    Malformed rows go to `errors_path` as {"line", "custom_id", "error", "raw"} JSON lines.
+    """
+    columns: dict[str, list] = {name: [] for name in ("custom_id", *FIELDS)}
+    errors = errors_path.open("w", encoding="utf-8") if errors_path else None
+    try:
+        with path.open("rb") as f:
+            for line_no, line in enumerate(iter_lines(f, chunk_bytes), start=1):
+                cid = None
+                try:
+                    entry = loads(line)
+                    cid = entry.get("custom_id")
+                    # content is a JSON string inside the chat-completion body
+                    data = loads(entry["response"]["body"]["choices"][0]["message"]["content"])
+                    if "items" in data:                 # packed task: one row per image
+                        rows = [(item["image_id"], [item.get(name) for name in FIELDS]) for item in data["items"]]
+                    else:
+                        rows = [(cid, [data.get(name) for name in FIELDS])]
+                except Exception as e:
+                    if errors:
+                        errors.write(json.dumps({
+                            "line": line_no, "custom_id": cid,
+                            "error": f"{type(e).__name__}: {e}", "raw": line.decode("utf-8", "replace"),
+                        }) + "\n")
+                    continue
+
+                for row_id, values in rows:
+                    columns["custom_id"].append(row_id)
+                    for name, value in zip(FIELDS, values):
+                        columns[name].append(value)
+                if len(columns["custom_id"]) >= batch_rows:
+                    yield _batch(columns)
+                    columns = {name: [] for name in columns}
+        if columns["custom_id"]:
+            yield _batch(columns)
+    finally:
+        if errors:
+            errors.close()
+
+
+def parse_jsonl(path: Path, errors_path: Optional[Path] = None) -> pd.DataFrame:
     """
     Parse the batch JSONL file and return a DataFrame with columns:
-    custom_id, color, trend, category, price
+    custom_id, color, trend, category, price (the last four as pandas categoricals)
+    """
+    batches = list(iter_record_batches(path, errors_path))
+    return pa.Table.from_batches(batches, schema=SCHEMA).to_pandas()
+
+
+def write_parquet(
+    path: Path,
+    out_dir: Path,
+    partition_by: tuple[str, ...] = ("category",),
+    errors_path: Optional[Path] = None,
+    batch_rows: int = BATCH_ROWS,
+) -> int:
+    """
+    Stream the batch JSONL file into a hive-partitioned Parquet dataset under `out_dir`.
+    The dataset is written to a fresh sibling directory and then swapped in, so `out_dir` is
+    replaced as a whole and no part files or partitions from an earlier, larger run survive.
+    Returns the number of rows written.
     """
-    records = []
-    with path.open('r', encoding='utf-8') as f:
-        for line in f:
-            entry = json.loads(line)
-            cid = entry.get('custom_id')
-            # Navigate into body choices
-            try:
-                content = entry['response']['body']['choices'][0]['message']['content']
-                # content is a JSON string; parse it
-                data = json.loads(content)
-            except Exception as e:
-                print(f"Warning: failed to parse entry {cid}: {e}")
-                continue
-
-            # Collect fields
-            records.append({
-                'custom_id': cid,
-                'color': data.get('color'),
-                'trend': data.get('trend'),
-                'category': data.get('category'),
-                'price': data.get('price'),
-            })
-
-    df = pd.DataFrame.from_records(records)
-    return df
+    rows = 0
+    staging = out_dir.with_name(f"{out_dir.name}.tmp")
+    shutil.rmtree(staging, ignore_errors=True)
+    staging.mkdir(parents=True)
+
+    def _counted() -> Iterator[pa.RecordBatch]:
+        nonlocal rows
+        for batch in iter_record_batches(path, errors_path, batch_rows):
+            rows += batch.num_rows
+            yield batch
+
+    ds.write_dataset(
+        _counted(),
+        staging,
+        schema=SCHEMA,
+        format="parquet",
+        partitioning=list(partition_by) or None,
+        partitioning_flavor="hive" if partition_by else None,
+        existing_data_behavior="error",
+        max_rows_per_group=batch_rows,
+    )
+    shutil.rmtree(out_dir, ignore_errors=True)
+    staging.rename(out_dir)
+    return rows
 
 
 def main():
@@ -79,14 +191,28 @@ def main():
                         help='Path to save downloaded JSONL')
     parser.add_argument('--csv', type=Path, default=None,
                         help='Optional path to save DataFrame as CSV')
+    parser.add_argument('--parquet', type=Path, default=None,
+                        help='Stream results into a partitioned Parquet dataset in this directory')
+    parser.add_argument('--partition-by', nargs='*', default=['category'], choices=FIELDS,
+                        help='Partition columns for --parquet (none for a flat dataset)')
+    parser.add_argument('--errors', type=Path, default=None,
+                        help='Side file for malformed rows (default: <input>.errors.jsonl)')
+    parser.add_argument('--batch-rows', type=int, default=BATCH_ROWS,
+                        help='Rows per Arrow record batch / Parquet row group')
     args = parser.parse_args()
 
     if args.job_id:
         jsonl_path = download_results(args.job_id, args.output)
     else:
         jsonl_path = args.input
+    errors_path = args.errors or jsonl_path.with_suffix('.errors.jsonl')
+
+    if args.parquet:
+        rows = write_parquet(jsonl_path, args.parquet, tuple(args.partition_by), errors_path, args.batch_rows)
+        print(f"Wrote {rows} rows to {args.parquet} (malformed rows: {errors_path})")
+        return
 
-    df = parse_jsonl(jsonl_path)
+    df = parse_jsonl(jsonl_path, errors_path)
     print(df)
 
     if args.csv:
@@ -0,0 +1,156 @@
+"""
+preprocess.py – process-pool image preprocessing shared by the interactive and Batch pipelines
+
+Decoding, LANCZOS thumbnailing and JPEG re-encoding are CPU bound; running them on the
+event loop stalls every in-flight request.  This module runs them in a `ProcessPoolExecutor`
+and keeps at most `queue_size` images submitted-or-ready at any time, so memory stays bounded
+while decode/resize overlaps with HTTP round-trips.
+
+    async for item in preprocess_stream(paths, workers=8):    # completion order (interactive)
+    for item in preprocess_iter(paths, workers=8):            # input order (Batch JSONL)
+
+Pass an `ImageCache` to skip decode/resize/encode for images that were already preprocessed
+with the same `max_side` and `quality` on an earlier run.
+
+This module is deliberately light (Pillow only): worker processes import it, not the
+API-client modules.
+"""
+from __future__ import annotations
+
+import asyncio
+import base64
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from io import BytesIO
+from pathlib import Path
+from typing import AsyncIterator, Iterable, Iterator
+
+from PIL import Image
+
+from image_cache import ImageCache, cache_key, read_object, write_object
+from result_cache import image_key
+
+MAX_SIDE = int(os.getenv("PREPROCESS_MAX_SIDE", 512))          # pick with calibrate_resolution.py
+JPEG_QUALITY = int(os.getenv("PREPROCESS_JPEG_QUALITY", 88))
+WORKERS = int(os.getenv("PREPROCESS_WORKERS", os.cpu_count() or 1))
+
+
+@dataclass
+class Preprocessed:
+    """Result of preprocessing one image: either `b64` or `error` is set."""
+    path: Path
+    b64: str | None = None
+    error: str | None = None
+    cache_key: str | None = None
+    jpeg_bytes: int = 0
+    cache_hit: bool = False
+    phash: int | None = None          # image key (dHash + colour code) of the normalised JPEG, for duplicate detection
+
+
+def encode_jpeg(source: Path | BytesIO, max_side: int = MAX_SIDE, quality: int = JPEG_QUALITY) -> bytes:
+    """Open, RGB‑convert, thumbnail and JPEG‑encode an image."""
+    return encode_jpeg_variants(source, max_side, (quality,))[quality]
+
+
+def encode_jpeg_variants(source: Path | BytesIO, max_side: int, qualities: Iterable[int]) -> dict[int, bytes]:
+    """Like `encode_jpeg`, but decode and resize once and save at several JPEG qualities."""
+    with Image.open(source) as img:
+        if img.mode != "RGB":
+            img = img.convert("RGB")
+        img.thumbnail((max_side, max_side), Image.Resampling.LANCZOS)
+        encoded = {}
+        for quality in qualities:
+            buf = BytesIO()
+            img.save(buf, format="JPEG", quality=quality)
+            encoded[quality] = buf.getvalue()
+        return encoded
+
+
+def image_to_base64(path: Path, max_side: int = MAX_SIDE, quality: int = JPEG_QUALITY) -> str:
+    """Open, RGB‑convert, thumbnail and base64‑encode an image."""
+    return base64.b64encode(encode_jpeg(path, max_side, quality)).decode()
+
+
+def _encode(path: Path, max_side: int, quality: int, objects_dir: Path | None = None) -> Preprocessed:
+    """Worker entry point; errors are returned, not raised, so one bad file can't kill the stream."""
+    try:
+        if objects_dir is None:
+            jpeg = encode_jpeg(path, max_side, quality)
+            return Preprocessed(
+                path, b64=base64.b64encode(jpeg).decode(), jpeg_bytes=len(jpeg), phash=image_key(jpeg)
+            )
+
+        data = path.read_bytes()
+        key = cache_key(data, max_side, quality)
+        jpeg = read_object(objects_dir, key)
+        hit = jpeg is not None
+        if not hit:
+            jpeg = encode_jpeg(BytesIO(data), max_side, quality)
+            write_object(objects_dir, key, jpeg)
+        return Preprocessed(
+            path, b64=base64.b64encode(jpeg).decode(), cache_key=key, jpeg_bytes=len(jpeg), cache_hit=hit,
+            phash=image_key(jpeg),
+        )
+    except (OSError, ValueError, SyntaxError, Image.DecompressionBombError) as err:
+        # OSError includes PIL.UnidentifiedImageError and truncated files; ValueError covers odd
+        # modes/palettes; some PIL decoders signal corrupt headers with SyntaxError
+        return Preprocessed(path, error=f"{type(err).__name__}: {err}")
+
+
+def _record(cache: ImageCache | None, item: Preprocessed) -> Preprocessed:
+    if cache is not None and item.cache_key is not None:
+        cache.record(item.cache_key, item.jpeg_bytes, item.cache_hit)
+    return item
+
+
+async def preprocess_stream(
+    paths: Iterable[Path],
+    workers: int = WORKERS,
+    queue_size: int = 64,
+    max_side: int = MAX_SIDE,
+    quality: int = JPEG_QUALITY,
+    cache: ImageCache | None = None,
+) -> AsyncIterator[Preprocessed]:
+    """Yield preprocessed images in completion order, with at most `queue_size` outstanding."""
+    loop = asyncio.get_running_loop()
+    objects_dir = cache.objects_dir if cache is not None else None
+    source = iter(paths)
+    pending: set[asyncio.Future] = set()
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        def _fill() -> None:
+            while len(pending) < queue_size:
+                path = next(source, None)
+                if path is None:
+                    return
+                pending.add(loop.run_in_executor(pool, _encode, path, max_side, quality, objects_dir))
+
+        _fill()
+        while pending:
+            done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            pending.difference_update(done)
+            _fill()                                         # keep the pool busy while the consumer works
+            for future in done:
+                yield _record(cache, future.result())
+
+
+def preprocess_iter(
+    paths: Iterable[Path],
+    workers: int = WORKERS,
+    queue_size: int = 64,
+    max_side: int = MAX_SIDE,
+    quality: int = JPEG_QUALITY,
+    cache: ImageCache | None = None,
+) -> Iterator[Preprocessed]:
+    """Yield preprocessed images in input order, with at most `queue_size` outstanding."""
+    objects_dir = cache.objects_dir if cache is not None else None
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        window: deque = deque()
+        for path in paths:
+            window.append(pool.submit(_encode, path, max_side, quality, objects_dir))
+            if len(window) >= queue_size:
+                yield _record(cache, window.popleft().result())
+        while window:
+            yield _record(cache, window.popleft().result())
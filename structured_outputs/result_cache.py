@@ -0,0 +1,231 @@
+"""
+result_cache.py – persistent result store + duplicate-image short-circuit for vision calls
+
+Results are keyed by (model, prompt hash, detail level, image key).  The image key is a 64-bit
+dHash plus a quantised mean-RGB colour code above it.  The dHash is grayscale and cannot tell
+colourways apart, so the colour code must match exactly.  A lookup returns the stored result of
+the *closest* earlier image with the same colour code whose dHash is within `max_distance`
+bits, so exact re-shoots and near-identical photos of the same garment never pay for a second
+API call – neither across runs (SQLite) nor within a run (in-flight requests for a
+near-duplicate are awaited instead of duplicated).
+
+Near-duplicate lookup uses the pigeonhole trick: the hash is split into four 16-bit bands, each
+indexed; two hashes within 3 bits must agree on at least one band.  Larger thresholds fall back to
+scanning the (model, prompt, detail) namespace.
+
+Usage:
+    store = ResultStore(Path("results.sqlite"), model=MODEL, prompt_hash=PROMPT_HASH, detail="auto")
+    text, cached = await store.get_or_compute(image_key(jpeg), call)   # call() -> (json_text, usage_tokens)
+    print(store.stats.summary())
+"""
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import os
+import sqlite3
+import time
+from dataclasses import dataclass
+from io import BytesIO
+from pathlib import Path
+from typing import Awaitable, Callable
+
+from PIL import Image, ImageStat
+
+RESULTS_DB = Path(os.getenv("RESULT_CACHE_DB", "~/.cache/garment_analyzer/results.sqlite")).expanduser()
+MAX_DISTANCE = int(os.getenv("RESULT_CACHE_MAX_DISTANCE", 3))   # Hamming bits; ≤3 uses the band index
+COLOUR_BITS = int(os.getenv("RESULT_CACHE_COLOUR_BITS", 4))   # per channel of the mean-RGB colour code
+BANDS = 4
+BAND_BITS = 64 // BANDS
+HASH_MASK = (1 << 64) - 1
+
+
+# ─────────────────────────────────────── perceptual hash ──
+def dhash(jpeg: bytes, size: int = 8) -> int:
+    """64-bit difference hash: compare adjacent pixels of a (size+1)×size grayscale thumbnail."""
+    with Image.open(BytesIO(jpeg)) as img:
+        img.draft("L", (size * 4, size * 4))               # JPEG DCT-domain downscale: no full decode
+        pixels = list(img.convert("L").resize((size + 1, size), Image.Resampling.BILINEAR).getdata())
+    bits = 0
+    for row in range(size):
+        offset = row * (size + 1)
+        for col in range(size):
+            bits = (bits << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return bits
+
+
+def mean_colour(jpeg: bytes, bits: int = COLOUR_BITS) -> int:
+    """Mean RGB of a small thumbnail, each channel quantised to `bits` bits, packed into one int."""
+    with Image.open(BytesIO(jpeg)) as img:
+        img.draft("RGB", (32, 32))
+        thumb = img.convert("RGB").resize((16, 16), Image.Resampling.BILINEAR)
+        r, g, b = (int(c) for c in ImageStat.Stat(thumb).mean)
+    shift = 8 - bits
+    return ((r >> shift) << (2 * bits)) | ((g >> shift) << bits) | (b >> shift)
+
+
+def image_key(jpeg: bytes) -> int:
+    """dHash in the low 64 bits, mean-colour code above them."""
+    return (mean_colour(jpeg) << 64) | dhash(jpeg)
+
+
+def _split(key: int) -> tuple[int, int]:
+    """(colour code, 64-bit dHash) of an image key."""
+    return key >> 64, key & HASH_MASK
+
+
+def hamming(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+def prompt_hash(*parts: str) -> str:
+    """Stable short hash of everything that shapes the answer besides the image (prompt text, schema)."""
+    return hashlib.sha256("\x1f".join(parts).encode()).hexdigest()[:16]
+
+
+def _signed(value: int) -> int:
+    """SQLite INTEGER is signed 64-bit."""
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def _bands(phash: int) -> list[int]:
+    mask = (1 << BAND_BITS) - 1
+    return [(phash >> (i * BAND_BITS)) & mask for i in range(BANDS)]
+
+
+# ────────────────────────────────────────────── store ──
+@dataclass
+class ResultStats:
+    lookups: int = 0
+    skipped_calls: int = 0           # served from the store or from an in-flight duplicate
+    inflight_joins: int = 0
+    tokens_saved: int = 0
+
+    def summary(self) -> str:
+        return (
+            f"result cache: {self.skipped_calls}/{self.lookups} calls skipped "
+            f"({self.inflight_joins} joined in-flight duplicates), ~{self.tokens_saved:,} tokens saved"
+        )
+
+
+class ResultStore:
+    """SQLite-backed result store scoped to one (model, prompt hash, detail) namespace."""
+
+    COMMIT_EVERY = 64
+
+    def __init__(
+        self,
+        path: Path = RESULTS_DB,
+        model: str = "",
+        prompt_hash: str = "",
+        detail: str = "auto",
+        max_distance: int = MAX_DISTANCE,
+    ):
+        self.namespace = (model, prompt_hash, detail)
+        self.max_distance = max_distance
+        self.stats = ResultStats()
+        self._inflight: dict[int, asyncio.Future] = {}       # image key -> pending result
+        self._uncommitted = 0
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(path)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        # results_v2: rows of the grayscale-only `results` table have no colour code and are not reused
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS results_v2 ("
+            " model TEXT, prompt_hash TEXT, detail TEXT, colour INTEGER, phash INTEGER,"
+            " b0 INTEGER, b1 INTEGER, b2 INTEGER, b3 INTEGER,"
+            " result TEXT, tokens INTEGER, created REAL,"
+            " PRIMARY KEY (model, prompt_hash, detail, colour, phash))"
+        )
+        for i in range(BANDS):
+            self._db.execute(
+                f"CREATE INDEX IF NOT EXISTS results_v2_b{i} ON results_v2 (model, prompt_hash, detail, colour, b{i})"
+            )
+
+    def get(self, key: int) -> tuple[str, int] | None:
+        """Closest stored (result, tokens) with the same colour code and a dHash within
+        `max_distance` bits, or None."""
+        colour, phash = _split(key)
+        where = "model = ? AND prompt_hash = ? AND detail = ? AND colour = ?"
+        if self.max_distance == 0:
+            rows = self._db.execute(
+                f"SELECT phash, result, tokens FROM results_v2 WHERE {where} AND phash = ?",
+                (*self.namespace, colour, _signed(phash)),
+            )
+        elif self.max_distance < BANDS:
+            band_clause = " OR ".join(f"b{i} = ?" for i in range(BANDS))
+            rows = self._db.execute(
+                f"SELECT phash, result, tokens FROM results_v2 WHERE {where} AND ({band_clause})",
+                (*self.namespace, colour, *_bands(phash)),
+            )
+        else:
+            rows = self._db.execute(
+                f"SELECT phash, result, tokens FROM results_v2 WHERE {where}", (*self.namespace, colour)
+            )
+
+        best = None
+        for stored, result, tokens in rows:
+            distance = hamming(stored & HASH_MASK, phash)
+            if distance <= self.max_distance and (best is None or distance < best[0]):
+                best = (distance, result, tokens)
+        return None if best is None else (best[1], best[2])
+
+    def put(self, key: int, result: str, tokens: int) -> None:
+        colour, phash = _split(key)
+        self._db.execute(
+            "INSERT OR REPLACE INTO results_v2 VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (*self.namespace, colour, _signed(phash), *_bands(phash), result, tokens, time.time()),
+        )
+        self._uncommitted += 1
+        if self._uncommitted >= self.COMMIT_EVERY:
+            self._db.commit()
+            self._uncommitted = 0
+
+    def _inflight_match(self, key: int) -> asyncio.Future | None:
+        colour, phash = _split(key)
+        for other, future in self._inflight.items():
+            other_colour, other_phash = _split(other)
+            if other_colour == colour and hamming(other_phash, phash) <= self.max_distance:
+                return future
+        return None
+
+    async def get_or_compute(
+        self, key: int, compute: Callable[[], Awaitable[tuple[str, int]]]
+    ) -> tuple[str, bool]:
+        """Return (result, cached).  `compute()` must return (result text, tokens used) and is only
+        awaited if neither the store nor an in-flight near-duplicate can answer."""
+        self.stats.lookups += 1
+        while True:
+            if (hit := self.get(key)) is not None:
+                self.stats.skipped_calls += 1
+                self.stats.tokens_saved += hit[1]
+                return hit[0], True
+            future = self._inflight_match(key)
+            if future is None:
+                break
+            outcome = await asyncio.shield(future)
+            if outcome is not None:                          # the duplicate succeeded; it's now in the store
+                self.stats.inflight_joins += 1
+            # on failure (None) loop round and make our own call
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            result, tokens = await compute()
+            self.put(key, result, tokens)
+            future.set_result(result)
+            return result, False
+        finally:
+            if not future.done():
+                future.set_result(None)                      # wake waiters; they retry on their own
+            del self._inflight[key]
+
+    def close(self) -> None:
+        self._db.commit()
+        self._db.close()
+
+    def __enter__(self) -> ResultStore:
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
@@ -0,0 +1,123 @@
+"""
+run_store.py – durable per-image progress for interactive garment analysis runs
+
+Every finished image is recorded as `ok` (with its GarmentAnalysis JSON) or `failed` (with the
+error) in a SQLite table keyed by (model, prompt hash, absolute path), so changing the model or
+the prompt reprocesses everything.  A re-run asks for the completed set up front and only submits
+images that are new or previously failed, so a crash at image 30,000 costs at most the last
+unflushed batch; skipped images are reported with their stored result.
+
+Writes are buffered and flushed in one transaction every `flush_every` records or `flush_secs`
+seconds (WAL + synchronous=NORMAL), so the store stays off the critical path at high concurrency.
+
+Usage:
+    with RunStore(Path("garment_run.sqlite"), model=MODEL, prompt_hash=PROMPT_HASH) as store:
+        todo = store.pending(paths, on_skip=lambda path, result: print(path, result))
+        ...
+        store.record(path, "ok", result=parsed.model_dump_json())
+"""
+from __future__ import annotations
+
+import os
+import sqlite3
+import time
+from pathlib import Path
+from typing import Callable, Iterable, Iterator
+
+CHECKPOINT_DB = Path(os.environ["GARMENT_CHECKPOINT_DB"]) if os.getenv("GARMENT_CHECKPOINT_DB") else None   # opt-in
+
+
+class RunStore:
+    """Append-mostly status table with batched commits, scoped to one (model, prompt hash)."""
+
+    def __init__(
+        self,
+        path: Path,
+        model: str = "",
+        prompt_hash: str = "",
+        flush_every: int = 500,
+        flush_secs: float = 2.0,
+    ):
+        self.namespace = (model, prompt_hash)
+        self.flush_every = flush_every
+        self.flush_secs = flush_secs
+        self.skipped = 0
+        self._buffer: list[tuple] = []
+        self._last_flush = time.monotonic()
+        self._db = sqlite3.connect(path)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")      # durable at each checkpoint, fsync-light per commit
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS runs ("
+            " model TEXT, prompt_hash TEXT, path TEXT, status TEXT, result TEXT, error TEXT,"
+            " attempts INTEGER DEFAULT 0, updated REAL,"
+            " PRIMARY KEY (model, prompt_hash, path))"
+        )
+        self._db.commit()
+
+    @staticmethod
+    def key(path: Path) -> str:
+        return str(path.resolve())
+
+    def completed(self) -> set[str]:
+        return {
+            row[0] for row in self._db.execute(
+                "SELECT path FROM runs WHERE model = ? AND prompt_hash = ? AND status = 'ok'", self.namespace
+            )
+        }
+
+    def result(self, path: Path) -> str | None:
+        """Stored GarmentAnalysis JSON of an image that succeeded earlier, or None."""
+        row = self._db.execute(
+            "SELECT result FROM runs WHERE model = ? AND prompt_hash = ? AND path = ? AND status = 'ok'",
+            (*self.namespace, self.key(path)),
+        ).fetchone()
+        return row[0] if row else None
+
+    def pending(
+        self, paths: Iterable[Path], on_skip: Callable[[Path, str], None] | None = None
+    ) -> Iterator[Path]:
+        """Lazily filter out images that already succeeded in an earlier run (`on_skip(path, result)` for each)."""
+        done = self.completed()
+        for path in paths:
+            if self.key(path) in done:
+                self.skipped += 1
+                if on_skip is not None:
+                    on_skip(path, self.result(path))
+            else:
+                yield path
+
+    def record(self, path: Path, status: str, result: str | None = None, error: str | None = None) -> None:
+        self._buffer.append((*self.namespace, self.key(path), status, result, error, time.time()))
+        if len(self._buffer) >= self.flush_every or time.monotonic() - self._last_flush >= self.flush_secs:
+            self.flush()
+
+    def flush(self) -> None:
+        if self._buffer:
+            with self._db:                                   # one transaction per batch
+                self._db.executemany(
+                    "INSERT INTO runs (model, prompt_hash, path, status, result, error, attempts, updated)"
+                    " VALUES (?, ?, ?, ?, ?, ?, 1, ?)"
+                    " ON CONFLICT(model, prompt_hash, path) DO UPDATE SET status = excluded.status,"
+                    " result = excluded.result, error = excluded.error, attempts = runs.attempts + 1,"
+                    " updated = excluded.updated",
+                    self._buffer,
+                )
+            self._buffer.clear()
+        self._last_flush = time.monotonic()
+
+    def counts(self) -> dict[str, int]:
+        self.flush()
+        return dict(self._db.execute(
+            "SELECT status, COUNT(*) FROM runs WHERE model = ? AND prompt_hash = ? GROUP BY status", self.namespace
+        ).fetchall())
+
+    def close(self) -> None:
+        self.flush()
+        self._db.close()
+
+    def __enter__(self) -> RunStore:
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
@@ -0,0 +1,240 @@
+"""
+scheduler.py – bounded-concurrency, rate-limited request scheduler for the vision pipeline
+
+Every request goes through three gates before it reaches the API:
+
+1. a semaphore that caps the number of in-flight requests,
+2. a requests-per-minute token bucket,
+3. a tokens-per-minute token bucket (charged with an estimate of prompt + image + completion tokens).
+
+429 / 5xx / connection errors are retried with capped exponential backoff and full jitter.
+A `Retry-After` (or `retry-after-ms`) header from the server pauses *both* buckets, so every
+worker backs off together instead of hammering the endpoint one by one.
+
+Usage:
+    scheduler = RequestScheduler(concurrency=32, rpm=500, tpm=200_000)
+    await scheduler.drain(paths, handle_one)      # handle_one awaits scheduler.run(...)
+    print(scheduler.stats.summary())
+"""
+from __future__ import annotations
+
+import asyncio
+import email.utils
+import random
+import statistics
+import time
+from dataclasses import dataclass, field
+from datetime import timezone
+from typing import AsyncIterable, Awaitable, Callable, Iterable, TypeVar
+
+from openai import APIConnectionError, APIStatusError, RateLimitError
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+# ───────────────────────────────────────── token bucket ──
+class TokenBucket:
+    """Continuously refilling token bucket; `rate_per_minute` is also the burst capacity."""
+
+    def __init__(self, rate_per_minute: float, capacity: float | None = None):
+        if rate_per_minute <= 0:
+            raise ValueError("rate_per_minute must be positive")
+        self.rate = rate_per_minute / 60.0                  # tokens per second
+        self.capacity = capacity if capacity is not None else rate_per_minute
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()                         # FIFO: callers are served in arrival order
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def pause(self, seconds: float) -> None:
+        """Stop handing out tokens for `seconds` (used to honour Retry-After)."""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    async def acquire(self, amount: float = 1.0) -> None:
+        """Wait until `amount` tokens are available and take them."""
+        amount = min(amount, self.capacity)                 # an oversized request still has to run eventually
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                self._refill(now)
+                if self._tokens >= amount:
+                    self._tokens -= amount
+                    return
+                await asyncio.sleep((amount - self._tokens) / self.rate)
+
+
+# ─────────────────────────────────────────── statistics ──
+@dataclass
+class ThroughputStats:
+    """Counters collected by the scheduler while it runs."""
+    started_at: float = field(default_factory=time.monotonic)
+    finished_at: float | None = None
+    completed: int = 0
+    failed: int = 0
+    retries: int = 0
+    rate_limited: int = 0
+    server_errors: int = 0
+    estimated_tokens: int = 0
+    latencies: list[float] = field(default_factory=list, repr=False)   # seconds per handled item
+
+    @property
+    def elapsed(self) -> float:
+        end = self.finished_at if self.finished_at is not None else time.monotonic()
+        return max(end - self.started_at, 1e-9)
+
+    @property
+    def images_per_sec(self) -> float:
+        """Sustained throughput: successful requests divided by wall-clock time."""
+        return self.completed / self.elapsed
+
+    def percentiles(self, points: tuple[int, ...] = (50, 95, 99)) -> dict[str, float]:
+        """Per-item latency percentiles in seconds (including queueing for the rate limits and retries)."""
+        if len(self.latencies) < 2:
+            return {f"p{p}": (self.latencies[0] if self.latencies else 0.0) for p in points}
+        cuts = statistics.quantiles(self.latencies, n=100, method="inclusive")
+        return {f"p{p}": cuts[p - 1] for p in points}
+
+    def summary(self) -> str:
+        pct = self.percentiles()
+        return (
+            f"{self.completed} ok, {self.failed} failed in {self.elapsed:.1f}s "
+            f"→ {self.images_per_sec:.2f} images/sec "
+            f"(p50 {pct['p50']:.2f}s, p95 {pct['p95']:.2f}s; "
+            f"{self.retries} retries: {self.rate_limited}×429, {self.server_errors}×5xx/conn)"
+        )
+
+
+# ──────────────────────────────────────────── scheduler ──
+def _retry_after_seconds(err: Exception) -> float | None:
+    """Extract the server's requested delay from `retry-after-ms` / `Retry-After`, if present."""
+    response = getattr(err, "response", None)
+    if response is None:
+        return None
+    headers = response.headers
+    if (ms := headers.get("retry-after-ms")) is not None:
+        try:
+            return float(ms) / 1000.0
+        except ValueError:
+            pass
+    if (value := headers.get("retry-after")) is not None:
+        try:
+            return float(value)
+        except ValueError:
+            pass
+        try:
+            parsed = email.utils.parsedate_to_datetime(value)   # HTTP-date form
+        except (TypeError, ValueError):                          # malformed date: fall back to backoff
+            return None
+        if parsed is not None:
+            if parsed.tzinfo is None:                            # "-0000" dates parse as naive UTC
+                parsed = parsed.replace(tzinfo=timezone.utc)
+            return max(parsed.timestamp() - time.time(), 0.0)
+    return None
+
+
+def _is_retryable(err: Exception) -> bool:
+    if isinstance(err, (RateLimitError, APIConnectionError)):
+        return True
+    return isinstance(err, APIStatusError) and err.status_code >= 500
+
+
+class RequestScheduler:
+    """Run API calls under a concurrency cap, RPM/TPM token buckets and a retry policy."""
+
+    def __init__(
+        self,
+        concurrency: int = 16,
+        rpm: float = 500,
+        tpm: float = 200_000,
+        max_retries: int = 6,
+        base_delay: float = 1.0,
+        max_delay: float = 60.0,
+    ):
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.stats = ThroughputStats()
+        self._slots = asyncio.Semaphore(concurrency)
+
+    def _backoff(self, attempt: int, retry_after: float | None) -> float:
+        """Full-jitter exponential backoff, never shorter than what the server asked for."""
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        return max(delay, retry_after or 0.0)
+
+    async def run(self, call: Callable[[], Awaitable[R]], tokens: int) -> R:
+        """Await `call()` once a slot, a request and `tokens` TPM budget are available; retry on 429/5xx."""
+        attempt = 0
+        while True:
+            await self.requests.acquire(1)
+            await self.tokens.acquire(tokens)
+            self.stats.estimated_tokens += tokens
+            async with self._slots:
+                try:
+                    return await call()
+                except Exception as err:
+                    if not _is_retryable(err) or attempt >= self.max_retries:
+                        raise
+                    error = err
+            retry_after = _retry_after_seconds(error)
+            self.stats.retries += 1
+            if isinstance(error, RateLimitError):
+                self.stats.rate_limited += 1
+                if retry_after:
+                    self.requests.pause(retry_after)
+                    self.tokens.pause(retry_after)
+            else:
+                self.stats.server_errors += 1
+            await asyncio.sleep(self._backoff(attempt, retry_after))
+            attempt += 1
+
+    async def drain(
+        self,
+        items: Iterable[T] | AsyncIterable[T],
+        handler: Callable[[T], Awaitable[bool]],
+        workers: int | None = None,
+    ) -> ThroughputStats:
+        """Feed `items` to `workers` (default `concurrency`) consumers; `handler` returns True on
+        success, False on failure.
+
+        Items are pulled lazily through a bounded queue, so 50k inputs never mean 50k pending coroutines.
+        More consumers than `concurrency` only help when several items share one request (packing).
+        """
+        workers = workers or self.concurrency
+        queue: asyncio.Queue = asyncio.Queue(maxsize=workers * 2)
+        done = object()
+
+        async def _produce() -> None:
+            if hasattr(items, "__aiter__"):
+                async for item in items:
+                    await queue.put(item)
+            else:
+                for item in items:
+                    await queue.put(item)
+            for _ in range(workers):
+                await queue.put(done)
+
+        async def _consume() -> None:
+            while (item := await queue.get()) is not done:
+                started = time.monotonic()
+                ok = await handler(item)
+                self.stats.latencies.append(time.monotonic() - started)
+                if ok:
+                    self.stats.completed += 1
+                else:
+                    self.stats.failed += 1
+
+        self.stats = ThroughputStats()
+        await asyncio.gather(_produce(), *[_consume() for _ in range(workers)])
+        self.stats.finished_at = time.monotonic()
+        return self.stats
@@ -43,13 +43,14 @@
 
 # %%
 import json
-from openai import OpenAI
 import pandas as pd
 from IPython.display import Image, display
 
+from clients import get_sync_client
+
 # %%
-# Initializing OpenAI client - see https://platform.openai.com/docs/quickstart?context=python
-client = OpenAI()
+# Initializing the shared, pooled OpenAI client (see clients.py) - see https://platform.openai.com/docs/quickstart?context=python
+client = get_sync_client("openai")
 
 # %% [markdown]
 # ## First example: Categorizing movies